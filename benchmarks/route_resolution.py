@@ -0,0 +1,62 @@
+"""
+Per-request handler-name resolution cost as the route table grows.
+
+Compares the legacy full route walk with the precompiled RouteIndex when every
+route in the table is limited, for the last declared route and for an
+unlimited path.
+
+Usage:
+    python benchmarks/route_resolution.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from response_bandwidth_limiter.route_index import RouteIndex
+from response_bandwidth_limiter.util import _find_configured_handler_name
+
+
+ROUTE_COUNTS = (10, 100, 1000, 10000)
+ITERATIONS = 1000
+
+
+async def endpoint(request):
+    return PlainTextResponse("ok")
+
+
+def build_routes(route_count: int) -> list[Route]:
+    return [Route(f"/route-{index}/{{item_id}}", endpoint=endpoint, name=f"route_{index}") for index in range(route_count)]
+
+
+def measure(func) -> float:
+    return min(timeit.repeat(func, number=ITERATIONS, repeat=3)) / ITERATIONS * 1_000_000
+
+
+def main() -> None:
+    print(f"{'routes':>8} {'legacy hit':>12} {'index hit':>12} {'legacy miss':>12} {'index miss':>12}  (us/request)")
+    for route_count in ROUTE_COUNTS:
+        routes = build_routes(route_count)
+        configured_names = {f"route_{index}" for index in range(route_count)}
+        route_index = RouteIndex(routes, configured_names)
+
+        hit_path = f"/route-{route_count - 1}/42"
+        miss_path = "/health"
+        hit_scope = {"type": "http", "path": hit_path, "method": "GET", "headers": []}
+        miss_scope = {"type": "http", "path": miss_path, "method": "GET", "headers": []}
+
+        legacy_hit = measure(lambda: _find_configured_handler_name(routes, hit_scope, hit_path, configured_names))
+        index_hit = measure(lambda: route_index.resolve(hit_scope, hit_path))
+        legacy_miss = measure(lambda: _find_configured_handler_name(routes, miss_scope, miss_path, configured_names))
+        index_miss = measure(lambda: route_index.resolve(miss_scope, miss_path))
+
+        print(f"{route_count:>8} {legacy_hit:>12.2f} {index_hit:>12.2f} {legacy_miss:>12.2f} {index_miss:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
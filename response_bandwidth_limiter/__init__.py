@@ -1,31 +1,55 @@
 from importlib import import_module
 
-from .storage import InMemoryStorage, ManagerStorage, SlidingWindowResult, Storage, StorageUnavailableError
-from .middleware import ResponseBandwidthLimiterMiddleware
+from .bloom import BloomFilterStats
+from .bypass import BypassGrant, BypassTokens
+from .interval_file import CompiledIPList, IPIntervalFile, compile_ip_list
+from .storage import InMemoryStorage, ManagerStorage, RateLimitResult, SlidingWindowResult, Storage, StorageCapacityError, StorageUnavailableError
+from .middleware import ClientIdentity, IPControlMiddleware, ResponseBandwidthLimiterMiddleware
 from .limiter import ResponseBandwidthLimiter, ScopeResolver
-from .models import Action, ActionProtocol, Delay, PolicyDecision, Reject, Rule, Throttle
+from .route_wrapper import RouteLimiterApp
+from .models import Action, ActionProtocol, Delay, PolicyDecision, Reject, Rule, RulePredicate, Throttle
+from .predicates import has_header, method_in, missing_header, query_flag
 from .shutdown import ShutdownMode
 from .util import get_endpoint_name, get_route_path
 
 __all__ = [
     "Action",
     "ActionProtocol",
+    "BanEscalation",
+    "BloomFilterStats",
+    "BypassGrant",
+    "BypassTokens",
+    "compile_ip_list",
+    "CompiledIPList",
+    "BulkBlockResult",
+    "ClientIdentity",
     "Delay",
     "get_endpoint_name",
     "get_route_path",
+    "has_header",
     "InMemoryStorage",
+    "IPControlMiddleware",
+    "IPIntervalFile",
     "IPManager",
+    "IPStatus",
     "ManagerStorage",
+    "method_in",
+    "missing_header",
     "PolicyDecision",
+    "query_flag",
+    "RateLimitResult",
     "Reject",
     "RedisStorage",
     "ResponseBandwidthLimiter",
     "ResponseBandwidthLimiterMiddleware",
+    "RouteLimiterApp",
     "Rule",
+    "RulePredicate",
     "ScopeResolver",
     "ShutdownMode",
     "SlidingWindowResult",
     "Storage",
+    "StorageCapacityError",
     "StorageUnavailableError",
     "Throttle",
 ]
@@ -45,6 +69,15 @@ def __getattr__(name: str):
     if name == "IPManager":
         return import_module(".ip_manager", __name__).IPManager
 
+    if name == "IPStatus":
+        return import_module(".ip_manager", __name__).IPStatus
+
+    if name == "BanEscalation":
+        return import_module(".ip_manager", __name__).BanEscalation
+
+    if name == "BulkBlockResult":
+        return import_module(".ip_manager", __name__).BulkBlockResult
+
     raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
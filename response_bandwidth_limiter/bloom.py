@@ -0,0 +1,100 @@
+import hashlib
+import math
+from dataclasses import dataclass
+from typing import Iterable
+
+
+@dataclass(frozen=True)
+class BloomFilterStats:
+    capacity: int
+    false_positive_rate: float
+    size_bytes: int
+    hash_count: int
+    bits_set: int
+    estimated_false_positive_rate: float
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter of strings.
+
+    A negative answer is definite; a positive answer may be a false positive.
+    Bits are numbered like Redis bitmaps (most significant bit of each byte
+    first), so the filter can be shared with SETBIT and read back with GET.
+    """
+
+    __slots__ = ("_capacity", "_false_positive_rate", "_size", "_hash_count", "_bits")
+
+    def __init__(self, capacity: int = 100000, false_positive_rate: float = 0.01):
+        if not isinstance(capacity, int) or isinstance(capacity, bool) or capacity <= 0:
+            raise ValueError("capacity must be a positive integer.")
+        if not isinstance(false_positive_rate, (int, float)) or not 0 < false_positive_rate < 1:
+            raise ValueError("false_positive_rate must be between 0 and 1.")
+        self._capacity = capacity
+        self._false_positive_rate = float(false_positive_rate)
+        self._size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self._hash_count = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def size_bits(self) -> int:
+        return self._size
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._bits)
+
+    @property
+    def hash_count(self) -> int:
+        return self._hash_count
+
+    def offsets(self, item: str) -> list[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + index * second) % self._size for index in range(self._hash_count)]
+
+    def add(self, item: str) -> None:
+        self.set_offsets(self.offsets(item))
+
+    def set_offsets(self, offsets: Iterable[int]) -> None:
+        bits = self._bits
+        for offset in offsets:
+            bits[offset >> 3] |= 0x80 >> (offset & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return self.contains_offsets(self.offsets(item))
+
+    def contains_offsets(self, offsets: Iterable[int]) -> bool:
+        bits = self._bits
+        for offset in offsets:
+            if not bits[offset >> 3] & (0x80 >> (offset & 7)):
+                return False
+        return True
+
+    def load(self, data: bytes | None) -> None:
+        """Replace the bits with a stored copy, padding or truncating it to this filter's size."""
+        size_bytes = len(self._bits)
+        data = bytes(data or b"")[:size_bytes]
+        self._bits = bytearray(data + bytes(size_bytes - len(data)))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._bits)
+
+    def bits_set(self) -> int:
+        return int.from_bytes(self._bits, "big").bit_count()
+
+    def stats(self) -> BloomFilterStats:
+        bits_set = self.bits_set()
+        return BloomFilterStats(
+            capacity=self._capacity,
+            false_positive_rate=self._false_positive_rate,
+            size_bytes=len(self._bits),
+            hash_count=self._hash_count,
+            bits_set=bits_set,
+            estimated_false_positive_rate=(bits_set / self._size) ** self._hash_count,
+        )
@@ -0,0 +1,111 @@
+import base64
+import hashlib
+import hmac
+import time
+from dataclasses import dataclass
+from typing import Callable, Mapping, Optional
+
+
+_NO_BANDWIDTH_LIMIT = "u"
+_BANDWIDTH_LIMIT = "l"
+
+
+@dataclass(frozen=True)
+class BypassGrant:
+    key_id: str
+    expires_at: int
+    lift_bandwidth: bool = False
+
+
+class BypassTokens:
+    """
+    Issue and verify HMAC-signed tokens that exempt trusted callers from limiting.
+
+    A token is "<key id>.<expiry>.<flag>.<signature>", where the signature is
+    HMAC-SHA256 over the first three fields. Verification is a local hash
+    computation, so exempted requests never touch the storage.
+
+    Keys are rotated by listing several of them: new tokens are signed with the
+    first key (or signing_key_id), and every listed key is accepted. Keep the
+    previous key until the tokens it signed have expired, then drop it.
+    """
+
+    def __init__(
+        self,
+        keys: Mapping[str, str | bytes],
+        *,
+        header: str = "x-ratelimit-bypass",
+        signing_key_id: Optional[str] = None,
+        max_ttl: Optional[int] = 86400,
+        time_provider: Optional[Callable[[], float]] = None,
+    ):
+        if not keys:
+            raise ValueError("keys must contain at least one signing key.")
+        self._keys: dict[str, bytes] = {}
+        for key_id, secret in keys.items():
+            if not isinstance(key_id, str) or not key_id or "." in key_id:
+                raise ValueError("key ids must be non-empty strings without '.'.")
+            if isinstance(secret, str):
+                secret = secret.encode("utf-8")
+            if not isinstance(secret, bytes) or not secret:
+                raise ValueError("keys must map key ids to non-empty secrets.")
+            self._keys[key_id] = secret
+        if signing_key_id is None:
+            signing_key_id = next(iter(self._keys))
+        if signing_key_id not in self._keys:
+            raise ValueError("signing_key_id must be one of the configured keys.")
+        if not isinstance(header, str) or not header.strip():
+            raise ValueError("header must be a non-empty string.")
+        if max_ttl is not None and (not isinstance(max_ttl, int) or isinstance(max_ttl, bool) or max_ttl <= 0):
+            raise ValueError("max_ttl must be a positive integer or None.")
+        self._signing_key_id = signing_key_id
+        self._header_name = header.strip().lower().encode("latin-1")
+        self._max_ttl = max_ttl
+        self._time_provider = time_provider or time.time
+
+    @property
+    def header_name(self) -> bytes:
+        return self._header_name
+
+    def issue(self, ttl: int = 300, *, lift_bandwidth: bool = False, key_id: Optional[str] = None) -> str:
+        """Return a token valid for ttl seconds, signed with key_id or the signing key."""
+        if not isinstance(ttl, int) or isinstance(ttl, bool) or ttl <= 0:
+            raise ValueError("ttl must be a positive integer.")
+        if self._max_ttl is not None and ttl > self._max_ttl:
+            raise ValueError("ttl must not exceed max_ttl.")
+        key_id = self._signing_key_id if key_id is None else key_id
+        if key_id not in self._keys:
+            raise ValueError("key_id must be one of the configured keys.")
+        expires_at = int(self._time_provider()) + ttl
+        flag = _NO_BANDWIDTH_LIMIT if lift_bandwidth else _BANDWIDTH_LIMIT
+        payload = f"{key_id}.{expires_at}.{flag}"
+        return f"{payload}.{self._sign(self._keys[key_id], payload)}"
+
+    def verify(self, token: str) -> Optional[BypassGrant]:
+        """Return the grant carried by a valid, unexpired token, or None."""
+        payload, separator, signature = token.strip().rpartition(".")
+        if not separator:
+            return None
+        fields = payload.split(".")
+        if len(fields) != 3:
+            return None
+        key_id, raw_expiry, flag = fields
+        secret = self._keys.get(key_id)
+        if secret is None or flag not in (_NO_BANDWIDTH_LIMIT, _BANDWIDTH_LIMIT) or not (raw_expiry.isascii() and raw_expiry.isdigit()):
+            return None
+        if not hmac.compare_digest(self._sign(secret, payload).encode("ascii"), signature.encode("utf-8")):
+            return None
+
+        expires_at = int(raw_expiry)
+        remaining = expires_at - self._time_provider()
+        if remaining <= 0:
+            return None
+        # Reject tokens whose lifetime exceeds the current policy, e.g. after max_ttl was lowered.
+        if self._max_ttl is not None and remaining > self._max_ttl:
+            return None
+        return BypassGrant(key_id=key_id, expires_at=expires_at, lift_bandwidth=flag == _NO_BANDWIDTH_LIMIT)
+
+    @staticmethod
+    def _sign(secret: bytes, payload: str) -> str:
+        digest = hmac.new(secret, payload.encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
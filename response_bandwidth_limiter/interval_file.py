@@ -0,0 +1,186 @@
+import mmap
+import os
+import re
+import struct
+import tempfile
+from dataclasses import dataclass
+from ipaddress import IPv4Address, ip_address, ip_network
+from typing import Iterable, Iterator
+
+from .network_trie import IPAddress
+
+
+_MAGIC = b"RBLIPL1\x00"
+_HEADER = struct.Struct(">8sQ")
+_RECORD_SIZE = 32
+_ADDRESS_SIZE = 16
+# IPv4 addresses are stored in the IPv4-mapped IPv6 range so both families share one sorted file.
+_IPV4_MAPPED_BASE = 0xFFFF << 32
+_LIST_SEPARATORS = re.compile(r"[\s,;]")
+
+
+@dataclass(frozen=True)
+class CompiledIPList:
+    path: str
+    entries: int
+    intervals: int
+    invalid: int
+
+
+def compile_ip_list(entries: Iterable[str], path: str | os.PathLike[str]) -> CompiledIPList:
+    """
+    Compile addresses and CIDR networks into a sorted binary interval file.
+
+    Entries may be raw lines of a plain-text or CSV feed: the first column is
+    used, and blank lines and lines starting with "#" or ";" are skipped.
+    Overlapping and adjacent ranges are merged. The file is written next to
+    its destination and renamed into place, so readers never see a partial file.
+    On Windows the rename fails with PermissionError while an IPIntervalFile
+    has the destination mapped.
+    """
+    processed = invalid = 0
+    ranges: list[tuple[int, int]] = []
+    for entry in _iter_list_entries(entries):
+        processed += 1
+        try:
+            ranges.append(_entry_range(entry))
+        except ValueError:
+            invalid += 1
+
+    ranges.sort()
+    merged: list[tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+            continue
+        merged.append((start, end))
+
+    target = os.fspath(path)
+    directory = os.path.dirname(os.path.abspath(target))
+    descriptor, temporary_path = tempfile.mkstemp(prefix=".iplist-", dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as output:
+            output.write(_HEADER.pack(_MAGIC, len(merged)))
+            for start, end in merged:
+                output.write(start.to_bytes(_ADDRESS_SIZE, "big"))
+                output.write(end.to_bytes(_ADDRESS_SIZE, "big"))
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(temporary_path, target)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+        raise
+    return CompiledIPList(path=target, entries=processed, intervals=len(merged), invalid=invalid)
+
+
+class IPIntervalFile:
+    """
+    Read-only view of a file written by compile_ip_list().
+
+    The file is memory-mapped and binary-searched in place, so every worker on
+    a host shares one copy through the page cache. refresh() reopens the file
+    after it has been replaced. Windows does not allow replacing a mapped file,
+    so there a new list needs a new path.
+    """
+
+    def __init__(self, path: str | os.PathLike[str]):
+        self._path = os.fspath(path)
+        self._mapping: mmap.mmap | None = None
+        self._count = 0
+        self._identity: tuple[int, int, int] | None = None
+        self._open()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, address: IPAddress | str) -> bool:
+        mapping = self._mapping
+        if mapping is None:
+            return False
+        if isinstance(address, str):
+            address = ip_address(address)
+        key = _address_value(address).to_bytes(_ADDRESS_SIZE, "big")
+
+        # Find the last interval whose start is <= the address.
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            offset = _HEADER.size + middle * _RECORD_SIZE
+            if mapping[offset:offset + _ADDRESS_SIZE] <= key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == 0:
+            return False
+        offset = _HEADER.size + (low - 1) * _RECORD_SIZE + _ADDRESS_SIZE
+        return key <= mapping[offset:offset + _ADDRESS_SIZE]
+
+    def refresh(self) -> bool:
+        """Reopen the file if it was replaced. Returns True when a new file was loaded."""
+        try:
+            identity = _file_identity(os.stat(self._path))
+        except FileNotFoundError:
+            return False
+        if identity == self._identity:
+            return False
+        self._open()
+        return True
+
+    def close(self) -> None:
+        if self._mapping is not None:
+            self._mapping.close()
+            self._mapping = None
+        self._count = 0
+
+    def _open(self) -> None:
+        with open(self._path, "rb") as source:
+            identity = _file_identity(os.fstat(source.fileno()))
+            size = identity[2]
+            if size < _HEADER.size:
+                raise ValueError(f"{self._path} is not a compiled IP list.")
+            mapping = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = _HEADER.unpack_from(mapping, 0)
+        if magic != _MAGIC or size != _HEADER.size + count * _RECORD_SIZE:
+            mapping.close()
+            raise ValueError(f"{self._path} is not a compiled IP list.")
+
+        previous = self._mapping
+        self._mapping = mapping
+        self._count = count
+        self._identity = identity
+        if previous is not None:
+            previous.close()
+
+
+def _iter_list_entries(lines: Iterable[str]) -> Iterator[str]:
+    for line in lines:
+        text = line.strip() if isinstance(line, str) else ""
+        if not text or text.startswith(("#", ";")):
+            continue
+        yield _LIST_SEPARATORS.split(text, maxsplit=1)[0].strip("\"'")
+
+
+def _entry_range(entry: str) -> tuple[int, int]:
+    if "/" in entry:
+        network = ip_network(entry, strict=False)
+        start = _address_value(network.network_address)
+        return start, start + network.num_addresses - 1
+    value = _address_value(ip_address(entry))
+    return value, value
+
+
+def _address_value(address: IPAddress) -> int:
+    if isinstance(address, IPv4Address):
+        return _IPV4_MAPPED_BASE | int(address)
+    return int(address)
+
+
+def _file_identity(stat_result: os.stat_result) -> tuple[int, int, int]:
+    return stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size
@@ -1,42 +1,874 @@
-from ipaddress import ip_address
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from ipaddress import IPv4Address, IPv6Address, ip_address, ip_network
+from typing import Any, Callable, Iterable, Literal
 
+from .bloom import BloomFilter, BloomFilterStats
+from .interval_file import IPIntervalFile, _iter_list_entries
+from .network_trie import IPAddress, NetworkTrie
 from .storage import Storage
 
 
+_CONTROL_ACTIVE_KEY = "ip:control:active"
+_NETWORKS_VERSION_KEY = "ip:networks:version"
+# ネットワークごとに 1 フィールドを持つマップ。並行する更新が互いを上書きしない
+_NETWORK_LIST_KEYS = {"block": "ip:networks:block:entries", "allow": "ip:networks:allow:entries"}
+# 以前のバージョンが一覧全体を 1 つの JSON として保存していたキー
+_LEGACY_NETWORK_LIST_KEYS = {"block": "ip:networks:block", "allow": "ip:networks:allow"}
+# 一括登録後に、すべてのアドレスのキャッシュを破棄させる無効化キー
+_ALL_BLOCKS_KEY = "ip:block:*"
+_FILTER_VERSION_KEY = "ip:filter:version"
+_FILTER_REBUILD_BATCH_SIZE = 10000
+# フラグがない場合に、以前のバージョンや他のクライアントが書いたエントリを探すプレフィックス
+_CONTROL_ENTRY_PREFIXES = ("ip:block:", "ip:allow:", "ip:networks:")
+# ban_escalation の回数は制御データではなくカウンタとして扱うため、ip: の外に置く。
+# InMemoryStorage では上限に達すると通常のキーと同じく退避される
+_REJECTIONS_KEY_PREFIX = "escalation:rejections:"
+_BAN_LEVEL_KEY_PREFIX = "escalation:bans:"
+
+NetworkListKind = Literal["block", "allow"]
+
+
+@dataclass(frozen=True)
+class IPStatus:
+    blocked: bool = False
+    allowed: bool = False
+
+
+@dataclass(frozen=True)
+class BulkBlockResult:
+    """block_ips() と import_blocklist() の進捗と結果"""
+
+    processed: int = 0
+    blocked: int = 0
+    networks: int = 0
+    invalid: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """1 秒あたりに処理したエントリ数"""
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+
+BulkProgressCallback = Callable[[BulkBlockResult], None]
+
+
+@dataclass(frozen=True)
+class BanEscalation:
+    """
+    Reject され続けるクライアントを自動で一時ブロックする設定
+
+    rejections 回目の Reject で block_ip() し、ブロックのたびに期間を multiplier 倍に延ばす。
+
+    Attributes:
+        rejections: ブロックするまでの Reject の回数
+        window: Reject の回数を保持する秒数。Reject のたびに延長する
+        base_duration: 最初のブロックの秒数
+        multiplier: ブロックを繰り返すたびに期間に掛ける倍率
+        max_duration: ブロックの秒数の上限
+        reset_after: この秒数ブロックされなければ、次のブロックを base_duration に戻す
+    """
+
+    rejections: int = 10
+    window: int = 60
+    base_duration: int = 60
+    multiplier: float = 2.0
+    max_duration: int = 86400
+    reset_after: int = 86400
+
+    def __post_init__(self) -> None:
+        for name in ("rejections", "window", "base_duration", "max_duration", "reset_after"):
+            value = getattr(self, name)
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise TypeError(f"{name} must be an integer.")
+            if value <= 0:
+                raise ValueError(f"{name} must be greater than 0.")
+        if not isinstance(self.multiplier, (int, float)) or isinstance(self.multiplier, bool):
+            raise TypeError("multiplier must be a number.")
+        if self.multiplier < 1:
+            raise ValueError("multiplier must be 1 or greater.")
+        if self.max_duration < self.base_duration:
+            raise ValueError("max_duration must be greater than or equal to base_duration.")
+
+    def ban_duration(self, level: int) -> int:
+        """level 回目のブロックの秒数を返す"""
+        duration = float(self.base_duration)
+        for _ in range(level - 1):
+            duration *= self.multiplier
+            if duration >= self.max_duration:
+                return self.max_duration
+        return math.ceil(duration)
+
+
 class IPManager:
-    def __init__(self, storage: Storage):
+    def __init__(
+        self,
+        storage: Storage,
+        *,
+        control_refresh_interval: float = 1.0,
+        status_cache_size: int = 10000,
+        status_cache_ttl: float = 5.0,
+        blocklist_filter: bool = False,
+        filter_capacity: int = 100000,
+        filter_false_positive_rate: float = 0.01,
+        block_list_file: str | os.PathLike[str] | None = None,
+        allow_list_file: str | os.PathLike[str] | None = None,
+        ipv4_prefix: int = 32,
+        ipv6_prefix: int = 128,
+        ban_escalation: BanEscalation | None = None,
+        time_provider: Callable[[], float] | None = None,
+    ):
+        """
+        Args:
+            storage: block / allow エントリを保存するストレージ
+            control_refresh_interval: 共有ストレージ上のフラグと版数を確認する間隔 (秒)
+            status_cache_size: get_status() の結果をプロセス内に保持する IP 数の上限。0 で無効
+            status_cache_ttl: キャッシュした結果を使う最大秒数。
+                ストレージが無効化の通知を届けられる場合だけキャッシュする
+            blocklist_filter: True の場合、block / allow 済みのアドレスを Bloom フィルターで管理し、
+                どちらにも含まれないと判定できたアドレスはストレージを読まない
+            filter_capacity: フィルターごとに想定するアドレス数
+            filter_false_positive_rate: filter_capacity 件を登録したときの偽陽性率
+            block_list_file: compile_ip_list() で作成したブロック用のリストファイル
+            allow_list_file: compile_ip_list() で作成した許可用のリストファイル。
+                どちらも mmap で開き、ファイルが置き換えられると control_refresh_interval 秒以内に開き直す
+            ipv4_prefix: IPv4 クライアントをまとめるプレフィックス長。block / allow のキーと、
+                limiter の "ip" / "default" scope のカウンターに使う
+            ipv6_prefix: IPv6 クライアントをまとめるプレフィックス長。
+                64 を指定すると /64 内のアドレスを 1 つのクライアントとして扱う
+            ban_escalation: Reject され続けるクライアントを自動でブロックする設定。
+                回数とブロックの段階はストレージに保存し、全ワーカーで共有する
+            time_provider: 時刻の取得に使う関数。省略時は time.monotonic
+        """
+        if not isinstance(control_refresh_interval, (int, float)):
+            raise TypeError("control_refresh_interval must be a number.")
+        if control_refresh_interval < 0:
+            raise ValueError("control_refresh_interval must be 0 or greater.")
+        if not isinstance(status_cache_size, int) or isinstance(status_cache_size, bool):
+            raise TypeError("status_cache_size must be an integer.")
+        if status_cache_size < 0:
+            raise ValueError("status_cache_size must be 0 or greater.")
+        if not isinstance(status_cache_ttl, (int, float)):
+            raise TypeError("status_cache_ttl must be a number.")
+        if status_cache_ttl < 0:
+            raise ValueError("status_cache_ttl must be 0 or greater.")
+        self._prefix_lengths = {
+            4: _validate_prefix_length("ipv4_prefix", ipv4_prefix, 32),
+            6: _validate_prefix_length("ipv6_prefix", ipv6_prefix, 128),
+        }
+        self._aggregates_addresses = ipv4_prefix < 32 or ipv6_prefix < 128
+        if ban_escalation is not None and not isinstance(ban_escalation, BanEscalation):
+            raise TypeError("ban_escalation must be a BanEscalation.")
+        self._ban_escalation = ban_escalation
         self._storage = storage
+        self._control_refresh_interval = float(control_refresh_interval)
+        self._status_cache_size = status_cache_size
+        self._status_cache_ttl = float(status_cache_ttl)
+        self._time_provider = time_provider or time.monotonic
+        self._control_active = False
+        self._control_checked_until: float | None = None
+        self._control_backfilled = False
+        self._networks: dict[str, dict[str, float | None]] = {kind: {} for kind in _NETWORK_LIST_KEYS}
+        self._network_tries: dict[str, NetworkTrie[float]] = {kind: NetworkTrie() for kind in _NETWORK_LIST_KEYS}
+        self._networks_version = 0
+        self._networks_checked_until: float | None = None
+        self._legacy_networks_migrated: set[str] = set()
+        self._status_cache: OrderedDict[str, tuple[bool, bool, float]] = OrderedDict()
+        self._status_cache_lock = threading.Lock()
+        self._status_cache_generation = 0
+        self._invalidations_active = False
+        self._subscribe_retry_at: float | None = None
+        self._filters: dict[str, BloomFilter] | None = None
+        if blocklist_filter:
+            self._filters = {
+                kind: BloomFilter(filter_capacity, filter_false_positive_rate) for kind in _NETWORK_LIST_KEYS
+            }
+        self._filter_version: int | None = None
+        # フィルターはストレージ上のエントリから作り直すまで信用せず、ストレージを読む
+        self._filter_rebuild_due = self._filters is not None
+        self._filter_trusted = False
+        self._list_files: dict[str, IPIntervalFile] = {}
+        for kind, list_path in (("block", block_list_file), ("allow", allow_list_file)):
+            if list_path is not None:
+                self._list_files[kind] = IPIntervalFile(list_path)
+        self._list_files_checked_until: float | None = None
+        if self._list_files:
+            # リストファイルはストレージ上のフラグに関係なく常に確認する
+            self._control_active = True
 
     @property
     def storage(self) -> Storage:
         return self._storage
 
-    async def block_ip(self, ip: str, duration: int | None = None) -> None:
-        normalized_ip = self._normalize_ip(ip)
-        await self._storage.set(f"ip:block:{normalized_ip}", "1", expire=duration)
+    @property
+    def ban_escalation(self) -> BanEscalation | None:
+        return self._ban_escalation
+
+    async def has_control_entries(self) -> bool:
+        """
+        block / allow エントリが一度でも登録されたかを返す
+
+        共有ストレージ上のフラグをワーカーごとに最大 control_refresh_interval 秒キャッシュする。
+        一度 True になった後は、このプロセスでは常に通常の IP チェックを行う。
+        フラグがない場合は、プロセスごとに最初の 1 回だけ Storage.scan_keys() で既存のエントリを探し、
+        見つかればフラグを書き込む。フラグより前のバージョンや他のクライアントが書いたエントリも、
+        これでアップグレード後に確実に適用される。
+        """
+        if self._control_active:
+            return True
+
+        now = self._time_provider()
+        if self._control_checked_until is not None and now < self._control_checked_until:
+            return False
+
+        await self._ensure_invalidation_listener(now)
+        active = await self._storage.get(_CONTROL_ACTIVE_KEY) is not None
+        if not active and not self._control_backfilled:
+            active = await self._backfill_control_flag()
+            self._control_backfilled = True
+        self._control_active = active
+        self._control_checked_until = now + self._shared_refresh_interval()
+        return active
+
+    def address_key(self, ip: str | IPAddress) -> str:
+        """
+        block / allow エントリとカウンターで IP アドレスを表す文字列を返す
+
+        ipv4_prefix / ipv6_prefix でまとめる場合は "2001:db8::/64" のようなネットワーク表記になる。
+        """
+        return self._address_key(self._parse_ip(ip))
+
+    async def block_ip(self, ip: str | IPAddress, duration: int | None = None) -> None:
+        address_key = self.address_key(ip)
+        key = f"ip:block:{address_key}"
+        await self._storage.set(key, self._block_value(duration), expire=duration)
+        await self._record_in_filter("block", [address_key])
+        await self._publish_change(key)
+        await self._mark_control_active()
 
     async def unblock_ip(self, ip: str) -> None:
-        normalized_ip = self._normalize_ip(ip)
-        await self._storage.delete(f"ip:block:{normalized_ip}")
+        key = f"ip:block:{self.address_key(ip)}"
+        await self._storage.delete(key)
+        await self._publish_change(key)
 
     async def is_blocked(self, ip: str) -> bool:
-        normalized_ip = self._normalize_ip(ip)
-        return await self._storage.get(f"ip:block:{normalized_ip}") is not None
+        address = self._parse_ip(ip)
+        if not await self._filter_excludes("block", address):
+            if await self._storage.get(f"ip:block:{self._address_key(address)}") is not None:
+                return True
+        return await self._network_contains("block", address)
 
     async def allow_ip(self, ip: str) -> None:
-        normalized_ip = self._normalize_ip(ip)
-        await self._storage.set(f"ip:allow:{normalized_ip}", "1")
+        address_key = self.address_key(ip)
+        key = f"ip:allow:{address_key}"
+        await self._storage.set(key, "1")
+        await self._record_in_filter("allow", [address_key])
+        await self._publish_change(key)
+        await self._mark_control_active()
 
     async def remove_allow(self, ip: str) -> None:
-        normalized_ip = self._normalize_ip(ip)
-        await self._storage.delete(f"ip:allow:{normalized_ip}")
+        key = f"ip:allow:{self.address_key(ip)}"
+        await self._storage.delete(key)
+        await self._publish_change(key)
 
     async def is_allowed(self, ip: str) -> bool:
-        normalized_ip = self._normalize_ip(ip)
-        return await self._storage.get(f"ip:allow:{normalized_ip}") is not None
+        address = self._parse_ip(ip)
+        if not await self._filter_excludes("allow", address):
+            if await self._storage.get(f"ip:allow:{self._address_key(address)}") is not None:
+                return True
+        return await self._network_contains("allow", address)
+
+    async def record_rejection(self, ip: str | IPAddress) -> int | None:
+        """
+        クライアントへの Reject を数え、ban_escalation の回数に達したらブロックする
+
+        回数は Storage.incr() で数えるため、複数のワーカーが同時に数えても
+        ちょうど rejections 回目になった 1 つのワーカーだけがブロックする。
+
+        Returns:
+            ブロックした場合はその秒数。それ以外は None
+        """
+        escalation = self._ban_escalation
+        if escalation is None:
+            return None
+        address_key = self.address_key(ip)
+        rejections_key = f"{_REJECTIONS_KEY_PREFIX}{address_key}"
+        rejections = await self._storage.incr(rejections_key, expire=escalation.window)
+        if rejections != escalation.rejections:
+            return None
+
+        level = await self._storage.incr(f"{_BAN_LEVEL_KEY_PREFIX}{address_key}", expire=escalation.reset_after)
+        duration = escalation.ban_duration(level)
+        await self._storage.delete(rejections_key)
+        await self.block_ip(ip, duration=duration)
+        return duration
+
+    async def block_ips(
+        self,
+        ips: Iterable[str],
+        duration: int | None = None,
+        *,
+        batch_size: int = 1000,
+        progress: BulkProgressCallback | None = None,
+    ) -> BulkBlockResult:
+        """
+        多数の IP アドレスをまとめてブロックする
+
+        入力は先頭から順に読み、batch_size 件ごとに Storage.set_many() で書き込む。
+        IP アドレスとして解釈できないエントリは例外にせず invalid として数える。
+
+        Args:
+            ips: IP アドレスの iterable。ジェネレーターも使える
+            duration: ブロックする秒数。省略時は無期限
+            batch_size: 1 回の書き込みにまとめるアドレス数
+            progress: バッチを書き込むたびに途中経過の BulkBlockResult で呼ばれる関数
+        """
+        return await self._block_entries(ips, duration, batch_size, progress, accept_networks=False)
+
+    async def import_blocklist(
+        self,
+        path: str | os.PathLike[str],
+        duration: int | None = None,
+        *,
+        batch_size: int = 1000,
+        progress: BulkProgressCallback | None = None,
+        encoding: str = "utf-8",
+    ) -> BulkBlockResult:
+        """
+        テキストまたは CSV のブロックリストを読み込んでブロックする
+
+        各行の最初の列を使い、空行と "#" または ";" で始まる行は読み飛ばす。
+        CIDR 表記の行はネットワークとして、最後にまとめてネットワーク一覧に追加する。
+        """
+        with open(path, encoding=encoding, newline="") as blocklist:
+            return await self._block_entries(
+                _iter_list_entries(blocklist),
+                duration,
+                batch_size,
+                progress,
+                accept_networks=True,
+            )
+
+    async def block_network(self, network: str, duration: int | None = None) -> None:
+        """
+        "203.0.113.0/24" のようなネットワーク単位でブロックする
+
+        Args:
+            network: IPv4 または IPv6 の CIDR 表記
+            duration: ブロックする秒数。省略時は無期限
+        """
+        _validate_duration(duration)
+        await self._update_network_list("block", [network], duration=duration)
+        await self._mark_control_active()
+
+    async def unblock_network(self, network: str) -> None:
+        await self._update_network_list("block", [network], remove=True)
+
+    async def allow_network(self, network: str) -> None:
+        await self._update_network_list("allow", [network])
+        await self._mark_control_active()
+
+    async def remove_allow_network(self, network: str) -> None:
+        await self._update_network_list("allow", [network], remove=True)
+
+    async def blocked_networks(self) -> list[str]:
+        await self._refresh_networks()
+        return self._active_networks("block")
+
+    async def allowed_networks(self) -> list[str]:
+        await self._refresh_networks()
+        return self._active_networks("allow")
+
+    async def get_status(self, ip: str | IPAddress) -> IPStatus:
+        """
+        ブロック状態と許可状態を 1 回のストレージ読み取りでまとめて返す
+
+        ネットワーク一覧の版数の確認が必要な場合も、同じ読み取りに含める。
+        ストレージが無効化の通知を届けられる場合、単一アドレスの結果は
+        status_cache_ttl 秒までプロセス内にキャッシュし、ストレージを読まずに返す。
+        """
+        address = self._parse_ip(ip)
+        address_key = self._address_key(address)
+        now = self._time_provider()
+        await self._ensure_invalidation_listener(now)
+        if self._filters is not None:
+            await self._refresh_networks()
+            if self._filter_trusted and self._filter_version is not None and not self._filter_may_contain(address_key):
+                return IPStatus(
+                    blocked=self._match_local("block", address, now),
+                    allowed=self._match_local("allow", address, now),
+                )
+
+        cached = self._get_cached_status(address_key, now)
+        if cached is not None:
+            await self._refresh_networks()
+            blocked, allowed = cached
+        else:
+            keys = [f"ip:block:{address_key}", f"ip:allow:{address_key}"]
+            check_networks = self._networks_check_due(now)
+            if check_networks:
+                keys.extend(self._version_keys())
+
+            generation = self._status_cache_generation
+            values = await self._storage.get_many(keys)
+            if check_networks:
+                await self._apply_versions(values[2:], now)
+            blocked = values[0] is not None
+            allowed = values[1] is not None
+            ttl = self._status_cache_ttl
+            block_expires_at = self._block_expires_at(values[0])
+            if block_expires_at is not None:
+                # 期限付きのブロックは、期限を過ぎてキャッシュに残らないようにする
+                ttl = min(ttl, block_expires_at - time.time())
+            self._store_cached_status(address_key, blocked, allowed, now, generation, ttl)
+
+        return IPStatus(
+            blocked=blocked or self._match_local("block", address, now),
+            allowed=allowed or self._match_local("allow", address, now),
+        )
+
+    async def warm_up(self) -> None:
+        """blocklist_filter が有効な場合、最初のリクエストより前にフィルターを作り直す"""
+        await self._rebuild_filters()
+
+    def close(self) -> None:
+        """mmap したリストファイルを閉じる"""
+        for list_file in self._list_files.values():
+            list_file.close()
+
+    def filter_stats(self) -> dict[str, BloomFilterStats]:
+        """block / allow それぞれの Bloom フィルターの統計を返す。無効な場合は空の dict"""
+        if self._filters is None:
+            return {}
+        return {kind: bloom.stats() for kind, bloom in self._filters.items()}
+
+    def clear_status_cache(self) -> None:
+        """get_status() がキャッシュした単一アドレスの結果を破棄する"""
+        with self._status_cache_lock:
+            self._status_cache_generation += 1
+            self._status_cache.clear()
+
+    async def _block_entries(
+        self,
+        entries: Iterable[str],
+        duration: int | None,
+        batch_size: int,
+        progress: BulkProgressCallback | None,
+        *,
+        accept_networks: bool,
+    ) -> BulkBlockResult:
+        _validate_duration(duration)
+        if not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size <= 0:
+            raise ValueError("batch_size must be a positive integer.")
 
-    def _normalize_ip(self, ip: str) -> str:
+        started = time.perf_counter()
+        processed = blocked = invalid = 0
+        batch: dict[str, str] = {}
+        networks: list[str] = []
+
+        def snapshot() -> BulkBlockResult:
+            return BulkBlockResult(processed, blocked, len(networks), invalid, time.perf_counter() - started)
+
+        for entry in entries:
+            processed += 1
+            text = entry.strip() if isinstance(entry, str) else ""
+            try:
+                if accept_networks and "/" in text:
+                    networks.append(self._normalize_network(text))
+                    continue
+                batch[f"ip:block:{self.address_key(text)}"] = "1"
+            except ValueError:
+                invalid += 1
+                continue
+
+            if len(batch) >= batch_size:
+                await self._write_block_batch(batch, duration)
+                blocked += len(batch)
+                batch = {}
+                if progress is not None:
+                    progress(snapshot())
+
+        if batch:
+            await self._write_block_batch(batch, duration)
+            blocked += len(batch)
+        if networks:
+            await self._update_network_list("block", networks, duration=duration)
+        if blocked:
+            await self._publish_change(_ALL_BLOCKS_KEY)
+        if blocked or networks:
+            await self._mark_control_active()
+
+        result = snapshot()
+        if progress is not None:
+            progress(result)
+        return result
+
+    async def _write_block_batch(self, batch: dict[str, str], duration: int | None) -> None:
+        await self._storage.set_many(dict.fromkeys(batch, self._block_value(duration)), expire=duration)
+        await self._record_in_filter("block", [key.split(":", 2)[2] for key in batch])
+
+    async def _record_in_filter(self, kind: NetworkListKind, addresses: Iterable[str]) -> None:
+        """
+        アドレスをローカルと共有ストレージ上の Bloom フィルターに追加する
+
+        共有側のビットを立ててから版数を進めるため、他のワーカーは次の版数確認で読み直す。
+        """
+        if self._filters is None:
+            return
+        bloom = self._filters[kind]
+        offsets: set[int] = set()
+        for address in addresses:
+            offsets.update(bloom.offsets(address))
+        bloom.set_offsets(offsets)
+        await self._storage.set_bits(self._filter_key(kind, bloom), sorted(offsets))
+        await self._storage.incr(_FILTER_VERSION_KEY)
+
+    async def _rebuild_filters(self) -> None:
+        """
+        ストレージ上の block / allow エントリをプロセスごとに一度だけフィルターに追加する
+
+        blocklist_filter を有効にしていない書き込み元や以前のバージョンが書いたエントリも
+        フィルターに含めるため。作り直しが終わるまでと、キーを列挙できないストレージでは
+        フィルターを使わずにストレージを読む。
+        """
+        if not self._filter_rebuild_due:
+            return
+        self._filter_rebuild_due = False
+        try:
+            for kind in _NETWORK_LIST_KEYS:
+                addresses: list[str] = []
+                async for key in self._storage.scan_keys(f"ip:{kind}:"):
+                    addresses.append(key.split(":", 2)[2])
+                    if len(addresses) >= _FILTER_REBUILD_BATCH_SIZE:
+                        await self._record_in_filter(kind, addresses)
+                        addresses = []
+                if addresses:
+                    await self._record_in_filter(kind, addresses)
+        except NotImplementedError:
+            return
+        except Exception:
+            self._filter_rebuild_due = True
+            raise
+        self._filter_trusted = True
+
+    async def _filter_excludes(self, kind: NetworkListKind, address: IPAddress) -> bool:
+        if self._filters is None:
+            return False
+        await self._refresh_networks()
+        return (
+            self._filter_trusted
+            and self._filter_version is not None
+            and self._address_key(address) not in self._filters[kind]
+        )
+
+    def _filter_may_contain(self, address: str) -> bool:
+        if self._filters is None:
+            return True
+        # 両方のフィルターは同じ大きさとハッシュ数なので、オフセットの計算は 1 回で済む
+        block_filter = self._filters["block"]
+        offsets = block_filter.offsets(address)
+        return block_filter.contains_offsets(offsets) or self._filters["allow"].contains_offsets(offsets)
+
+    def _filter_key(self, kind: NetworkListKind, bloom: BloomFilter) -> str:
+        # 大きさやハッシュ数の異なる設定のワーカーが同じビットマップを共有しないよう、キーに含める
+        return f"ip:filter:{kind}:{bloom.size_bits}:{bloom.hash_count}"
+
+    async def _ensure_invalidation_listener(self, now: float) -> None:
+        if self._invalidations_active or self._status_cache_size == 0:
+            return
+        if self._subscribe_retry_at is not None and now < self._subscribe_retry_at:
+            return
+        self._subscribe_retry_at = now + self._control_refresh_interval
+        self._invalidations_active = await self._storage.subscribe_invalidations(self._on_invalidation)
+
+    def _get_cached_status(self, address: str, now: float) -> tuple[bool, bool] | None:
+        if not self._invalidations_active:
+            return None
+        with self._status_cache_lock:
+            entry = self._status_cache.get(address)
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                del self._status_cache[address]
+                return None
+            self._status_cache.move_to_end(address)
+            return entry[0], entry[1]
+
+    def _store_cached_status(
+        self,
+        address: str,
+        blocked: bool,
+        allowed: bool,
+        now: float,
+        generation: int,
+        ttl: float,
+    ) -> None:
+        if not self._invalidations_active or ttl <= 0:
+            return
+        with self._status_cache_lock:
+            # 読み取り中に無効化が届いた場合は、古い可能性がある結果をキャッシュしない
+            if generation != self._status_cache_generation:
+                return
+            self._status_cache[address] = (blocked, allowed, now + ttl)
+            self._status_cache.move_to_end(address)
+            while len(self._status_cache) > self._status_cache_size:
+                self._status_cache.popitem(last=False)
+
+    def _on_invalidation(self, key: str | None) -> None:
+        if key is None:
+            # 通知が届かなくなったため、キャッシュを捨てて次回の読み取りで購読し直す
+            self._invalidations_active = False
+            self._subscribe_retry_at = None
+            self._networks_checked_until = None
+            self._control_checked_until = None
+            self.clear_status_cache()
+            return
+
+        with self._status_cache_lock:
+            self._status_cache_generation += 1
+            if key == _ALL_BLOCKS_KEY:
+                self._status_cache.clear()
+            elif key.startswith(("ip:block:", "ip:allow:")):
+                self._status_cache.pop(key.split(":", 2)[2], None)
+        if self._filters is not None and key.startswith(("ip:block:", "ip:allow:")):
+            kind, address = key.split(":", 2)[1:]
+            if address != "*":
+                self._filters[kind].add(address)
+            # 共有フィルターの版数は通知の前に進んでいるため、次のリクエストで読み直す
+            self._networks_checked_until = None
+        if key == _NETWORKS_VERSION_KEY:
+            self._networks_checked_until = None
+        elif key == _CONTROL_ACTIVE_KEY:
+            self._control_checked_until = None
+
+    async def _publish_change(self, key: str) -> None:
+        self._on_invalidation(key)
+        await self._storage.publish_invalidation(key)
+
+    def _shared_refresh_interval(self) -> float:
+        # 無効化の通知が届く間は、共有フラグと版数の確認を status_cache_ttl 秒ごとに減らせる
+        if self._invalidations_active:
+            return max(self._control_refresh_interval, self._status_cache_ttl)
+        return self._control_refresh_interval
+
+    async def _network_contains(self, kind: NetworkListKind, address: IPAddress) -> bool:
+        await self._refresh_networks()
+        return self._match_local(kind, address, self._time_provider())
+
+    def _match_local(self, kind: NetworkListKind, address: IPAddress, now: float) -> bool:
+        """ネットワーク一覧とリストファイルのように、プロセス内で判定できるエントリを確認する"""
+        if self._match_network(kind, address):
+            return True
+        if not self._list_files:
+            return False
+        if self._list_files_checked_until is None or now >= self._list_files_checked_until:
+            self._list_files_checked_until = now + self._control_refresh_interval
+            for list_file in self._list_files.values():
+                list_file.refresh()
+        list_file = self._list_files.get(kind)
+        return list_file is not None and address in list_file
+
+    def _match_network(self, kind: NetworkListKind, address: IPAddress) -> bool:
+        trie = self._network_tries[kind]
+        if not trie:
+            return False
+        expires_at = trie.match(address)
+        if expires_at is None:
+            return False
+        if expires_at > time.time():
+            return True
+        # 期限切れのエントリを除いて再構築し、より広いネットワークに一致するかを確認する
+        self._rebuild_network_trie(kind)
+        return self._network_tries[kind].match(address) is not None
+
+    def _networks_check_due(self, now: float) -> bool:
+        return self._networks_checked_until is None or now >= self._networks_checked_until
+
+    async def _refresh_networks(self) -> None:
+        """共有ストレージ上のネットワーク一覧とフィルターの版数を最大 control_refresh_interval 秒ごとに確認する"""
+        now = self._time_provider()
+        if not self._networks_check_due(now):
+            return
+        if self._filters is None:
+            await self._apply_networks_version(await self._storage.get(_NETWORKS_VERSION_KEY), now)
+            return
+        await self._apply_versions(await self._storage.get_many(self._version_keys()), now)
+
+    def _version_keys(self) -> list[str]:
+        if self._filters is None:
+            return [_NETWORKS_VERSION_KEY]
+        return [_NETWORKS_VERSION_KEY, _FILTER_VERSION_KEY]
+
+    async def _apply_versions(self, raw_versions: list[Any], now: float) -> None:
+        await self._apply_networks_version(raw_versions[0], now)
+        if self._filters is not None:
+            await self._apply_filter_version(raw_versions[1])
+
+    async def _apply_filter_version(self, raw_version: Any) -> None:
+        await self._rebuild_filters()
+        version = self._parse_version(raw_version)
+        if self._filters is None or version == self._filter_version:
+            return
+        for kind, bloom in self._filters.items():
+            bloom.load(await self._storage.get_bits(self._filter_key(kind, bloom)))
+        self._filter_version = version
+
+    async def _apply_networks_version(self, raw_version: Any, now: float) -> None:
+        version = self._parse_version(raw_version)
+        self._networks_checked_until = now + self._shared_refresh_interval()
+        if version == self._networks_version:
+            return
+
+        for kind in _NETWORK_LIST_KEYS:
+            self._networks[kind] = await self._load_network_entries(kind)
+            self._rebuild_network_trie(kind)
+        self._networks_version = version
+
+    async def _update_network_list(
+        self,
+        kind: NetworkListKind,
+        networks: Iterable[str],
+        *,
+        duration: int | None = None,
+        remove: bool = False,
+    ) -> None:
+        normalized_networks = [self._normalize_network(network) for network in networks]
+        await self._migrate_legacy_network_list(kind)
+        if remove:
+            await self._storage.delete_fields(_NETWORK_LIST_KEYS[kind], normalized_networks)
+            for normalized_network in normalized_networks:
+                self._networks[kind].pop(normalized_network, None)
+        else:
+            expires_at = time.time() + duration if duration is not None else None
+            changes = {normalized_network: expires_at for normalized_network in normalized_networks}
+            await self._storage.set_fields(_NETWORK_LIST_KEYS[kind], changes)
+            self._networks[kind].update(changes)
+
+        version = await self._storage.incr(_NETWORKS_VERSION_KEY)
+        await self._storage.publish_invalidation(_NETWORKS_VERSION_KEY)
+        self._rebuild_network_trie(kind)
+        if version == self._networks_version + 1:
+            self._networks_version = version
+        else:
+            # 他のワーカーの更新を取りこぼしているため、次回のチェックで読み直す
+            self._networks_checked_until = None
+
+    async def _load_network_entries(self, kind: NetworkListKind) -> dict[str, float | None]:
+        await self._migrate_legacy_network_list(kind)
+        entries = await self._storage.get_fields(_NETWORK_LIST_KEYS[kind])
+        now = time.time()
+        return {
+            network: expires_at
+            for network, expires_at in entries.items()
+            if expires_at is None or expires_at > now
+        }
+
+    async def _migrate_legacy_network_list(self, kind: NetworkListKind) -> None:
+        """以前のバージョンが JSON で保存した一覧を、プロセスごとに一度だけフィールド単位のマップへ移す"""
+        if kind in self._legacy_networks_migrated:
+            return
+        raw = await self._storage.get(_LEGACY_NETWORK_LIST_KEYS[kind])
+        if raw is not None:
+            if isinstance(raw, bytes):
+                raw = raw.decode("utf-8")
+            await self._storage.set_fields(_NETWORK_LIST_KEYS[kind], json.loads(raw))
+            await self._storage.delete(_LEGACY_NETWORK_LIST_KEYS[kind])
+        self._legacy_networks_migrated.add(kind)
+
+    def _rebuild_network_trie(self, kind: NetworkListKind) -> None:
+        now = time.time()
+        entries = {
+            network: expires_at
+            for network, expires_at in self._networks[kind].items()
+            if expires_at is None or expires_at > now
+        }
+        self._networks[kind] = entries
+        self._network_tries[kind] = NetworkTrie(
+            (ip_network(network), math.inf if expires_at is None else expires_at)
+            for network, expires_at in entries.items()
+        )
+
+    def _active_networks(self, kind: NetworkListKind) -> list[str]:
+        now = time.time()
+        return sorted(
+            network
+            for network, expires_at in self._networks[kind].items()
+            if expires_at is None or expires_at > now
+        )
+
+    def _block_value(self, duration: int | None) -> str | float:
+        """期限付きのブロックには、キャッシュの期限を決められるよう終了時刻 (UNIX 時刻) を保存する"""
+        return "1" if duration is None else time.time() + duration
+
+    def _block_expires_at(self, value: Any) -> float | None:
+        # 無期限のブロックと以前のバージョンが書いた値は "1"
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        return None
+
+    def _parse_version(self, raw: Any) -> int:
+        if raw is None:
+            return 0
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        return int(raw)
+
+    async def _backfill_control_flag(self) -> bool:
+        """フラグのない既存のエントリを探す。キーを列挙できないストレージでは常に IP チェックを行う"""
         try:
-            return str(ip_address(ip))
+            for prefix in _CONTROL_ENTRY_PREFIXES:
+                async for _ in self._storage.scan_keys(prefix):
+                    await self._mark_control_active()
+                    return True
+        except NotImplementedError:
+            return True
+        return False
+
+    async def _mark_control_active(self) -> None:
+        if not self._control_active:
+            await self._storage.set(_CONTROL_ACTIVE_KEY, "1")
+            self._control_active = True
+            await self._storage.publish_invalidation(_CONTROL_ACTIVE_KEY)
+
+    def _address_key(self, address: IPAddress) -> str:
+        if not self._aggregates_addresses:
+            return str(address)
+        prefix_length = self._prefix_lengths[address.version]
+        if prefix_length == address.max_prefixlen:
+            return str(address)
+        return str(ip_network((address, prefix_length), strict=False))
+
+    def _parse_ip(self, ip: str | IPAddress) -> IPAddress:
+        # ミドルウェアは解決済みのアドレスを渡すため、再解析を省く
+        if isinstance(ip, (IPv4Address, IPv6Address)):
+            return ip
+        try:
+            return ip_address(ip)
         except ValueError as exc:
-            raise ValueError("ip must be a valid IP address.") from exc
\ No newline at end of file
+            raise ValueError("ip must be a valid IP address.") from exc
+
+    def _normalize_network(self, network: str) -> str:
+        try:
+            return str(ip_network(network, strict=False))
+        except (TypeError, ValueError) as exc:
+            raise ValueError("network must be a valid IPv4 or IPv6 network in CIDR notation.") from exc
+
+
+def _validate_prefix_length(name: str, prefix_length: int, max_length: int) -> int:
+    if not isinstance(prefix_length, int) or isinstance(prefix_length, bool):
+        raise TypeError(f"{name} must be an integer.")
+    if not 1 <= prefix_length <= max_length:
+        raise ValueError(f"{name} must be between 1 and {max_length}.")
+    return prefix_length
+
+
+def _validate_duration(duration: int | None) -> None:
+    if duration is not None and (not isinstance(duration, int) or duration <= 0):
+        raise ValueError("duration must be a positive integer.")
+
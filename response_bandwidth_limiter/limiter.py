@@ -1,24 +1,75 @@
 import logging
 import inspect
+import os
 import threading
-from typing import Any, Callable, Dict, List, Mapping, Optional
+from dataclasses import dataclass, field, replace
+from ipaddress import ip_network
+from types import MappingProxyType
+from typing import Any, Callable, Iterable, List, Mapping, Optional, Sequence
 
 from starlette.applications import Starlette
 from starlette.requests import Request
+from starlette.routing import Host, Mount, Route, WebSocketRoute
+from starlette.types import Receive, Scope, Send
 
-from .ip_manager import IPManager
-from .middleware import ResponseBandwidthLimiterMiddleware
+from .bypass import BypassTokens
+from .ip_manager import BulkBlockResult, BulkProgressCallback, IPManager, IPStatus
+from .middleware import ProxyHeader, ResponseBandwidthLimiterMiddleware, RouteResolution
 from .models import Rule
-from .policy import PolicyEvaluator
+from .network_trie import NetworkTrie
+from .path_patterns import PathPatternTrie
+from .policy import PolicyEvaluator, RulePlan
+from .route_index import RouteIndex, _get_route_path
+from .route_wrapper import RoutedDecisionHook, RouteLimiterApp
 from .shutdown import ShutdownCoordinator, ShutdownMode
 from .storage import InMemoryStorage, Storage, warn_if_storage_requires_caution
-from .util import _find_configured_handler_name
+from .util import _mark_handler
 
 
 logger = logging.getLogger(__name__)
 
 ScopeResolver = Callable[[Request], Any]
 
+
+@dataclass(frozen=True)
+class LimiterSnapshot:
+    """
+    不変の設定スナップショット。
+
+    更新系メソッドは新しいスナップショットを作成して参照を差し替えるため、
+    ミドルウェアはロックやコピーなしで 1 回の参照読み取りだけで設定を参照できる。
+    """
+
+    version: int = 0
+    route_limits: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+    route_policies: Mapping[str, tuple[Rule, ...]] = field(default_factory=lambda: MappingProxyType({}))
+    route_plans: Mapping[str, RulePlan] = field(default_factory=lambda: MappingProxyType({}))
+    scope_resolvers: Mapping[str, ScopeResolver] = field(default_factory=lambda: MappingProxyType({}))
+    configured_names: frozenset[str] = frozenset()
+    path_patterns: PathPatternTrie = field(default_factory=PathPatternTrie)
+    qualifiers: Mapping[str, tuple[str, Optional[str], Optional[str]]] = field(default_factory=lambda: MappingProxyType({}))
+    qualified_variants: Mapping[str, tuple[tuple[Optional[str], Optional[str], str], ...]] = field(default_factory=lambda: MappingProxyType({}))
+    host_qualified: bool = False
+
+    def qualify(self, handler_name: str, method: Optional[str], host: Optional[str] = None) -> str:
+        """
+        メソッド・ホスト修飾付きの設定があれば、その設定キーを返す
+
+        候補は (メソッド, ホスト) > メソッドのみ > ホストのみ の順に並べてあり、
+        最初に一致したものを使う。一致しなければ修飾なしのハンドラー名を返す。
+        """
+        variants = self.qualified_variants.get(handler_name)
+        if not variants:
+            return handler_name
+        for variant_method, variant_host, key in variants:
+            if variant_method is not None and variant_method != method:
+                continue
+            if variant_host is not None and variant_host != host:
+                continue
+            return key
+        return handler_name
+
+
 class ResponseBandwidthLimiter:
     """
     レスポンス帯域幅制限と request count policy の設定を管理するクラス。
@@ -43,19 +94,57 @@ class ResponseBandwidthLimiter:
         self,
         trusted_proxy_headers: bool = False,
         storage: Optional[Storage] = None,
+        ip_manager: Optional[IPManager] = None,
+        trusted_proxies: Optional[Iterable[str]] = None,
+        bypass_tokens: Optional[BypassTokens] = None,
+        proxy_header: ProxyHeader = "x-forwarded-for",
     ):
+        if proxy_header not in {"x-forwarded-for", "forwarded", "x-real-ip"}:
+            raise ValueError("proxy_header must be one of x-forwarded-for, forwarded, x-real-ip.")
+        trusted_proxy_trie = self._build_trusted_proxies(trusted_proxies)
+        if ip_manager is not None:
+            # IP 制御とリクエスト数のカウンターは同じストレージを共有する
+            if storage is not None and storage is not ip_manager.storage:
+                raise ValueError("storage must be the storage used by ip_manager.")
+            storage = ip_manager.storage
         self._lock = threading.RLock()
-        self._route_limits: Dict[str, int] = {}
-        self._route_policies: Dict[str, List[Rule]] = {}
+        self._snapshot = LimiterSnapshot()
         self._shutdown_coordinator = ShutdownCoordinator()
         self._storage = storage or InMemoryStorage()
         self._policy_evaluator = PolicyEvaluator(storage=self._storage)
-        self._ip_manager = IPManager(storage=self._storage)
-        self._scope_resolvers: Dict[str, ScopeResolver] = {}
+        self._ip_manager = ip_manager or IPManager(storage=self._storage)
         self._app: Starlette | None = None
-        self.trusted_proxy_headers = trusted_proxy_headers
+        self._route_index: RouteIndex | None = None
+        self._route_wrapped_app: Starlette | None = None
+        # (フックを置いたルート一覧, 各階層の (ルート一覧, 長さ), フックのないアプリのパス接頭辞)
+        self._route_hooks: tuple[Sequence[Any], tuple[tuple[Sequence[Any], int], ...], tuple[str, ...] | None] | None = None
+        self.trusted_proxy_headers = trusted_proxy_headers or trusted_proxy_trie is not None
+        self.trusted_proxies = trusted_proxy_trie
+        self.proxy_header = proxy_header
+        if bypass_tokens is not None and not isinstance(bypass_tokens, BypassTokens):
+            raise TypeError("bypass_tokens must be a BypassTokens instance.")
+        self.bypass_tokens = bypass_tokens
         self._storage_warning_emitted = False
 
+    @staticmethod
+    def _build_trusted_proxies(trusted_proxies: Optional[Iterable[str]]) -> Optional[NetworkTrie[bool]]:
+        """
+        信頼済みプロキシのアドレスと CIDR からネットワークトライを作る
+
+        空の一覧はどのプロキシも信頼しない指定として扱い、ヘッダーを一切参照しない。
+        """
+        if trusted_proxies is None:
+            return None
+        if isinstance(trusted_proxies, str):
+            trusted_proxies = [trusted_proxies]
+        trie: NetworkTrie[bool] = NetworkTrie()
+        for proxy in trusted_proxies:
+            try:
+                trie.insert(ip_network(proxy.strip(), strict=False), True)
+            except (AttributeError, TypeError, ValueError) as exc:
+                raise ValueError("trusted_proxies must contain valid IP addresses or CIDR networks.") from exc
+        return trie
+
     @staticmethod
     def _is_builtin_scope(scope_name: str) -> bool:
         return scope_name in {"ip", "default"}
@@ -82,6 +171,56 @@ class ResponseBandwidthLimiter:
         if not isinstance(endpoint_name, str) or not endpoint_name:
             raise ValueError("endpoint_name must be a non-empty string.")
 
+    def _validate_path_pattern(self, pattern: str) -> None:
+        if not isinstance(pattern, str) or not pattern.startswith("/"):
+            raise ValueError("path patterns must be strings starting with '/'.")
+
+    def _normalize_methods(self, methods: str | Iterable[str] | None) -> tuple[Optional[str], ...]:
+        if methods is None:
+            return (None,)
+        if isinstance(methods, str):
+            methods = [methods]
+        normalized_methods: list[Optional[str]] = []
+        for method in methods:
+            if not isinstance(method, str) or not method.strip():
+                raise ValueError("methods must contain non-empty strings.")
+            normalized_method = method.strip().upper()
+            if normalized_method not in normalized_methods:
+                normalized_methods.append(normalized_method)
+        if not normalized_methods:
+            raise ValueError("methods must contain at least one item.")
+        return tuple(normalized_methods)
+
+    def _normalize_method(self, method: Optional[str]) -> Optional[str]:
+        return method.strip().upper() if isinstance(method, str) else None
+
+    def _normalize_host(self, host: Optional[str]) -> Optional[str]:
+        if host is None:
+            return None
+        if not isinstance(host, str) or not host.strip():
+            raise ValueError("host must be a non-empty string.")
+        return host.strip().lower()
+
+    def _validate_qualifiers(self, methods: str | Iterable[str] | None, host: Optional[str]) -> None:
+        self._normalize_methods(methods)
+        self._normalize_host(host)
+
+    def _qualified_keys(
+        self,
+        name: str,
+        methods: str | Iterable[str] | None,
+        host: Optional[str],
+    ) -> dict[str, Optional[tuple[str, Optional[str], Optional[str]]]]:
+        normalized_methods = self._normalize_methods(methods)
+        normalized_host = self._normalize_host(host)
+        if normalized_host is None and normalized_methods == (None,):
+            return {name: None}
+        host_suffix = f"@{normalized_host}" if normalized_host is not None else ""
+        return {
+            f"{name}[{method or ''}{host_suffix}]": (name, method, normalized_host)
+            for method in normalized_methods
+        }
+
     def _validate_rate(self, rate: int, *, decorator_context: bool = False) -> None:
         if not isinstance(rate, int):
             if decorator_context:
@@ -99,27 +238,68 @@ class ResponseBandwidthLimiter:
             raise ValueError("rules must contain at least one item.")
         if not all(isinstance(rule, Rule) for rule in rules):
             raise TypeError("rules can only contain Rule instances.")
-        unknown_scopes = [rule.scope for rule in rules if not self._is_builtin_scope(rule.scope) and rule.scope not in self._scope_resolvers]
+        unknown_scopes = [rule.scope for rule in rules if not self._is_builtin_scope(rule.scope) and rule.scope not in self._snapshot.scope_resolvers]
         if unknown_scopes:
             unique_scopes = ", ".join(sorted(set(unknown_scopes)))
             raise ValueError(
                 f"Unknown scope(s): {unique_scopes}. Call register_scope_resolver() first."
             )
 
+    def _swap_snapshot(self, **changes: Any) -> LimiterSnapshot:
+        # 呼び出し側で self._lock を保持していること
+        current = self._snapshot
+        route_limits = changes.get("route_limits", current.route_limits)
+        route_policies = changes.get("route_policies", current.route_policies)
+        keys = frozenset(route_limits) | frozenset(route_policies)
+        qualifiers = {
+            key: qualifier
+            for key, qualifier in changes.pop("qualifiers", current.qualifiers).items()
+            if key in keys
+        }
+        names = frozenset(qualifiers[key][0] if key in qualifiers else key for key in keys)
+        pattern_names = changes.pop("pattern_names", current.path_patterns.patterns) & names
+        path_patterns = current.path_patterns
+        if pattern_names != path_patterns.patterns:
+            path_patterns = PathPatternTrie(pattern_names)
+
+        variants: dict[str, list[tuple[Optional[str], Optional[str], str]]] = {}
+        for key, (name, method, host) in qualifiers.items():
+            variants.setdefault(name, []).append((method, host, key))
+        # メソッドとホストの両方 > メソッドのみ > ホストのみ の順で照合する
+        qualified_variants = {
+            name: tuple(sorted(candidates, key=lambda candidate: (candidate[0] is None, candidate[1] is None, candidate[2])))
+            for name, candidates in variants.items()
+        }
+        snapshot = replace(
+            current,
+            version=current.version + 1,
+            configured_names=names - pattern_names,
+            path_patterns=path_patterns,
+            qualifiers=MappingProxyType(qualifiers),
+            qualified_variants=MappingProxyType(qualified_variants),
+            host_qualified=any(host is not None for _, _, host in qualifiers.values()),
+            **changes,
+        )
+        self._snapshot = snapshot
+        if self._route_wrapped_app is not None:
+            self._install_route_wrappers(self._route_wrapped_app)
+        return snapshot
+
+    @property
+    def snapshot(self) -> LimiterSnapshot:
+        return self._snapshot
+
     @property
     def routes(self) -> Mapping[str, int]:
-        with self._lock:
-            return dict(self._route_limits)
+        return dict(self._snapshot.route_limits)
 
     @property
     def policies(self) -> Mapping[str, List[Rule]]:
-        with self._lock:
-            return {name: list(rules) for name, rules in self._route_policies.items()}
+        return {name: list(rules) for name, rules in self._snapshot.route_policies.items()}
 
     @property
     def configured_names(self) -> set[str]:
-        with self._lock:
-            return set(self._route_limits) | set(self._route_policies)
+        return set(self._snapshot.configured_names)
 
     @property
     def shutdown_coordinator(self) -> ShutdownCoordinator:
@@ -142,19 +322,20 @@ class ResponseBandwidthLimiter:
         if self._is_async_scope_resolver(resolver):
             raise TypeError("resolver must be synchronous.")
         with self._lock:
-            if normalized_scope_name in self._scope_resolvers:
+            scope_resolvers = self._snapshot.scope_resolvers
+            if normalized_scope_name in scope_resolvers:
                 raise ValueError(f"scope {normalized_scope_name!r} is already registered.")
-            self._scope_resolvers[normalized_scope_name] = resolver
+            self._swap_snapshot(
+                scope_resolvers=MappingProxyType({**scope_resolvers, normalized_scope_name: resolver}),
+            )
 
     def _get_scope_resolver(self, scope_name: str) -> Optional[ScopeResolver]:
         normalized_scope_name = self._normalize_scope_name(scope_name)
-        with self._lock:
-            return self._scope_resolvers.get(normalized_scope_name)
+        return self._snapshot.scope_resolvers.get(normalized_scope_name)
 
     @property
     def scope_resolvers(self) -> Mapping[str, ScopeResolver]:
-        with self._lock:
-            return dict(self._scope_resolvers)
+        return dict(self._snapshot.scope_resolvers)
 
     def resolve_handler_identifier(self, request: Request) -> str | None:
         app = request.scope.get("app", self._app)
@@ -163,42 +344,317 @@ class ResponseBandwidthLimiter:
                 "resolve_handler_identifier() requires init_app() or a request bound to an application."
             )
 
-        routes = getattr(app, "routes", [])
         path = str(request.scope.get("path", ""))
-        return _find_configured_handler_name(routes, request.scope, path, self.configured_names)
+        handler_name = self.get_route_index(app).resolve(request.scope, path)
+        if handler_name is None:
+            handler_name = self._snapshot.path_patterns.match(path)
+        return handler_name
+
+    def get_route_index(self, app: Any) -> RouteIndex:
+        routes = getattr(app, "routes", [])
+        route_index = self._route_index
+        if route_index is not None and route_index.is_current(routes, self._snapshot.version):
+            return route_index
 
-    def get_limit(self, endpoint_name: str) -> int | None:
         with self._lock:
-            return self._route_limits.get(endpoint_name)
+            snapshot = self._snapshot
+            route_index = self._route_index
+            if route_index is None or not route_index.is_current(routes, snapshot.version):
+                route_index = RouteIndex(routes, snapshot.configured_names, version=snapshot.version)
+                self._route_index = route_index
+            return route_index
+
+    def _install_route_wrappers(self, app: Any) -> None:
+        """設定済みのルートの ASGI アプリを RouteLimiterApp で包む"""
+        with self._lock:
+            for route, handler_name in self.get_route_index(app).named_routes:
+                route_app = getattr(route, "app", None)
+                if route_app is None:
+                    continue
+                if isinstance(route_app, RouteLimiterApp):
+                    route_app.handler_name = handler_name
+                    continue
+                route.app = RouteLimiterApp(
+                    route_app,
+                    handler_name,
+                    self,
+                    policy_evaluator=self._policy_evaluator,
+                    shutdown_coordinator=self._shutdown_coordinator,
+                )
+
+    def install_route_hooks(self, app: Any) -> None:
+        """
+        route_resolution="router" 用に、すべての HTTP ルートの前へ RoutedDecisionHook を置く
 
-    def get_rules(self, endpoint_name: str) -> List[Rule]:
+        ルート一覧 (Mount 内を含む) が変わっていなければ何もしないため、リクエストごとに呼び出せる。
+        """
+        routes = getattr(app, "routes", None)
+        if routes is None:
+            return
+        if self._route_hooks_current(routes):
+            return
         with self._lock:
-            return list(self._route_policies.get(endpoint_name, []))
+            route_lists: list[tuple[Sequence[Any], int]] = []
+            unhooked_prefixes: list[str | None] = []
+            _install_routed_decision_hooks(routes, "", route_lists, unhooked_prefixes)
+            prefixes = None if None in unhooked_prefixes else tuple(prefix for prefix in unhooked_prefixes if prefix is not None)
+            self._route_hooks = (routes, tuple(route_lists), prefixes)
+
+    def may_reach_unhooked_app(self, scope: Scope) -> bool:
+        """
+        リクエストがフックのないアプリ (Mount 先のサブアプリケーションなど) に届きうるかを返す
+
+        install_route_hooks() の後に呼び出す。届かない場合は、判定をフックだけに任せられる。
+        """
+        installed = self._route_hooks
+        if installed is None:
+            return True
+        prefixes = installed[2]
+        if prefixes is None:
+            return True
+        if not prefixes:
+            return False
+        route_path = _get_route_path(scope)
+        return any(route_path.startswith(prefix + "/") for prefix in prefixes)
+
+    def _route_hooks_current(self, routes: Sequence[Any]) -> bool:
+        installed = self._route_hooks
+        if installed is None or installed[0] is not routes:
+            return False
+        for route_list, size in installed[1]:
+            if len(route_list) != size:
+                return False
+        return True
+
+    def _install_lifespan_handler(self, app: Starlette, install_signal_handlers: bool) -> None:
+        """
+        ルーター単位のライフスパン処理にシグナルハンドラーの登録とストレージのクローズを組み込む
+
+        起動時には、init_app() 後に追加されたルートもラップし直す。
+        """
+        router = getattr(app, "router", None)
+        if router is None:
+            return
+        lifespan_handler = ResponseBandwidthLimiterMiddleware(
+            router.lifespan,
+            policy_evaluator=self._policy_evaluator,
+            ip_manager=self._ip_manager,
+            shutdown_coordinator=self._shutdown_coordinator,
+            install_signal_handlers=install_signal_handlers,
+        )
+
+        async def lifespan(scope: Scope, receive: Receive, send: Send) -> None:
+            self._install_route_wrappers(app)
+            await lifespan_handler(scope, receive, send)
+
+        router.lifespan = lifespan
+
+    def get_limit(
+        self,
+        endpoint_name: str,
+        *,
+        method: Optional[str] = None,
+        host: Optional[str] = None,
+    ) -> int | None:
+        snapshot = self._snapshot
+        key = snapshot.qualify(endpoint_name, self._normalize_method(method), self._normalize_host(host))
+        return snapshot.route_limits.get(key)
+
+    def get_rules(
+        self,
+        endpoint_name: str,
+        *,
+        method: Optional[str] = None,
+        host: Optional[str] = None,
+    ) -> List[Rule]:
+        snapshot = self._snapshot
+        key = snapshot.qualify(endpoint_name, self._normalize_method(method), self._normalize_host(host))
+        return list(snapshot.route_policies.get(key, ()))
+
+    def update_route(
+        self,
+        endpoint_name: str,
+        rate: int,
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        """
+        ハンドラーの帯域制限を設定する
 
-    def update_route(self, endpoint_name: str, rate: int) -> None:
+        Args:
+            endpoint_name: エンドポイント名
+            rate: 制限する速度（bytes/sec）
+            methods: 指定すると、その HTTP メソッドのリクエストだけに適用する
+            host: 指定すると、その Host ヘッダー（ポートを除く）のリクエストだけに適用する
+        """
         self._validate_endpoint_name(endpoint_name)
         self._validate_rate(rate)
+        self._store_route_limit(endpoint_name, rate, methods=methods, host=host)
+
+    def update_route_prefix(
+        self,
+        prefix: str,
+        rate: int,
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        """
+        パスのプレフィックスまたは glob パターンに帯域制限を設定する
+
+        Args:
+            prefix: "/static/" のようなプレフィックス、または "/files/*.pdf" のような glob パターン
+            rate: 制限する速度（bytes/sec）
+            methods: 指定すると、その HTTP メソッドのリクエストだけに適用する
+            host: 指定すると、その Host ヘッダーのリクエストだけに適用する
+        """
+        self._validate_path_pattern(prefix)
+        self._validate_rate(rate)
+        self._store_route_limit(prefix, rate, path_pattern=True, methods=methods, host=host)
+
+    def _store_route_limit(
+        self,
+        name: str,
+        rate: int,
+        path_pattern: bool = False,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        keys = self._qualified_keys(name, methods, host)
         with self._lock:
-            self._route_limits[endpoint_name] = rate
+            current = self._snapshot
+            route_limits = {**current.route_limits, **dict.fromkeys(keys, rate)}
+            qualifiers = {**current.qualifiers, **{key: qualifier for key, qualifier in keys.items() if qualifier}}
+            pattern_names = current.path_patterns.patterns | {name} if path_pattern else current.path_patterns.patterns
+            self._swap_snapshot(
+                route_limits=MappingProxyType(route_limits),
+                qualifiers=qualifiers,
+                pattern_names=pattern_names,
+            )
 
-    def remove_route(self, endpoint_name: str) -> None:
+    def remove_route(
+        self,
+        endpoint_name: str,
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        keys = self._qualified_keys(endpoint_name, methods, host)
         with self._lock:
-            self._route_limits.pop(endpoint_name, None)
+            route_limits = dict(self._snapshot.route_limits)
+            for key in keys:
+                route_limits.pop(key, None)
+            self._swap_snapshot(route_limits=MappingProxyType(route_limits))
 
-    def update_policy(self, endpoint_name: str, rules: List[Rule]) -> None:
+    def remove_route_prefix(
+        self,
+        prefix: str,
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        self._validate_path_pattern(prefix)
+        self.remove_route(prefix, methods=methods, host=host)
+
+    def update_policy(
+        self,
+        endpoint_name: str,
+        rules: List[Rule],
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        """
+        ハンドラーの request count policy を設定する
+
+        Args:
+            endpoint_name: エンドポイント名
+            rules: Rule の配列
+            methods: 指定すると、その HTTP メソッドのリクエストだけに適用する
+            host: 指定すると、その Host ヘッダー（ポートを除く）のリクエストだけに適用する
+        """
         self._validate_endpoint_name(endpoint_name)
         self._validate_rules(rules)
+        self._store_policy(endpoint_name, rules, methods=methods, host=host)
+
+    def update_policy_prefix(
+        self,
+        prefix: str,
+        rules: List[Rule],
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        """
+        パスのプレフィックスまたは glob パターンに request count policy を設定する
+
+        Args:
+            prefix: "/static/" のようなプレフィックス、または "/files/*.pdf" のような glob パターン
+            rules: Rule の配列
+            methods: 指定すると、その HTTP メソッドのリクエストだけに適用する
+            host: 指定すると、その Host ヘッダーのリクエストだけに適用する
+        """
+        self._validate_path_pattern(prefix)
+        self._validate_rules(rules)
+        self._store_policy(prefix, rules, path_pattern=True, methods=methods, host=host)
+
+    def _store_policy(
+        self,
+        name: str,
+        rules: List[Rule],
+        path_pattern: bool = False,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        keys = self._qualified_keys(name, methods, host)
+        plan = self._policy_evaluator.compile(rules)
         with self._lock:
-            self._route_policies[endpoint_name] = list(rules)
-            active_rules = {name: list(configured_rules) for name, configured_rules in self._route_policies.items()}
-        self._storage.cleanup_handler_counters(endpoint_name)
+            current = self._snapshot
+            route_policies = {**current.route_policies, **dict.fromkeys(keys, plan.rules)}
+            route_plans = {**current.route_plans, **dict.fromkeys(keys, plan)}
+            qualifiers = {**current.qualifiers, **{key: qualifier for key, qualifier in keys.items() if qualifier}}
+            pattern_names = current.path_patterns.patterns | {name} if path_pattern else current.path_patterns.patterns
+            active_rules = self._swap_snapshot(
+                route_policies=MappingProxyType(route_policies),
+                route_plans=MappingProxyType(route_plans),
+                qualifiers=qualifiers,
+                pattern_names=pattern_names,
+            ).route_policies
+        for key in keys:
+            self._storage.cleanup_handler_counters(key)
         self._storage.cleanup_orphaned_counters(active_rules)
 
-    def remove_policy(self, endpoint_name: str) -> None:
+    def remove_policy_prefix(
+        self,
+        prefix: str,
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        self._validate_path_pattern(prefix)
+        self.remove_policy(prefix, methods=methods, host=host)
+
+    def remove_policy(
+        self,
+        endpoint_name: str,
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> None:
+        keys = self._qualified_keys(endpoint_name, methods, host)
         with self._lock:
-            self._route_policies.pop(endpoint_name, None)
-            active_rules = {name: list(configured_rules) for name, configured_rules in self._route_policies.items()}
-        self._storage.cleanup_handler_counters(endpoint_name)
+            route_policies = dict(self._snapshot.route_policies)
+            route_plans = dict(self._snapshot.route_plans)
+            for key in keys:
+                route_policies.pop(key, None)
+                route_plans.pop(key, None)
+            active_rules = self._swap_snapshot(
+                route_policies=MappingProxyType(route_policies),
+                route_plans=MappingProxyType(route_plans),
+            ).route_policies
+        for key in keys:
+            self._storage.cleanup_handler_counters(key)
         self._storage.cleanup_orphaned_counters(active_rules)
 
     def begin_shutdown(self, mode: ShutdownMode) -> None:
@@ -208,7 +664,13 @@ class ResponseBandwidthLimiter:
         self.begin_shutdown(mode)
         return await self._shutdown_coordinator.wait_until_drained(timeout=timeout)
 
+    async def warm_up(self) -> None:
+        """ストレージの接続とサーバー側の状態と IP フィルターを、最初のリクエストより前に準備する"""
+        await self._storage.warm_up()
+        await self._ip_manager.warm_up()
+
     async def close(self) -> None:
+        self._ip_manager.close()
         await self._storage.close()
 
     async def block_ip(self, ip: str, duration: int | None = None) -> None:
@@ -217,6 +679,33 @@ class ResponseBandwidthLimiter:
     async def unblock_ip(self, ip: str) -> None:
         await self._ip_manager.unblock_ip(ip)
 
+    async def block_ips(
+        self,
+        ips: Iterable[str],
+        duration: int | None = None,
+        *,
+        batch_size: int = 1000,
+        progress: Optional[BulkProgressCallback] = None,
+    ) -> BulkBlockResult:
+        return await self._ip_manager.block_ips(ips, duration=duration, batch_size=batch_size, progress=progress)
+
+    async def import_blocklist(
+        self,
+        path: str | os.PathLike[str],
+        duration: int | None = None,
+        *,
+        batch_size: int = 1000,
+        progress: Optional[BulkProgressCallback] = None,
+        encoding: str = "utf-8",
+    ) -> BulkBlockResult:
+        return await self._ip_manager.import_blocklist(
+            path,
+            duration=duration,
+            batch_size=batch_size,
+            progress=progress,
+            encoding=encoding,
+        )
+
     async def is_blocked(self, ip: str) -> bool:
         return await self._ip_manager.is_blocked(ip)
 
@@ -228,13 +717,36 @@ class ResponseBandwidthLimiter:
 
     async def is_allowed(self, ip: str) -> bool:
         return await self._ip_manager.is_allowed(ip)
+
+    async def get_ip_status(self, ip: str) -> IPStatus:
+        return await self._ip_manager.get_status(ip)
+
+    async def block_network(self, network: str, duration: int | None = None) -> None:
+        await self._ip_manager.block_network(network, duration=duration)
+
+    async def unblock_network(self, network: str) -> None:
+        await self._ip_manager.unblock_network(network)
+
+    async def allow_network(self, network: str) -> None:
+        await self._ip_manager.allow_network(network)
+
+    async def remove_allow_network(self, network: str) -> None:
+        await self._ip_manager.remove_allow_network(network)
         
-    def limit(self, rate: int) -> Callable:
+    def limit(
+        self,
+        rate: int,
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> Callable:
         """
         帯域幅を制限する装飾子
         
         Args:
             rate: 制限する速度（bytes/sec）
+            methods: 指定すると、その HTTP メソッドのリクエストだけに適用する
+            host: 指定すると、その Host ヘッダー（ポートを除く）のリクエストだけに適用する
         
         Returns:
             装飾子関数
@@ -246,37 +758,58 @@ class ResponseBandwidthLimiter:
                 return StreamingResponse(...)
         """
         self._validate_rate(rate, decorator_context=True)
+        self._validate_qualifiers(methods, host)
             
         def decorator(func):
-            self.update_route(func.__name__, rate)
+            self.update_route(func.__name__, rate, methods=methods, host=host)
+            _mark_handler(func, func.__name__)
             return func
             
         return decorator
 
-    def limit_rules(self, rules: List[Rule]) -> Callable:
+    def limit_rules(
+        self,
+        rules: List[Rule],
+        *,
+        methods: str | Iterable[str] | None = None,
+        host: Optional[str] = None,
+    ) -> Callable:
         """
         request count ベースのポリシーを設定する装飾子
 
         Args:
             rules: Rule の配列
+            methods: 指定すると、その HTTP メソッドのリクエストだけに適用する
+            host: 指定すると、その Host ヘッダー（ポートを除く）のリクエストだけに適用する
 
         Returns:
             装飾子関数
         """
         self._validate_rules(rules)
+        self._validate_qualifiers(methods, host)
 
         def decorator(func):
-            self.update_policy(func.__name__, rules)
+            self.update_policy(func.__name__, rules, methods=methods, host=host)
+            _mark_handler(func, func.__name__)
             return func
 
         return decorator
         
-    def init_app(self, app: Starlette, install_signal_handlers: bool = True) -> None:
+    def init_app(
+        self,
+        app: Starlette,
+        install_signal_handlers: bool = True,
+        route_resolution: RouteResolution = "middleware",
+    ) -> None:
         """
         アプリケーションにリミッターを登録する
         
         Args:
             app: FastAPIまたはStarletteアプリケーション
+            route_resolution: "router" を指定するとルーターのマッチ結果からハンドラーを特定し、
+                ポリシー判定と帯域制限をルーティング後まで遅延する。
+                "route" を指定するとグローバルミドルウェアを登録せず、設定済みのルートの
+                ASGI アプリだけをラップする。IP 制御が必要な場合は IPControlMiddleware を別途追加する
         """
         if not self._storage_warning_emitted:
             warn_if_storage_requires_caution(self._storage)
@@ -284,10 +817,55 @@ class ResponseBandwidthLimiter:
 
         self._app = app
         app.state.response_bandwidth_limiter = self
+        self.get_route_index(app)
+        if route_resolution == "route":
+            self._route_wrapped_app = app
+            self._install_route_wrappers(app)
+            self._install_lifespan_handler(app, install_signal_handlers)
+            return
+
         app.add_middleware(
             ResponseBandwidthLimiterMiddleware,
             policy_evaluator=self._policy_evaluator,
             ip_manager=self._ip_manager,
             shutdown_coordinator=self._shutdown_coordinator,
             install_signal_handlers=install_signal_handlers,
+            route_resolution=route_resolution,
         )
+        if route_resolution == "router":
+            self.install_route_hooks(app)
+
+
+def _install_routed_decision_hooks(
+    routes: Sequence[Any],
+    prefix: str | None,
+    route_lists: list[tuple[Sequence[Any], int]],
+    unhooked_prefixes: list[str | None],
+) -> None:
+    """
+    ルートにフックを置き、走査したルート一覧とフックのないアプリのパス接頭辞を集める
+
+    接頭辞を特定できないアプリ (パスパラメーターを含む Mount や独自のルート) は None として記録する。
+    """
+    route_lists.append((routes, len(routes)))
+    for route in routes:
+        if isinstance(route, Route):
+            if not isinstance(route.app, RoutedDecisionHook):
+                route.app = RoutedDecisionHook(route.app)
+            continue
+        if isinstance(route, WebSocketRoute):
+            continue
+
+        nested_prefix = None
+        if isinstance(route, Mount):
+            if prefix is not None and "{" not in route.path:
+                nested_prefix = prefix + route.path
+        elif isinstance(route, Host):
+            nested_prefix = prefix
+        nested_routes = getattr(route, "routes", None)
+        if nested_routes:
+            # Mount 先のルートにもフックを置く。ルーター以外のアプリは send まで遅延する
+            _install_routed_decision_hooks(nested_routes, nested_prefix, route_lists, unhooked_prefixes)
+        else:
+            unhooked_prefixes.append(nested_prefix)
+
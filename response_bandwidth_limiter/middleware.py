@@ -2,26 +2,96 @@ import asyncio
 import logging
 import signal
 import threading
+from dataclasses import dataclass
 from ipaddress import ip_address
 from types import FrameType
-from typing import Any, AsyncIterator, Callable, Optional
+from typing import Any, AsyncIterator, Callable, Iterable, Literal, Mapping, Optional
 
 from starlette.requests import Request
-from starlette.responses import JSONResponse
-from starlette.routing import Match
+from starlette.responses import JSONResponse, Response
 from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from .bypass import BypassGrant
 from .ip_manager import IPManager
-from .models import PolicyDecision, Rule
-from .policy import MatchedPolicy, PolicyEvaluator
+from .network_trie import IPAddress, NetworkTrie
+from .models import PolicyDecision
+from .policy import MatchedPolicy, PolicyEvaluator, RulePlan
 from .shutdown import ShutdownCoordinator, ShutdownMode
 from .storage import StorageUnavailableError
 from .streaming import ResponseStreamer, StreamingAbortedError
-from .util import _find_configured_handler_name
+from .util import _get_request_host
 
 
 logger = logging.getLogger(__name__)
 
+RouteResolution = Literal["middleware", "router", "route"]
+# trusted_proxies を指定した場合に、プロキシのホップを読むヘッダー
+ProxyHeader = Literal["x-forwarded-for", "forwarded", "x-real-ip"]
+
+# IPControlMiddleware が許可リストの判定結果をルート単位のラッパーへ渡すための scope キー
+IP_ALLOWED_SCOPE_KEY = "response_bandwidth_limiter.ip_allowed"
+# 解決時の設定と解決済みの ClientIdentity を保持する scope キー
+CLIENT_SCOPE_KEY = "response_bandwidth_limiter.client"
+# 下流のアプリが request.state.client_identity で参照できるよう scope["state"] にも保存する
+CLIENT_IDENTITY_STATE_KEY = "client_identity"
+# 検証に使った BypassTokens と検証結果の BypassGrant を保持する scope キー
+BYPASS_SCOPE_KEY = "response_bandwidth_limiter.bypass"
+# route_resolution="router" で、ルート単位のフックがエンドポイントの実行前に判定を行うための scope キー
+ROUTED_DECISION_SCOPE_KEY = "response_bandwidth_limiter.routed_decision"
+# フックのないアプリに届かないリクエストで、フックへ (ミドルウェア, limiter, 許可リストの判定結果) を渡す scope キー
+ROUTED_CONTEXT_SCOPE_KEY = "response_bandwidth_limiter.routed_context"
+
+
+@dataclass(frozen=True)
+class ClientIdentity:
+    """
+    リクエストごとに 1 回だけ解決されるクライアントの識別情報
+
+    Attributes:
+        ip: 検証済みのクライアント IP。正規化した文字列表記
+        identifier: scope="default" のカウンターに使う識別子
+        address: ip を解析済みの IPv4Address / IPv6Address
+    """
+
+    ip: Optional[str]
+    identifier: str
+    address: Optional[IPAddress] = None
+
+
+_UNKNOWN_CLIENT = ClientIdentity(ip=None, identifier="unknown")
+
+
+class _LimitedSend:
+    """帯域制限付きの send。クロージャの代わりに __slots__ 付きのオブジェクトを 1 つだけ確保する"""
+
+    __slots__ = ("middleware", "send", "max_rate")
+
+    def __init__(self, middleware: "ResponseBandwidthLimiterMiddleware", send: Send, max_rate: int) -> None:
+        self.middleware = middleware
+        self.send = send
+        self.max_rate = max_rate
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        if not body:
+            await self.send(message)
+            return
+
+        middleware = self.middleware
+        await middleware._send_limited_body(
+            self.send,
+            body,
+            message.get("more_body", False),
+            self.max_rate,
+            abort_check=middleware._abort_check,
+            poll_check=middleware._poll_check,
+        )
+
+
 class ResponseBandwidthLimiterMiddleware:
     chunk_size = 8192
 
@@ -33,22 +103,31 @@ class ResponseBandwidthLimiterMiddleware:
         response_streamer: Optional[ResponseStreamer] = None,
         shutdown_coordinator: Optional[ShutdownCoordinator] = None,
         install_signal_handlers: bool = True,
+        route_resolution: RouteResolution = "middleware",
     ):
         """
         帯域制限ミドルウェア
         
         Args:
             app: FastAPIまたはStarletteアプリ
+            route_resolution: "middleware" はミドルウェア内でルートを照合し、
+                "router" はルーターのマッチ結果 (scope["route"] / scope["endpoint"]) を使う
         """
+        if route_resolution not in {"middleware", "router"}:
+            raise ValueError("route_resolution must be either middleware or router.")
         self.app = app
         self.policy_evaluator = policy_evaluator or PolicyEvaluator()
         self.ip_manager = ip_manager
         self.response_streamer = response_streamer or ResponseStreamer(chunk_size=self.chunk_size, sleep_func=asyncio.sleep)
         self.shutdown_coordinator = shutdown_coordinator or ShutdownCoordinator()
         self.install_signal_handlers = install_signal_handlers
+        self.route_resolution = route_resolution
         self._signal_lock = threading.Lock()
         self._signal_handler_installed = False
         self._original_sigint_handler: Any = None
+        # リクエストごとにクロージャを作らないよう、チェック関数は事前に束縛しておく
+        self._abort_check = self._should_abort
+        self._poll_check = self._should_poll
 
     async def _yield_limited_chunks(
         self,
@@ -107,64 +186,157 @@ class ResponseBandwidthLimiterMiddleware:
             self._original_sigint_handler = None
 
     def _extract_valid_ip(self, raw_value: Optional[str]) -> Optional[str]:
+        address = self._extract_valid_address(raw_value)
+        return str(address) if address is not None else None
+
+    def _extract_valid_address(self, raw_value: Optional[str]) -> Optional[IPAddress]:
         if raw_value is None:
             return None
 
         for candidate in raw_value.split(","):
-            normalized = candidate.strip()
-            if not normalized:
-                continue
-            try:
-                ip_address(normalized)
-            except ValueError:
-                continue
-            return normalized
+            address = _parse_address(candidate)
+            if address is not None:
+                return address
 
         return None
 
-    def _get_client_identifier(
+    def _resolve_client(
         self,
-        request: Request,
+        scope: Scope,
         trust_proxy_headers: bool = False,
-    ) -> str:
-        if trust_proxy_headers:
-            forwarded_ip = self._extract_valid_ip(request.headers.get("x-forwarded-for"))
-            if forwarded_ip is not None:
-                return forwarded_ip
+        trusted_proxies: Optional[NetworkTrie[bool]] = None,
+        proxy_header: ProxyHeader = "x-forwarded-for",
+    ) -> tuple[Optional[str], str]:
+        identity = self._resolve_client_identity(scope, trust_proxy_headers, trusted_proxies, proxy_header)
+        return identity.ip, identity.identifier
 
-            real_ip = self._extract_valid_ip(request.headers.get("x-real-ip"))
-            if real_ip is not None:
-                return real_ip
-
-        client = getattr(request, "client", None)
-        if client and getattr(client, "host", None):
-            return client.host
-
-        scope_client = request.scope.get("client")
-        if scope_client:
-            return str(scope_client[0])
+    def _resolve_client_identity(
+        self,
+        scope: Scope,
+        trust_proxy_headers: bool = False,
+        trusted_proxies: Optional[NetworkTrie[bool]] = None,
+        proxy_header: ProxyHeader = "x-forwarded-for",
+    ) -> ClientIdentity:
+        """
+        クライアントの識別情報を 1 回のヘッダー走査で求める
 
-        return "unknown"
+        結果は scope と scope["state"] にキャッシュし、IP 制御・policy の scope 解決・
+        下流のアプリで共有する。trusted_proxies を指定した場合は、直接の接続元が
+        信頼済みプロキシのときだけ proxy_header のホップを右から順にたどる。
+        """
+        cached = scope.get(CLIENT_SCOPE_KEY)
+        if (
+            cached is not None
+            and cached[0] is trust_proxy_headers
+            and cached[1] is trusted_proxies
+            and cached[2] == proxy_header
+        ):
+            return cached[3]
+
+        scope_client = scope.get("client")
+        host = str(scope_client[0]) if scope_client and scope_client[0] else None
+        peer_address = _parse_address(host) if host else None
+
+        identity: Optional[ClientIdentity] = None
+        if trusted_proxies is not None:
+            if peer_address is not None and trusted_proxies.match(peer_address) is not None:
+                address = self._walk_proxy_chain(scope, peer_address, trusted_proxies, proxy_header)
+                identity = ClientIdentity(ip=str(address), identifier=str(address), address=address)
+        elif trust_proxy_headers:
+            identity = self._resolve_legacy_proxy_identity(scope)
+
+        if identity is None:
+            if peer_address is not None:
+                identity = ClientIdentity(ip=str(peer_address), identifier=str(peer_address), address=peer_address)
+            elif host:
+                identity = ClientIdentity(ip=None, identifier=host)
+            else:
+                identity = _UNKNOWN_CLIENT
+
+        scope[CLIENT_SCOPE_KEY] = (trust_proxy_headers, trusted_proxies, proxy_header, identity)
+        state = scope.setdefault("state", {})
+        if isinstance(state, dict):
+            state[CLIENT_IDENTITY_STATE_KEY] = identity
+        return identity
+
+    def _resolve_legacy_proxy_identity(self, scope: Scope) -> Optional[ClientIdentity]:
+        """trusted_proxy_headers=True のみの場合。接続元を問わず X-Forwarded-For の左端を使う"""
+        forwarded_for = real_ip = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-forwarded-for":
+                if forwarded_for is None:
+                    forwarded_for = value
+            elif name == b"x-real-ip":
+                if real_ip is None:
+                    real_ip = value
+
+        address = None
+        if forwarded_for:
+            address = self._extract_valid_address(forwarded_for.decode("latin-1"))
+        if address is None and real_ip:
+            address = self._extract_valid_address(real_ip.decode("latin-1"))
+        if address is None:
+            return None
+        return ClientIdentity(ip=str(address), identifier=str(address), address=address)
 
-    def _get_client_ip(self, request: Request, trust_proxy_headers: bool = False) -> str | None:
-        if trust_proxy_headers:
-            forwarded_ip = self._extract_valid_ip(request.headers.get("x-forwarded-for"))
-            if forwarded_ip is not None:
-                return forwarded_ip
+    def _walk_proxy_chain(
+        self,
+        scope: Scope,
+        peer_address: IPAddress,
+        trusted_proxies: NetworkTrie[bool],
+        proxy_header: ProxyHeader = "x-forwarded-for",
+    ) -> IPAddress:
+        """
+        信頼済みプロキシが付けたホップを右から順にたどり、最初の信頼できないアドレスを返す
 
-            real_ip = self._extract_valid_ip(request.headers.get("x-real-ip"))
-            if real_ip is not None:
-                return real_ip
+        読むのは proxy_header だけで、他のヘッダーにはフォールバックしない。
+        プロキシが書き換えないヘッダーはクライアントが自由に送れるため。
+        解析できないホップに達した場合は、その直前のアドレスをクライアントとみなす。
+        """
+        header_name = proxy_header.encode("latin-1")
+        values = [value.decode("latin-1") for name, value in scope.get("headers", ()) if name == header_name]
+
+        if not values:
+            hops: list[Optional[IPAddress]] = []
+        elif proxy_header == "forwarded":
+            hops = _parse_forwarded_for(", ".join(values))
+        elif proxy_header == "x-real-ip":
+            hops = [_parse_address(values[0])]
+        else:
+            hops = [_parse_address(hop) for hop in ", ".join(values).split(",")]
 
-        client = getattr(request, "client", None)
-        if client and getattr(client, "host", None):
-            return self._extract_valid_ip(str(client.host))
+        client = peer_address
+        for hop in reversed(hops):
+            if hop is None:
+                break
+            client = hop
+            if trusted_proxies.match(hop) is None:
+                break
+        return client
 
-        scope_client = request.scope.get("client")
-        if scope_client:
-            return self._extract_valid_ip(str(scope_client[0]))
+    def _get_client_identifier(
+        self,
+        request: Request,
+        trust_proxy_headers: bool = False,
+        trusted_proxies: Optional[NetworkTrie[bool]] = None,
+    ) -> str:
+        return self._resolve_client(request.scope, trust_proxy_headers, trusted_proxies)[1]
 
-        return None
+    def _get_client_ip(
+        self,
+        request: Request,
+        trust_proxy_headers: bool = False,
+        trusted_proxies: Optional[NetworkTrie[bool]] = None,
+    ) -> str | None:
+        return self._resolve_client(request.scope, trust_proxy_headers, trusted_proxies)[0]
+
+    def _resolve_limiter_client(self, scope: Scope, limiter: Any) -> ClientIdentity:
+        return self._resolve_client_identity(
+            scope,
+            getattr(limiter, "trusted_proxy_headers", False),
+            getattr(limiter, "trusted_proxies", None),
+            getattr(limiter, "proxy_header", "x-forwarded-for"),
+        )
 
     def _get_limiter(self, app: Any) -> Any:
         app_state = getattr(app, "state", None)
@@ -175,36 +347,48 @@ class ResponseBandwidthLimiterMiddleware:
     async def _evaluate_policy_rules(
         self,
         handler_name: str,
-        rules: list[Rule],
+        plan: RulePlan,
         scope_identifiers: dict[str, str],
+        scope: Scope,
     ) -> Optional[MatchedPolicy]:
-        return await self.policy_evaluator.evaluate(scope_identifiers, handler_name, rules)
+        return await self.policy_evaluator.evaluate(scope_identifiers, handler_name, plan, scope)
 
-    def _resolve_scope_identifiers(self, request: Request, rules: list[Rule], limiter: Any) -> dict[str, str]:
+    def _resolve_scope_identifiers(
+        self,
+        scope: Scope,
+        scope_names: Iterable[str],
+        limiter: Any,
+        scope_resolvers: Mapping[str, Any],
+    ) -> dict[str, str]:
         scope_identifiers: dict[str, str] = {}
-        trust_proxy_headers = getattr(limiter, "trusted_proxy_headers", False)
-
-        for rule in rules:
-            scope_name = rule.scope
+        identity = self._resolve_limiter_client(scope, limiter)
+        client_identifier = identity.identifier
+        fallback_identifier = identity.ip or "unknown"
+        ip_manager = getattr(limiter, "ip_manager", None)
+        if identity.address is not None and ip_manager is not None:
+            # IPv6 の /64 などをまとめる設定では、カウンターも block / allow と同じキーで数える
+            client_identifier = fallback_identifier = ip_manager.address_key(identity.address)
+        request: Optional[Request] = None
+
+        for scope_name in scope_names:
             if scope_name in scope_identifiers:
                 continue
 
             if scope_name == "ip":
-                scope_identifiers[scope_name] = self._get_client_ip(request, trust_proxy_headers) or "unknown"
+                scope_identifiers[scope_name] = fallback_identifier
                 continue
 
             if scope_name == "default":
-                scope_identifiers[scope_name] = self._get_client_identifier(request, trust_proxy_headers)
+                scope_identifiers[scope_name] = client_identifier
                 continue
 
-            resolver = getattr(limiter, "_get_scope_resolver", None)
-            if not callable(resolver):
-                raise ValueError(f"Cannot resolve a resolver getter for scope {scope_name!r}.")
-
-            scope_resolver = resolver(scope_name)
+            scope_resolver = scope_resolvers.get(scope_name)
             if scope_resolver is None:
                 raise ValueError(f"scope {scope_name!r} is not registered.")
 
+            # Request はカスタム scope resolver を呼ぶときだけ生成する
+            if request is None:
+                request = Request(scope)
             try:
                 resolved = scope_resolver(request)
             except Exception:
@@ -213,7 +397,7 @@ class ResponseBandwidthLimiterMiddleware:
                     scope_name,
                     exc_info=True,
                 )
-                scope_identifiers[scope_name] = self._get_client_ip(request, trust_proxy_headers) or "unknown"
+                scope_identifiers[scope_name] = fallback_identifier
                 continue
 
             str_value = str(resolved) if resolved is not None else ""
@@ -222,7 +406,7 @@ class ResponseBandwidthLimiterMiddleware:
                     "Scope resolver %r returned an empty value. Falling back to the real client IP.",
                     scope_name,
                 )
-                scope_identifiers[scope_name] = self._get_client_ip(request, trust_proxy_headers) or "unknown"
+                scope_identifiers[scope_name] = fallback_identifier
             else:
                 scope_identifiers[scope_name] = str_value
 
@@ -283,11 +467,11 @@ class ResponseBandwidthLimiterMiddleware:
         if limiter is None:
             return None
 
-        configured_names = limiter.configured_names
-
-        # ルートを探索
-        routes = getattr(app, "routes", [])
-        return _find_configured_handler_name(routes, request.scope, path, configured_names)
+        # init_app() 時に構築したルートインデックスで探索し、なければパスパターンを参照
+        handler_name = limiter.get_route_index(app).resolve(request.scope, path)
+        if handler_name is None:
+            handler_name = limiter.snapshot.path_patterns.match(path)
+        return handler_name
 
     async def _send_limited_body(
         self,
@@ -318,8 +502,11 @@ class ResponseBandwidthLimiterMiddleware:
     async def _handle_lifespan(self, scope: Scope, receive: Receive, send: Send) -> None:
         async def receive_with_signal() -> Message:
             message = await receive()
-            if self.install_signal_handlers and message["type"] == "lifespan.startup":
-                self._install_signal_handler()
+            if message["type"] == "lifespan.startup":
+                if self.install_signal_handlers:
+                    self._install_signal_handler()
+                # 最初のリクエストが接続の確立やスクリプトの読み込みを待たないよう、起動時に済ませる
+                await self._warm_up_storage(scope)
             return message
 
         try:
@@ -336,6 +523,157 @@ class ResponseBandwidthLimiterMiddleware:
                 if evaluator_storage is not None and callable(getattr(evaluator_storage, "close", None)):
                     await evaluator_storage.close()
 
+    async def _warm_up_storage(self, scope: Scope) -> None:
+        limiter = self._get_limiter(scope.get("app", self.app))
+        try:
+            if limiter is not None and hasattr(limiter, "warm_up"):
+                await limiter.warm_up()
+                return
+            evaluator_storage = getattr(self.policy_evaluator, "storage", None)
+            if evaluator_storage is not None and callable(getattr(evaluator_storage, "warm_up", None)):
+                await evaluator_storage.warm_up()
+        except Exception:
+            logger.warning("Storage warm-up failed. Continuing startup.", exc_info=True)
+
+    async def _prepare_limited_response(
+        self,
+        scope: Scope,
+        limiter: Any,
+        handler_name: str,
+        ip_allowed: bool,
+    ) -> tuple[Optional[Response], Optional[int]]:
+        """
+        ハンドラーに対するポリシー判定を行い、早期レスポンスまたは適用する帯域を返す
+
+        Returns:
+            (早期レスポンス, 帯域制限値) のタプル。どちらも None の場合は制限なし
+        """
+        snapshot = limiter.snapshot
+        handler_name = self._qualify_handler_name(snapshot, handler_name, scope)
+        route_limit = snapshot.route_limits.get(handler_name)
+        plan = snapshot.route_plans.get(handler_name)
+        if self.shutdown_coordinator.is_shutting_down and (route_limit is not None or plan is not None):
+            return self._build_shutdown_response(), None
+
+        decision = None
+        if plan is not None:
+            try:
+                scope_identifiers = self._resolve_scope_identifiers(scope, plan.scopes, limiter, snapshot.scope_resolvers)
+            except ValueError:
+                logger.error(
+                    "Scope resolution failed for handler %r. Returning 503.",
+                    handler_name,
+                    exc_info=True,
+                )
+                return self._build_backend_unavailable_response(), None
+            try:
+                matched_rule = None if ip_allowed else await self._evaluate_policy_rules(handler_name, plan, scope_identifiers, scope)
+            except StorageUnavailableError:
+                return self._build_backend_unavailable_response(), None
+            if matched_rule is not None:
+                decision = matched_rule.decision or matched_rule.rule.action.decide(matched_rule.retry_after)
+                if decision.reject:
+                    await self._record_rejection(scope, limiter)
+                    return self._build_reject_response(decision), None
+                if decision.pre_delay > 0:
+                    await asyncio.sleep(decision.pre_delay)
+
+        max_rate = route_limit
+        if decision is not None and decision.throttle_rate is not None:
+            max_rate = decision.throttle_rate
+        return None, max_rate
+
+    def _qualify_handler_name(self, snapshot: Any, handler_name: str, scope: Scope) -> str:
+        if handler_name not in snapshot.qualified_variants:
+            return handler_name
+        host = _get_request_host(scope) if snapshot.host_qualified else None
+        return snapshot.qualify(handler_name, scope.get("method"), host)
+
+    def _should_abort(self) -> bool:
+        return self.shutdown_coordinator.should_abort
+
+    def _should_poll(self) -> bool:
+        return self.shutdown_coordinator.is_shutting_down
+
+    def _build_limited_send(self, send: Send, max_rate: int) -> Send:
+        return _LimitedSend(self, send, max_rate)
+
+    async def _call_after_routing(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        limiter: Any,
+        ip_allowed: bool,
+    ) -> None:
+        """
+        フックのないアプリ (Mount 先のアプリなど) に届きうるリクエストを処理する
+
+        フックのあるルートでは、フックがエンドポイントの実行前に判定する。
+        フックを通らない場合は、ルーティング後の最初の receive / send まで遅延される。
+        """
+        state: dict[str, Any] = {"task": None, "limited_send": None, "replaced": False, "entered": False}
+
+        async def decide() -> tuple[Optional[Response], Optional[int]]:
+            handler_name = self._resolve_routed_handler_name(scope, limiter)
+            if handler_name is None:
+                return None, None
+            return await self._prepare_limited_response(scope, limiter, handler_name, ip_allowed)
+
+        async def ensure_decision() -> bool:
+            task = state["task"]
+            if task is None:
+                task = asyncio.ensure_future(decide())
+                state["task"] = task
+            early_response, max_rate = await task
+
+            if early_response is not None:
+                if not state["replaced"]:
+                    state["replaced"] = True
+                    await early_response(scope, receive, send)
+                return False
+
+            if max_rate is not None and state["limited_send"] is None:
+                self.shutdown_coordinator.enter_response()
+                state["entered"] = True
+                state["limited_send"] = self._build_limited_send(send, max_rate)
+            return True
+
+        scope[ROUTED_DECISION_SCOPE_KEY] = ensure_decision
+
+        async def receive_after_routing() -> Message:
+            if not await ensure_decision():
+                return {"type": "http.disconnect"}
+            return await receive()
+
+        async def send_after_routing(message: Message) -> None:
+            if not await ensure_decision():
+                return
+            limited_send = state["limited_send"]
+            if limited_send is None:
+                await send(message)
+                return
+            await limited_send(message)
+
+        try:
+            await self.app(scope, receive_after_routing, send_after_routing)
+        except StreamingAbortedError:
+            return
+        except Exception:
+            # 置き換えレスポンス送信後にエンドポイントが切断を受けて失敗した場合は無視する
+            if state["replaced"]:
+                return
+            raise
+        finally:
+            if state["entered"]:
+                self.shutdown_coordinator.exit_response()
+
+    def _resolve_routed_handler_name(self, scope: Scope, limiter: Any) -> Optional[str]:
+        handler_name = limiter.get_route_index(scope.get("app", self.app)).resolve_routed(scope)
+        if handler_name is None:
+            handler_name = limiter.snapshot.path_patterns.match(scope["path"])
+        return handler_name
+
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         if scope["type"] == "lifespan":
             await self._handle_lifespan(scope, receive, send)
@@ -345,106 +683,231 @@ class ResponseBandwidthLimiterMiddleware:
             await self.app(scope, receive, send)
             return
 
-        request = Request(scope)
         app = scope.get("app", self.app)
         limiter = self._get_limiter(app)
         if limiter is None:
             await self.app(scope, receive, send)
             return
 
+        # 有効なバイパストークンを持つリクエストは IP 制御とポリシー判定を行わない
+        bypass = self._resolve_bypass(scope, limiter)
+        if bypass is not None and bypass.lift_bandwidth:
+            await self.app(scope, receive, send)
+            return
+
         ip_manager = self.ip_manager or getattr(limiter, "ip_manager", None)
-        client_ip = self._get_client_ip(request, getattr(limiter, "trusted_proxy_headers", False))
-        if ip_manager is not None and client_ip is not None:
+        ip_control_active = False
+        if ip_manager is not None and bypass is None:
             try:
-                if await ip_manager.is_blocked(client_ip):
-                    response = self._build_blocked_ip_response()
-                    await response(scope, receive, send)
-                    return
-                ip_allowed = await ip_manager.is_allowed(client_ip)
+                ip_control_active = await ip_manager.has_control_entries()
             except StorageUnavailableError:
-                response = self._build_backend_unavailable_response()
-                await response(scope, receive, send)
+                ip_control_active = True
+
+        handler_name = None
+        if self.route_resolution == "middleware":
+            handler_name = limiter.get_route_index(app).resolve(scope, scope["path"])
+            if handler_name is None:
+                handler_name = limiter.snapshot.path_patterns.match(scope["path"])
+            # 制限対象外のルートで IP 制御データもなければ、何もせずに通過させる
+            if handler_name is None and not ip_control_active:
+                await self.app(scope, receive, send)
                 return
-        else:
-            ip_allowed = False
 
-        path = scope["path"]
-        handler_name = self.get_handler_name(request, path)
+        ip_allowed = bypass is not None
+        if ip_manager is not None and ip_control_active:
+            early_response, ip_allowed = await self._check_ip_control(scope, limiter, ip_manager)
+            if early_response is not None:
+                await early_response(scope, receive, send)
+                return
 
-        if handler_name is None:
+        if self.route_resolution == "router":
+            limiter.install_route_hooks(app)
+            if limiter.may_reach_unhooked_app(scope):
+                await self._call_after_routing(scope, receive, send, limiter, ip_allowed)
+                return
+            # 判定はフックが行う。制限のないルートではフックが何もせずに通過させる
+            scope[ROUTED_CONTEXT_SCOPE_KEY] = (self, limiter, ip_allowed)
             await self.app(scope, receive, send)
             return
 
-        route_limit = limiter.get_limit(handler_name)
-        rules = limiter.get_rules(handler_name)
-        if self.shutdown_coordinator.is_shutting_down and (route_limit is not None or rules):
-            response = self._build_shutdown_response()
-            await response(scope, receive, send)
+        if handler_name is None:
+            await self.app(scope, receive, send)
             return
 
-        decision = None
-        if rules:
-            try:
-                scope_identifiers = self._resolve_scope_identifiers(request, rules, limiter)
-            except ValueError:
-                logger.error(
-                    "Scope resolution failed for handler %r. Returning 503.",
-                    handler_name,
-                    exc_info=True,
-                )
-                response = self._build_backend_unavailable_response()
-                await response(scope, receive, send)
-                return
-            try:
-                matched_rule = None if ip_allowed else await self._evaluate_policy_rules(handler_name, rules, scope_identifiers)
-            except StorageUnavailableError:
-                response = self._build_backend_unavailable_response()
-                await response(scope, receive, send)
-                return
-            if matched_rule is not None:
-                decision = matched_rule.rule.action.decide(matched_rule.retry_after)
-                if decision.reject:
-                    response = self._build_reject_response(decision)
-                    await response(scope, receive, send)
-                    return
-                if decision.pre_delay > 0:
-                    await asyncio.sleep(decision.pre_delay)
+        await self._call_limited(scope, receive, send, limiter, handler_name, ip_allowed)
 
-        max_rate = route_limit
-        if decision is not None and decision.throttle_rate is not None:
-            max_rate = decision.throttle_rate
+    async def _check_ip_control(
+        self,
+        scope: Scope,
+        limiter: Any,
+        ip_manager: IPManager,
+    ) -> tuple[Optional[Response], bool]:
+        """
+        IP のブロック・許可リストを確認する
 
-        if max_rate is None:
-            await self.app(scope, receive, send)
-            return
+        Returns:
+            (早期レスポンス, 許可リストに含まれるか) のタプル
+        """
+        address = self._resolve_limiter_client(scope, limiter).address
+        if address is None:
+            return None, False
+        try:
+            status = await ip_manager.get_status(address)
+        except StorageUnavailableError:
+            return self._build_backend_unavailable_response(), False
+        if status.blocked:
+            return self._build_blocked_ip_response(), False
+        return None, status.allowed
+
+    def _resolve_bypass(self, scope: Scope, limiter: Any) -> Optional[BypassGrant]:
+        """
+        バイパストークンのヘッダーを検証し、有効なら BypassGrant を返す
 
-        abort_check = lambda: self.shutdown_coordinator.should_abort
-        poll_check = lambda: self.shutdown_coordinator.is_shutting_down
+        署名の検証はローカルの HMAC 計算だけで行い、結果は scope にキャッシュする。
+        """
+        bypass_tokens = getattr(limiter, "bypass_tokens", None)
+        if bypass_tokens is None:
+            return None
+        cached = scope.get(BYPASS_SCOPE_KEY)
+        if cached is not None and cached[0] is bypass_tokens:
+            return cached[1]
+
+        grant = None
+        header_name = bypass_tokens.header_name
+        for name, value in scope.get("headers", ()):
+            if name == header_name:
+                grant = bypass_tokens.verify(value.decode("latin-1"))
+                break
+        scope[BYPASS_SCOPE_KEY] = (bypass_tokens, grant)
+        return grant
+
+    async def _record_rejection(self, scope: Scope, limiter: Any) -> None:
+        """ban_escalation が設定されていれば Reject を数え、回数に達したクライアントをブロックする"""
+        ip_manager = self.ip_manager or getattr(limiter, "ip_manager", None)
+        if ip_manager is None or ip_manager.ban_escalation is None:
+            return
+        address = self._resolve_limiter_client(scope, limiter).address
+        if address is None:
+            return
+        try:
+            duration = await ip_manager.record_rejection(address)
+        except StorageUnavailableError:
+            logger.warning("Could not record a rejection for ban escalation.", exc_info=True)
+            return
+        if duration is not None:
+            logger.info("Blocked %s for %d seconds after repeated rejections.", address, duration)
 
-        async def send_with_limit(message: Message) -> None:
-            if message["type"] != "http.response.body":
-                await send(message)
-                return
+    async def _call_limited(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        limiter: Any,
+        handler_name: str,
+        ip_allowed: bool,
+        app: Optional[ASGIApp] = None,
+    ) -> None:
+        if app is None:
+            app = self.app
+        early_response, max_rate = await self._prepare_limited_response(scope, limiter, handler_name, ip_allowed)
+        if early_response is not None:
+            await early_response(scope, receive, send)
+            return
 
-            body = message.get("body", b"")
-            if not body:
-                await send(message)
-                return
+        if max_rate is None:
+            await app(scope, receive, send)
+            return
 
-            await self._send_limited_body(
-                send,
-                body,
-                message.get("more_body", False),
-                max_rate,
-                abort_check=abort_check,
-                poll_check=poll_check,
-            )
+        send_with_limit = self._build_limited_send(send, max_rate)
 
         self.shutdown_coordinator.enter_response()
         try:
             try:
-                await self.app(scope, receive, send_with_limit)
+                await app(scope, receive, send_with_limit)
             except StreamingAbortedError:
                 return
         finally:
             self.shutdown_coordinator.exit_response()
+
+
+class IPControlMiddleware(ResponseBandwidthLimiterMiddleware):
+    """
+    IP のブロック・許可リストだけを確認する軽量ミドルウェア
+
+    init_app(app, route_resolution="route") と組み合わせて使う。
+    許可リストに含まれる IP は、ルート単位のラッパーで request count policy の評価を省略する。
+    """
+
+    def __init__(self, app: ASGIApp, ip_manager: Optional[IPManager] = None):
+        super().__init__(app, ip_manager=ip_manager, install_signal_handlers=False)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self._get_limiter(scope.get("app", self.app))
+        if limiter is not None and self._resolve_bypass(scope, limiter) is not None:
+            scope[IP_ALLOWED_SCOPE_KEY] = True
+            await self.app(scope, receive, send)
+            return
+
+        ip_manager = self.ip_manager or getattr(limiter, "ip_manager", None)
+        if ip_manager is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            ip_control_active = await ip_manager.has_control_entries()
+        except StorageUnavailableError:
+            ip_control_active = True
+        if not ip_control_active:
+            await self.app(scope, receive, send)
+            return
+
+        early_response, ip_allowed = await self._check_ip_control(scope, limiter, ip_manager)
+        if early_response is not None:
+            await early_response(scope, receive, send)
+            return
+        if ip_allowed:
+            scope[IP_ALLOWED_SCOPE_KEY] = True
+        await self.app(scope, receive, send)
+
+
+def _parse_address(value: Optional[str]) -> Optional[IPAddress]:
+    if value is None:
+        return None
+    candidate = value.strip()
+    if not candidate:
+        return None
+    try:
+        return ip_address(candidate)
+    except ValueError:
+        return None
+
+
+def _parse_forwarded_for(value: str) -> list[Optional[IPAddress]]:
+    """RFC 7239 の Forwarded ヘッダーから、要素ごとの for= のアドレスを取り出す"""
+    hops: list[Optional[IPAddress]] = []
+    for element in value.split(","):
+        node: Optional[str] = None
+        for pair in element.split(";"):
+            name, separator, pair_value = pair.partition("=")
+            if separator and name.strip().lower() == "for":
+                node = pair_value.strip().strip('"')
+                break
+        hops.append(_parse_forwarded_node(node))
+    return hops
+
+
+def _parse_forwarded_node(node: Optional[str]) -> Optional[IPAddress]:
+    # "unknown" や "_hidden" のような難読化された識別子は解析できないホップとして扱う
+    if not node:
+        return None
+    if node.startswith("["):
+        host, _, _ = node[1:].partition("]")
+        return _parse_address(host)
+    host, separator, port = node.rpartition(":")
+    if separator and host and ":" not in host and port.isdigit():
+        return _parse_address(host)
+    return _parse_address(node)
@@ -1,10 +1,16 @@
+import inspect
 from datetime import timedelta
 from dataclasses import dataclass
-from typing import Any, Protocol, runtime_checkable
+from typing import Any, Callable, Literal, Mapping, Optional, Protocol, runtime_checkable
 
 
 VALID_PERIODS = {"second": 1, "minute": 60, "hour": 3600}
 
+RulePredicate = Callable[[Mapping[str, Any]], bool]
+
+RuleAlgorithm = Literal["sliding-window", "gcra", "token-bucket"]
+RULE_ALGORITHMS = ("sliding-window", "gcra", "token-bucket")
+
 
 def _resolve_window_seconds(period: str | timedelta) -> int:
     if isinstance(period, str):
@@ -145,6 +151,9 @@ class Rule:
     per: str | timedelta
     action: Action
     scope: str = "ip"
+    when: Optional[RulePredicate] = None
+    algorithm: RuleAlgorithm = "sliding-window"
+    burst: Optional[int] = None
 
     def __post_init__(self) -> None:
         if not isinstance(self.count, int):
@@ -160,7 +169,25 @@ class Rule:
         object.__setattr__(self, "scope", normalized_scope)
         if not isinstance(self.action, ActionProtocol):
             raise TypeError("action must implement ActionProtocol.")
+        if self.when is not None:
+            if not callable(self.when):
+                raise TypeError("when must be callable.")
+            if inspect.iscoroutinefunction(self.when) or inspect.iscoroutinefunction(getattr(self.when, "__call__", None)):
+                raise TypeError("when must be synchronous.")
+        if self.algorithm not in RULE_ALGORITHMS:
+            raise ValueError("algorithm must be one of sliding-window, gcra, token-bucket.")
+        if self.burst is not None:
+            if self.algorithm != "token-bucket":
+                raise ValueError("burst is only supported by token-bucket rules.")
+            if not isinstance(self.burst, int) or isinstance(self.burst, bool):
+                raise TypeError("burst must be an integer.")
+            if self.burst <= 0:
+                raise ValueError("burst must be greater than 0.")
 
     @property
     def window_seconds(self) -> int:
-        return _resolve_window_seconds(self.per)
\ No newline at end of file
+        return _resolve_window_seconds(self.per)
+
+    @property
+    def bucket_size(self) -> int:
+        return self.count if self.burst is None else self.burst
\ No newline at end of file
@@ -0,0 +1,72 @@
+from ipaddress import IPv4Address, IPv4Network, IPv6Address, IPv6Network, ip_address
+from typing import Generic, Iterable, Optional, TypeVar
+
+
+ValueT = TypeVar("ValueT")
+
+IPNetwork = IPv4Network | IPv6Network
+IPAddress = IPv4Address | IPv6Address
+
+
+class _TrieNode(Generic[ValueT]):
+    __slots__ = ("children", "value")
+
+    def __init__(self) -> None:
+        self.children: list[Optional["_TrieNode[ValueT]"]] = [None, None]
+        self.value: Optional[ValueT] = None
+
+
+class NetworkTrie(Generic[ValueT]):
+    """
+    Binary prefix trie of IPv4 and IPv6 networks.
+
+    Each network is stored at the depth of its prefix length, so a membership
+    check walks at most 32 (IPv4) or 128 (IPv6) nodes regardless of how many
+    networks are stored. The most specific network containing the address wins.
+    """
+
+    __slots__ = ("_roots", "_size")
+
+    def __init__(self, entries: Iterable[tuple[IPNetwork, ValueT]] = ()):
+        self._roots: dict[int, _TrieNode[ValueT]] = {4: _TrieNode(), 6: _TrieNode()}
+        self._size = 0
+        for network, value in entries:
+            self.insert(network, value)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def insert(self, network: IPNetwork, value: ValueT) -> None:
+        node = self._roots[network.version]
+        address = int(network.network_address)
+        max_length = network.max_prefixlen
+        for depth in range(network.prefixlen):
+            bit = (address >> (max_length - 1 - depth)) & 1
+            child = node.children[bit]
+            if child is None:
+                child = _TrieNode()
+                node.children[bit] = child
+            node = child
+        if node.value is None:
+            self._size += 1
+        node.value = value
+
+    def match(self, address: IPAddress | str) -> Optional[ValueT]:
+        if isinstance(address, str):
+            address = ip_address(address)
+        node: Optional[_TrieNode[ValueT]] = self._roots[address.version]
+        value = None
+        packed = int(address)
+        max_length = address.max_prefixlen
+        depth = 0
+        while node is not None:
+            if node.value is not None:
+                value = node.value
+            if depth == max_length:
+                break
+            node = node.children[(packed >> (max_length - 1 - depth)) & 1]
+            depth += 1
+        return value
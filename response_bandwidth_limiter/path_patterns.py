@@ -0,0 +1,119 @@
+import re
+from fnmatch import translate
+from typing import Iterable, Optional, Pattern
+
+
+_GLOB_CHARACTERS = "*?["
+
+
+def is_glob_pattern(pattern: str) -> bool:
+    return any(character in pattern for character in _GLOB_CHARACTERS)
+
+
+def _literal_prefix(pattern: str) -> str:
+    for index, character in enumerate(pattern):
+        if character in _GLOB_CHARACTERS:
+            return pattern[:index]
+    return pattern
+
+
+class _TrieNode:
+    __slots__ = ("edges", "prefix_name", "globs")
+
+    def __init__(self) -> None:
+        self.edges: dict[str, tuple[str, "_TrieNode"]] = {}
+        self.prefix_name: Optional[str] = None
+        self.globs: list[tuple[Pattern[str], str]] = []
+
+
+class PathPatternTrie:
+    """
+    Compiled radix trie of path prefixes and glob patterns.
+
+    Plain patterns match any path that starts with them. Patterns containing
+    glob wildcards (``*``, ``?``, ``[...]``) must match the whole path; their
+    literal part before the first wildcard is stored in the trie so only globs
+    sharing a prefix with the request path are tested. Lookup cost depends on
+    the path length, not on the number of patterns, and the longest literal
+    prefix wins. At the same depth a glob wins over a plain prefix.
+    """
+
+    __slots__ = ("_root", "_patterns")
+
+    def __init__(self, patterns: Iterable[str] = ()):
+        self._root = _TrieNode()
+        self._patterns = frozenset(patterns)
+        for pattern in sorted(self._patterns):
+            self._insert(pattern)
+
+    @property
+    def patterns(self) -> frozenset[str]:
+        return self._patterns
+
+    def __bool__(self) -> bool:
+        return bool(self._patterns)
+
+    def match(self, path: str) -> Optional[str]:
+        if not self._patterns:
+            return None
+
+        matched: Optional[str] = None
+        node = self._root
+        position = 0
+        path_length = len(path)
+
+        while True:
+            if node.prefix_name is not None:
+                matched = node.prefix_name
+            for regex, name in node.globs:
+                if regex.match(path):
+                    matched = name
+                    break
+
+            if position >= path_length:
+                return matched
+            edge = node.edges.get(path[position])
+            if edge is None:
+                return matched
+            label, child = edge
+            if not path.startswith(label, position):
+                return matched
+            position += len(label)
+            node = child
+
+    def _insert(self, pattern: str) -> None:
+        literal = _literal_prefix(pattern)
+        node = self._node_for(literal)
+        if is_glob_pattern(pattern):
+            node.globs.append((re.compile(translate(pattern)), pattern))
+        else:
+            node.prefix_name = pattern
+
+    def _node_for(self, literal: str) -> _TrieNode:
+        node = self._root
+        remaining = literal
+
+        while remaining:
+            edge = node.edges.get(remaining[0])
+            if edge is None:
+                child = _TrieNode()
+                node.edges[remaining[0]] = (remaining, child)
+                return child
+
+            label, child = edge
+            common = 0
+            limit = min(len(label), len(remaining))
+            while common < limit and label[common] == remaining[common]:
+                common += 1
+
+            if common < len(label):
+                # 既存のエッジを共通部分で分割する
+                split = _TrieNode()
+                split.edges[label[common]] = (label[common:], child)
+                node.edges[remaining[0]] = (label[:common], split)
+                child = split
+
+            node = child
+            remaining = remaining[common:]
+
+        return node
@@ -1,26 +1,75 @@
+import asyncio
+import logging
 import math
 from dataclasses import dataclass
-from typing import Callable, Deque, Dict, List, Mapping, Optional, Tuple
+from typing import Any, Awaitable, Callable, Deque, Dict, Mapping, Optional, Sequence, Tuple
 
-from .storage import InMemoryStorage, SlidingWindowResult, Storage
-from .models import Rule
+from .storage import HitRequest, InMemoryStorage, RateLimitResult, SlidingWindowResult, Storage
+from .models import PolicyDecision, Rule, RulePredicate
 
 
-@dataclass(frozen=True)
-class MatchedPolicy:
-    rule: Rule
-    retry_after: int
-
+logger = logging.getLogger(__name__)
 
 @dataclass(frozen=True)
-class _CandidateAction:
+class MatchedPolicy:
     rule: Rule
     retry_after: int
-    order: int
-
-    @property
-    def sort_tuple(self) -> tuple[int, int | float, int]:
-        return (self.rule.action.priority, self.rule.action.sort_key, self.order)
+    decision: PolicyDecision | None = None
+
+
+class RulePlan:
+    """
+    Precompiled evaluation plan for one handler's rules.
+
+    Window lengths, the scopes that must be resolved, the ``when`` predicates,
+    and the priority rank of each rule are computed once when the policy is
+    configured. Decisions are
+    memoized per rule and retry-after value, because actions return immutable
+    PolicyDecision instances.
+    """
+
+    __slots__ = (
+        "rules",
+        "counts",
+        "window_seconds",
+        "rule_scopes",
+        "scopes",
+        "predicates",
+        "algorithms",
+        "bursts",
+        "ranks",
+        "_decisions",
+    )
+
+    def __init__(self, rules: Sequence[Rule]):
+        self.rules: tuple[Rule, ...] = tuple(rules)
+        self.counts: tuple[int, ...] = tuple(rule.count for rule in self.rules)
+        self.window_seconds: tuple[int, ...] = tuple(rule.window_seconds for rule in self.rules)
+        self.rule_scopes: tuple[str, ...] = tuple(rule.scope for rule in self.rules)
+        self.scopes: tuple[str, ...] = tuple(dict.fromkeys(self.rule_scopes))
+        self.predicates: tuple[Optional[RulePredicate], ...] = tuple(rule.when for rule in self.rules)
+        self.algorithms: tuple[str, ...] = tuple(rule.algorithm for rule in self.rules)
+        self.bursts: tuple[int, ...] = tuple(rule.bucket_size for rule in self.rules)
+        order = sorted(
+            range(len(self.rules)),
+            key=lambda index: (self.rules[index].action.priority, self.rules[index].action.sort_key, index),
+        )
+        ranks = [0] * len(self.rules)
+        for rank, index in enumerate(order):
+            ranks[index] = rank
+        self.ranks: tuple[int, ...] = tuple(ranks)
+        self._decisions: tuple[Dict[int, PolicyDecision], ...] = tuple({} for _ in self.rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def decide(self, rule_index: int, retry_after: int) -> PolicyDecision:
+        decisions = self._decisions[rule_index]
+        decision = decisions.get(retry_after)
+        if decision is None:
+            decision = self.rules[rule_index].action.decide(retry_after)
+            decisions[retry_after] = decision
+        return decision
 
 
 class PolicyEvaluator:
@@ -45,43 +94,118 @@ class PolicyEvaluator:
             return {}
         return dict(counters)
 
+    @staticmethod
+    def compile(rules: Sequence[Rule]) -> RulePlan:
+        return RulePlan(rules)
+
     async def evaluate(
         self,
         scope_identifiers: Mapping[str, str],
         handler_name: str,
-        rules: List[Rule],
+        rules: Sequence[Rule] | RulePlan,
+        request_scope: Optional[Mapping[str, Any]] = None,
     ) -> Optional[MatchedPolicy]:
-        matched_actions: List[_CandidateAction] = []
-
-        for index, rule in enumerate(rules):
-            request_key = scope_identifiers.get(rule.scope)
+        """
+        Count the request against each applicable rule and return the strongest exceeded one.
+
+        Rules with a ``when`` predicate are skipped when the predicate returns
+        False for ``request_scope``, so non-matching requests cost no storage
+        operation. Without ``request_scope`` the predicate cannot be checked,
+        and the rule is counted so that it never silently stops limiting. The applicable sliding-window rules are counted
+        with a single ``Storage.record_hits()`` call, concurrently with one
+        ``Storage.record_gcra()`` or ``Storage.record_token_bucket()`` call per
+        GCRA or token-bucket rule.
+        """
+        plan = rules if isinstance(rules, RulePlan) else RulePlan(rules)
+        indexes: list[int] = []
+        hits: list[HitRequest] = []
+        rate_indexes: list[int] = []
+        rate_keys: list[str] = []
+
+        for index in range(len(plan.rules)):
+            predicate = plan.predicates[index]
+            if predicate is not None and not self._rule_applies(predicate, request_scope):
+                continue
+            request_key = scope_identifiers.get(plan.rule_scopes[index])
             if request_key is None:
-                raise ValueError(f"No identifier was resolved for scope {rule.scope!r}.")
-            hit_result = await self._storage.record_hit(request_key, handler_name, index, rule.window_seconds)
-            if hit_result.hit_count > rule.count:
-                retry_after = self._retry_after_seconds(
-                    hit_result.oldest_timestamp,
-                    hit_result.current_timestamp,
-                    rule.window_seconds,
-                )
-                matched_actions.append(_CandidateAction(rule=rule, retry_after=retry_after, order=index))
-
-        selected = self._select_rule_action(matched_actions)
-        if selected is None:
+                raise ValueError(f"No identifier was resolved for scope {plan.rule_scopes[index]!r}.")
+            if plan.algorithms[index] != "sliding-window":
+                rate_indexes.append(index)
+                rate_keys.append(request_key)
+                continue
+            indexes.append(index)
+            hits.append((request_key, handler_name, index, plan.window_seconds[index]))
+
+        if not hits and not rate_indexes:
             return None
 
-        rule, retry_after = selected
-        return MatchedPolicy(rule=rule, retry_after=retry_after)
-
-    def _select_rule_action(self, matched_actions: List[_CandidateAction]) -> Optional[Tuple[Rule, int]]:
-        if not matched_actions:
+        exceeded = await self._count_hits(plan, handler_name, indexes, hits, rate_indexes, rate_keys)
+        selected_index = -1
+        selected_rank = 0
+        selected_retry_after = 0
+        for index, retry_after in exceeded:
+            rank = plan.ranks[index]
+            if selected_index >= 0 and rank >= selected_rank:
+                continue
+            selected_index = index
+            selected_rank = rank
+            selected_retry_after = retry_after
+
+        if selected_index < 0:
             return None
 
-        selected = min(matched_actions, key=lambda item: item.sort_tuple)
-        return selected.rule, selected.retry_after
+        return MatchedPolicy(
+            rule=plan.rules[selected_index],
+            retry_after=selected_retry_after,
+            decision=plan.decide(selected_index, selected_retry_after),
+        )
 
-    def _retry_after_seconds(self, oldest_timestamp: float | None, now: float, window_seconds: int) -> int:
-        if oldest_timestamp is None:
-            return 1
-        retry_after = window_seconds - (now - oldest_timestamp)
-        return max(1, math.ceil(retry_after))
+    async def _count_hits(
+        self,
+        plan: RulePlan,
+        handler_name: str,
+        indexes: Sequence[int],
+        hits: Sequence[HitRequest],
+        rate_indexes: Sequence[int],
+        rate_keys: Sequence[str],
+    ) -> list[tuple[int, int]]:
+        """Count the request against every rule and return (rule index, retry-after) of the exceeded ones."""
+        calls = [
+            self._record_rate(plan, handler_name, index, request_key)
+            for index, request_key in zip(rate_indexes, rate_keys)
+        ]
+        if hits:
+            calls.append(self._storage.record_hits(hits))
+        results = await asyncio.gather(*calls) if len(calls) > 1 else [await calls[0]]
+
+        exceeded: list[tuple[int, int]] = []
+        for index, rate_result in zip(rate_indexes, results):
+            if not rate_result.allowed:
+                exceeded.append((index, max(1, math.ceil(rate_result.retry_after))))
+        if hits:
+            for index, hit_result in zip(indexes, results[-1]):
+                if hit_result.hit_count <= plan.counts[index]:
+                    continue
+                exceeded.append((index, hit_result.retry_after(plan.counts[index], plan.window_seconds[index])))
+        return exceeded
+
+    def _record_rate(self, plan: RulePlan, handler_name: str, index: int, request_key: str) -> Awaitable[RateLimitResult]:
+        if plan.algorithms[index] == "token-bucket":
+            return self._storage.record_token_bucket(
+                request_key,
+                handler_name,
+                index,
+                plan.counts[index],
+                plan.window_seconds[index],
+                plan.bursts[index],
+            )
+        return self._storage.record_gcra(request_key, handler_name, index, plan.counts[index], plan.window_seconds[index])
+
+    def _rule_applies(self, predicate: RulePredicate, request_scope: Optional[Mapping[str, Any]]) -> bool:
+        if request_scope is None:
+            return True
+        try:
+            return bool(predicate(request_scope))
+        except Exception:
+            logger.warning("Rule predicate raised an exception. Counting the request.", exc_info=True)
+            return True
@@ -0,0 +1,79 @@
+from typing import Any, Mapping, Optional
+
+from .models import RulePredicate
+
+
+def method_in(*methods: str) -> RulePredicate:
+    """指定した HTTP メソッドのリクエストだけに Rule を適用する述語を返す"""
+    if not methods or not all(isinstance(method, str) and method.strip() for method in methods):
+        raise ValueError("methods must contain at least one non-empty string.")
+    normalized_methods = frozenset(method.strip().upper() for method in methods)
+
+    def predicate(scope: Mapping[str, Any]) -> bool:
+        return scope.get("method") in normalized_methods
+
+    return predicate
+
+
+def has_header(name: str) -> RulePredicate:
+    """指定したヘッダーを持つリクエストだけに Rule を適用する述語を返す"""
+    header_name = _normalize_header_name(name)
+
+    def predicate(scope: Mapping[str, Any]) -> bool:
+        return _find_header(scope, header_name)
+
+    return predicate
+
+
+def missing_header(name: str) -> RulePredicate:
+    """
+    指定したヘッダーを持たないリクエストだけに Rule を適用する述語を返す
+
+    Example:
+        Rule(count=10, per="minute", action=Reject(), when=missing_header("authorization"))
+    """
+    header_name = _normalize_header_name(name)
+
+    def predicate(scope: Mapping[str, Any]) -> bool:
+        return not _find_header(scope, header_name)
+
+    return predicate
+
+
+def query_flag(name: str, value: Optional[str] = None) -> RulePredicate:
+    """
+    クエリパラメーターを持つリクエストだけに Rule を適用する述語を返す
+
+    value を指定した場合は、その値と一致するときだけ適用する。
+    """
+    if not isinstance(name, str) or not name:
+        raise ValueError("name must be a non-empty string.")
+    encoded_name = name.encode("latin-1")
+    encoded_value = value.encode("latin-1") if value is not None else None
+
+    def predicate(scope: Mapping[str, Any]) -> bool:
+        query_string = scope.get("query_string", b"")
+        if not query_string:
+            return False
+        for pair in query_string.split(b"&"):
+            key, separator, pair_value = pair.partition(b"=")
+            if key != encoded_name:
+                continue
+            if encoded_value is None or (separator and pair_value == encoded_value):
+                return True
+        return False
+
+    return predicate
+
+
+def _normalize_header_name(name: str) -> bytes:
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("header name must be a non-empty string.")
+    return name.strip().lower().encode("latin-1")
+
+
+def _find_header(scope: Mapping[str, Any], header_name: bytes) -> bool:
+    for name, _ in scope.get("headers", ()):
+        if name == header_name:
+            return True
+    return False
@@ -1,24 +1,41 @@
+import asyncio
 import hashlib
 import json
+import logging
 import threading
 import time
 import uuid
-from typing import Any, Literal
-
-from .storage import InMemoryStorage, SlidingWindowResult, Storage, StorageUnavailableError
+from typing import Any, AsyncIterator, Iterable, Literal, Mapping, Sequence
+
+from .storage import (
+    HitRequest,
+    InMemoryStorage,
+    InvalidationListener,
+    RateLimitResult,
+    SlidingWindowResult,
+    Storage,
+    StorageUnavailableError,
+    _set_bitmap_bits,
+)
 
 try:
     from redis.asyncio import Redis
+    from redis.client import NEVER_DECODE
+    from redis.exceptions import NoScriptError
 except ImportError as exc:
     raise ImportError(
         "RedisStorage requires the optional redis dependency. Install it with `pip install response-bandwidth-limiter[redis]`."
     ) from exc
 
 
+logger = logging.getLogger(__name__)
+
 FailureMode = Literal["open", "closed", "local-memory-fallback"]
 ControlFailureMode = Literal["closed", "local-memory-fallback"]
 
 _JSON_PREFIX = "__rbl_json__:"
+# Larger updates upload a bitmap and merge it with BITOP OR instead of sending one SETBIT per bit.
+_SETBIT_BATCH_LIMIT = 4096
 
 SLIDING_WINDOW_SCRIPT = """
 local current_time = redis.call("TIME")
@@ -41,6 +58,85 @@ end
 return {hit_count, "", tostring(now)}
 """
 
+# Updates every window of one request at a single timestamp.
+# ARGV[1] is the member to add and ARGV[i + 1] is the window of KEYS[i].
+# Returns hit count and oldest score per key, followed by the current time.
+MULTI_SLIDING_WINDOW_SCRIPT = """
+local current_time = redis.call("TIME")
+local now = tonumber(current_time[1]) + (tonumber(current_time[2]) / 1000000)
+local results = {}
+
+for index, key in ipairs(KEYS) do
+    local window_seconds = tonumber(ARGV[index + 1])
+    redis.call("ZREMRANGEBYSCORE", key, "-inf", now - window_seconds)
+    redis.call("ZADD", key, now, ARGV[1])
+
+    local oldest = redis.call("ZRANGE", key, 0, 0, "WITHSCORES")
+    results[#results + 1] = redis.call("ZCARD", key)
+    results[#results + 1] = oldest[2] and tostring(oldest[2]) or ""
+
+    redis.call("EXPIRE", key, math.max(1, math.ceil(window_seconds)))
+end
+
+results[#results + 1] = tostring(now)
+return results
+"""
+
+# Generic cell rate algorithm: KEYS[1] holds the theoretical arrival time.
+# ARGV[1] is the period in seconds and ARGV[2] the number of requests allowed in it.
+# Returns {allowed, remaining, retry_after}; rejected requests leave the key unchanged.
+GCRA_SCRIPT = """
+local current_time = redis.call("TIME")
+local now = tonumber(current_time[1]) + (tonumber(current_time[2]) / 1000000)
+local period = tonumber(ARGV[1])
+local interval = period / tonumber(ARGV[2])
+
+local tat = tonumber(redis.call("GET", KEYS[1]))
+if not tat or tat < now then
+    tat = now
+end
+
+local new_tat = tat + interval
+local allow_at = new_tat - period
+if now < allow_at then
+    return {0, 0, tostring(allow_at - now)}
+end
+
+redis.call("SET", KEYS[1], tostring(new_tat), "PX", math.max(1, math.ceil((new_tat - now) * 1000)))
+return {1, math.floor((period - (new_tat - now)) / interval + 1e-9), "0"}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local current_time = redis.call("TIME")
+local now = tonumber(current_time[1]) + (tonumber(current_time[2]) / 1000000)
+local rate = tonumber(ARGV[2]) / tonumber(ARGV[1])
+local burst = tonumber(ARGV[3])
+
+local state = redis.call("HMGET", KEYS[1], "tokens", "refilled_at")
+local tokens = tonumber(state[1])
+if tokens then
+    local refilled_at = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - refilled_at) * rate)
+else
+    tokens = burst
+end
+
+if tokens < 1 then
+    return {0, 0, tostring((1 - tokens) / rate)}
+end
+
+tokens = tokens - 1
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "refilled_at", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.max(1, math.ceil((burst - tokens) / rate * 1000)))
+return {1, math.floor(tokens + 1e-9), "0"}
+"""
+
+# Scripts are called by SHA1 so requests do not resend the source; see _run_script().
+_SCRIPT_SHAS = {
+    script: hashlib.sha1(script.encode("utf-8")).hexdigest()
+    for script in (SLIDING_WINDOW_SCRIPT, MULTI_SLIDING_WINDOW_SCRIPT, GCRA_SCRIPT, TOKEN_BUCKET_SCRIPT)
+}
+
 
 class RedisStorage(Storage):
     def __init__(
@@ -53,6 +149,7 @@ class RedisStorage(Storage):
         control_failure_mode: ControlFailureMode = "closed",
         counter_fallback_storage: Storage | None = None,
         control_fallback_storage: Storage | None = None,
+        warm_up_connections: int = 1,
     ):
         if client is None:
             raise ValueError("client は必須です。")
@@ -60,8 +157,11 @@ class RedisStorage(Storage):
             raise ValueError("counter_failure_mode は open, closed, local-memory-fallback のいずれかである必要があります。")
         if control_failure_mode not in {"closed", "local-memory-fallback"}:
             raise ValueError("control_failure_mode は closed, local-memory-fallback のいずれかである必要があります。")
+        if not isinstance(warm_up_connections, int) or isinstance(warm_up_connections, bool) or warm_up_connections < 0:
+            raise ValueError("warm_up_connections must be 0 or greater.")
 
         self._client = client
+        self._warm_up_connections = warm_up_connections
         self._prefix = prefix
         self._key_hash = key_hash
         self._counter_failure_mode = counter_failure_mode
@@ -72,6 +172,8 @@ class RedisStorage(Storage):
         self._closed = False
         self._state_lock = threading.RLock()
         self._handler_generations: dict[str, int] = {}
+        self._invalidation_listeners: list[InvalidationListener] = []
+        self._invalidation_task: asyncio.Task[None] | None = None
 
     @classmethod
     def from_url(
@@ -84,6 +186,7 @@ class RedisStorage(Storage):
         control_failure_mode: ControlFailureMode = "closed",
         counter_fallback_storage: Storage | None = None,
         control_fallback_storage: Storage | None = None,
+        warm_up_connections: int = 1,
         **kwargs: Any,
     ) -> "RedisStorage":
         kwargs.setdefault("decode_responses", True)
@@ -96,6 +199,7 @@ class RedisStorage(Storage):
             control_failure_mode=control_failure_mode,
             counter_fallback_storage=counter_fallback_storage,
             control_fallback_storage=control_fallback_storage,
+            warm_up_connections=warm_up_connections,
         )
 
     async def get(self, key: str) -> Any | None:
@@ -105,12 +209,95 @@ class RedisStorage(Storage):
             return await self._handle_get_failure(key, exc)
         return self._deserialize_value(value)
 
+    async def get_many(self, keys: Sequence[str]) -> list[Any | None]:
+        if not keys:
+            return []
+        try:
+            values = await self._client.mget([self._build_data_key(key) for key in keys])
+        except Exception as exc:
+            return [await self._handle_get_failure(key, exc) for key in keys]
+        return [self._deserialize_value(value) for value in values]
+
     async def set(self, key: str, value: Any, expire: int | None = None) -> None:
         try:
             await self._client.set(self._build_data_key(key), self._serialize_value(value), ex=expire)
         except Exception as exc:
             await self._handle_set_failure(key, value, expire, exc)
 
+    async def set_many(self, items: Mapping[str, Any], expire: int | None = None) -> None:
+        if not items:
+            return
+        try:
+            async with self._client.pipeline(transaction=False) as pipeline:
+                for key, value in items.items():
+                    pipeline.set(self._build_data_key(key), self._serialize_value(value), ex=expire)
+                await pipeline.execute()
+        except Exception as exc:
+            for key, value in items.items():
+                await self._handle_set_failure(key, value, expire, exc)
+
+    async def get_bits(self, key: str) -> bytes | None:
+        try:
+            # Read the bitmap as bytes even when the client uses decode_responses=True.
+            value = await self._client.execute_command("GET", self._build_data_key(key), **{NEVER_DECODE: []})
+        except Exception as exc:
+            return await self._handle_get_bits_failure(key, exc)
+        if value is None:
+            return None
+        return value.encode("latin-1") if isinstance(value, str) else bytes(value)
+
+    async def set_bits(self, key: str, offsets: Iterable[int]) -> None:
+        offsets = list(offsets)
+        if not offsets:
+            return
+        data_key = self._build_data_key(key)
+        try:
+            async with self._client.pipeline(transaction=False) as pipeline:
+                if len(offsets) <= _SETBIT_BATCH_LIMIT:
+                    for offset in offsets:
+                        pipeline.setbit(data_key, offset, 1)
+                else:
+                    merge_key = f"{data_key}:merge:{uuid.uuid4().hex}"
+                    pipeline.set(merge_key, bytes(_set_bitmap_bits(None, offsets)), ex=60)
+                    pipeline.bitop("OR", data_key, data_key, merge_key)
+                    pipeline.delete(merge_key)
+                await pipeline.execute()
+        except Exception as exc:
+            await self._handle_set_bits_failure(key, offsets, exc)
+
+    async def get_fields(self, key: str) -> dict[str, Any]:
+        try:
+            fields = await self._client.hgetall(self._build_data_key(key))
+        except Exception as exc:
+            fallback = self._fields_fallback(key, exc)
+            return {} if fallback is None else await fallback.get_fields(key)
+        return {self._to_text(field): self._deserialize_value(value) for field, value in fields.items()}
+
+    async def set_fields(self, key: str, items: Mapping[str, Any]) -> None:
+        """Write the fields with one HSET, so concurrent writers never lose each other's fields."""
+        if not items:
+            return
+        try:
+            await self._client.hset(
+                self._build_data_key(key),
+                mapping={field: self._serialize_value(value) for field, value in items.items()},
+            )
+        except Exception as exc:
+            fallback = self._fields_fallback(key, exc)
+            if fallback is not None:
+                await fallback.set_fields(key, items)
+
+    async def delete_fields(self, key: str, fields: Iterable[str]) -> None:
+        fields = list(fields)
+        if not fields:
+            return
+        try:
+            await self._client.hdel(self._build_data_key(key), *fields)
+        except Exception as exc:
+            fallback = self._fields_fallback(key, exc)
+            if fallback is not None:
+                await fallback.delete_fields(key, fields)
+
     async def incr(self, key: str, expire: int | None = None) -> int:
         try:
             if expire is None:
@@ -130,10 +317,73 @@ class RedisStorage(Storage):
         except Exception as exc:
             await self._handle_delete_failure(key, exc)
 
+    async def scan_keys(self, prefix: str) -> AsyncIterator[str]:
+        """Iterate over matching keys with SCAN, so Redis is never blocked by one large KEYS call."""
+        data_prefix = self._build_data_key("")
+        pattern = _escape_glob(self._build_data_key(prefix)) + "*"
+        try:
+            keys = [self._to_text(key)[len(data_prefix):] async for key in self._client.scan_iter(match=pattern, count=1000)]
+        except Exception as exc:
+            if self._is_control_key(prefix):
+                if self._control_mode() != "local-memory-fallback":
+                    raise StorageUnavailableError("Redis control storage is unavailable.") from exc
+                fallback = self._control_fallback_storage
+            elif self._counter_mode() == "open":
+                return
+            elif self._counter_mode() == "local-memory-fallback":
+                fallback = self._counter_fallback_storage
+            else:
+                raise StorageUnavailableError("Redis counter storage is unavailable.") from exc
+            async for key in fallback.scan_keys(prefix):
+                yield key
+            return
+        for key in keys:
+            yield key
+
+    async def subscribe_invalidations(self, listener: InvalidationListener) -> bool:
+        """
+        Deliver invalidations published by any worker through Redis pub/sub.
+
+        One subscriber connection is shared by all listeners of this storage.
+        Pub/sub is at-most-once, so listeners must still expire what they cache.
+        """
+        if listener not in self._invalidation_listeners:
+            self._invalidation_listeners.append(listener)
+        if self._closed:
+            return False
+
+        task = self._invalidation_task
+        loop = asyncio.get_running_loop()
+        if task is not None and not task.done() and task.get_loop() is loop:
+            return True
+
+        pubsub = self._client.pubsub()
+        try:
+            await pubsub.subscribe(self._build_invalidation_channel())
+        except Exception:
+            logger.warning("Could not subscribe to Redis invalidations.", exc_info=True)
+            await self._close_pubsub(pubsub)
+            return False
+        self._invalidation_task = loop.create_task(self._listen_invalidations(pubsub))
+        return True
+
+    async def publish_invalidation(self, key: str) -> None:
+        try:
+            await self._client.publish(self._build_invalidation_channel(), key)
+        except Exception:
+            # Other workers still pick up the change once their cached entries expire.
+            logger.warning("Could not publish a Redis invalidation for %s.", key, exc_info=True)
+
     async def close(self) -> None:
         if self._closed:
             return
         self._closed = True
+        task = self._invalidation_task
+        self._invalidation_task = None
+        if task is not None and not task.done():
+            task.cancel()
+            if task.get_loop() is asyncio.get_running_loop():
+                await asyncio.gather(task, return_exceptions=True)
         close = getattr(self._client, "aclose", None)
         if callable(close):
             await close()
@@ -156,7 +406,7 @@ class RedisStorage(Storage):
         counter_key = self._build_counter_key(request_key, handler_name, rule_index)
 
         try:
-            result = await self._client.eval(
+            result = await self._run_script(
                 SLIDING_WINDOW_SCRIPT,
                 1,
                 counter_key,
@@ -168,6 +418,91 @@ class RedisStorage(Storage):
 
         return self._parse_hit_result(result)
 
+    async def record_hits(self, hits: Sequence[HitRequest]) -> list[SlidingWindowResult]:
+        """
+        Update the windows of every rule for one request with a single script call.
+
+        All keys are passed to one EVAL, so they must live on the same Redis
+        node; Redis Cluster deployments need a single-shard client.
+        """
+        if len(hits) <= 1:
+            return [await self.record_hit(*hit) for hit in hits]
+
+        counter_keys = [
+            self._build_counter_key(request_key, handler_name, rule_index)
+            for request_key, handler_name, rule_index, _ in hits
+        ]
+        try:
+            result = await self._run_script(
+                MULTI_SLIDING_WINDOW_SCRIPT,
+                len(counter_keys),
+                *counter_keys,
+                uuid.uuid4().hex,
+                *(str(window_seconds) for *_, window_seconds in hits),
+            )
+        except Exception as exc:
+            return [await self._handle_record_hit_failure(exc, *hit) for hit in hits]
+
+        return self._parse_multi_hit_result(result, len(hits))
+
+    async def record_gcra(
+        self,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+    ) -> RateLimitResult:
+        state_key = self._build_counter_key(request_key, handler_name, rule_index, namespace="gcra")
+        try:
+            result = await self._run_script(GCRA_SCRIPT, 1, state_key, str(period_seconds), str(limit))
+        except Exception as exc:
+            return await self._handle_record_gcra_failure(exc, request_key, handler_name, rule_index, limit, period_seconds)
+
+        return self._parse_rate_limit_result(result)
+
+    async def record_token_bucket(
+        self,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+        burst: int,
+    ) -> RateLimitResult:
+        state_key = self._build_counter_key(request_key, handler_name, rule_index, namespace="tokens")
+        try:
+            result = await self._run_script(TOKEN_BUCKET_SCRIPT, 1, state_key, str(period_seconds), str(limit), str(burst))
+        except Exception as exc:
+            return await self._handle_record_token_bucket_failure(
+                exc, request_key, handler_name, rule_index, limit, period_seconds, burst
+            )
+
+        return self._parse_rate_limit_result(result)
+
+    async def warm_up(self) -> None:
+        """
+        Load the Lua scripts and open warm_up_connections pooled connections.
+
+        Failures are logged and left to the failure modes of the first requests.
+        """
+        try:
+            if self._warm_up_connections:
+                await asyncio.gather(*(self._client.ping() for _ in range(self._warm_up_connections)))
+            for script in _SCRIPT_SHAS:
+                await self._client.script_load(script)
+        except Exception:
+            logger.warning("Could not warm up the Redis storage.", exc_info=True)
+
+    async def _run_script(self, script: str, numkeys: int, *args: Any) -> Any:
+        sha = _SCRIPT_SHAS[script]
+        try:
+            return await self._client.evalsha(sha, numkeys, *args)
+        except NoScriptError:
+            # The server's script cache was emptied by a restart, failover or SCRIPT FLUSH.
+            await self._client.script_load(script)
+            return await self._client.evalsha(sha, numkeys, *args)
+
     def cleanup_handler_counters(self, handler_name: str) -> None:
         # Runtime updates are documented as process-local, so this storage
         # switches to a new local counter namespace instead of deleting shared
@@ -178,10 +513,40 @@ class RedisStorage(Storage):
     def cleanup_orphaned_counters(self, active_rules) -> None:
         return None
 
+    async def _listen_invalidations(self, pubsub: Any) -> None:
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                key = self._to_text(message.get("data"))
+                for listener in list(self._invalidation_listeners):
+                    listener(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Redis invalidation subscription was lost.", exc_info=True)
+        finally:
+            # Nothing is delivered from here on, so listeners must drop their caches.
+            for listener in list(self._invalidation_listeners):
+                listener(None)
+            await self._close_pubsub(pubsub)
+
+    async def _close_pubsub(self, pubsub: Any) -> None:
+        close = getattr(pubsub, "aclose", None) or getattr(pubsub, "close", None)
+        if not callable(close):
+            return
+        try:
+            await close()
+        except Exception:
+            logger.debug("Failed to close the Redis invalidation subscriber.", exc_info=True)
+
+    def _build_invalidation_channel(self) -> str:
+        return f"{self._prefix}:invalidate"
+
     def _build_data_key(self, key: str) -> str:
         return f"{self._prefix}:data:{key}"
 
-    def _build_counter_key(self, request_key: str, handler_name: str, rule_index: int) -> str:
+    def _build_counter_key(self, request_key: str, handler_name: str, rule_index: int, namespace: str = "counter") -> str:
         key_tail = request_key
         if self._key_hash:
             key_tail = hashlib.sha256(request_key.encode("utf-8")).hexdigest()
@@ -189,8 +554,8 @@ class RedisStorage(Storage):
             generation = self._handler_generations.get(handler_name, 0)
 
         if generation > 0:
-            return f"{self._prefix}:counter:{handler_name}:v{generation}:{rule_index}:{key_tail}"
-        return f"{self._prefix}:counter:{handler_name}:{rule_index}:{key_tail}"
+            return f"{self._prefix}:{namespace}:{handler_name}:v{generation}:{rule_index}:{key_tail}"
+        return f"{self._prefix}:{namespace}:{handler_name}:{rule_index}:{key_tail}"
 
     def _serialize_value(self, value: Any) -> Any:
         if isinstance(value, bytes):
@@ -206,9 +571,6 @@ class RedisStorage(Storage):
             return json.loads(value[len(_JSON_PREFIX):])
         return value
 
-    def _is_control_key(self, key: str) -> bool:
-        return key.startswith("ip:")
-
     def _counter_mode(self) -> FailureMode:
         return self._counter_failure_mode
 
@@ -244,6 +606,45 @@ class RedisStorage(Storage):
             return
         raise StorageUnavailableError("Redis counter storage is unavailable.") from exc
 
+    async def _handle_get_bits_failure(self, key: str, exc: Exception) -> bytes | None:
+        if self._is_control_key(key):
+            if self._control_mode() == "local-memory-fallback":
+                return await self._control_fallback_storage.get_bits(key)
+            raise StorageUnavailableError("Redis control storage is unavailable.") from exc
+
+        if self._counter_mode() == "open":
+            return None
+        if self._counter_mode() == "local-memory-fallback":
+            return await self._counter_fallback_storage.get_bits(key)
+        raise StorageUnavailableError("Redis counter storage is unavailable.") from exc
+
+    async def _handle_set_bits_failure(self, key: str, offsets: list[int], exc: Exception) -> None:
+        if self._is_control_key(key):
+            if self._control_mode() == "local-memory-fallback":
+                await self._control_fallback_storage.set_bits(key, offsets)
+                return
+            raise StorageUnavailableError("Redis control storage is unavailable.") from exc
+
+        if self._counter_mode() == "open":
+            return
+        if self._counter_mode() == "local-memory-fallback":
+            await self._counter_fallback_storage.set_bits(key, offsets)
+            return
+        raise StorageUnavailableError("Redis counter storage is unavailable.") from exc
+
+    def _fields_fallback(self, key: str, exc: Exception) -> Storage | None:
+        """Return the storage to retry a field operation on, or None to skip it."""
+        if self._is_control_key(key):
+            if self._control_mode() == "local-memory-fallback":
+                return self._control_fallback_storage
+            raise StorageUnavailableError("Redis control storage is unavailable.") from exc
+
+        if self._counter_mode() == "open":
+            return None
+        if self._counter_mode() == "local-memory-fallback":
+            return self._counter_fallback_storage
+        raise StorageUnavailableError("Redis counter storage is unavailable.") from exc
+
     async def _handle_incr_failure(self, key: str, expire: int | None, exc: Exception) -> int:
         if self._is_control_key(key):
             if self._control_mode() == "local-memory-fallback":
@@ -286,6 +687,52 @@ class RedisStorage(Storage):
 
         raise StorageUnavailableError("Redis counter storage is unavailable.") from exc
 
+    async def _handle_record_gcra_failure(
+        self,
+        exc: Exception,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+    ) -> RateLimitResult:
+        if self._counter_mode() == "open":
+            return RateLimitResult(allowed=True, remaining=limit, retry_after=0.0)
+
+        if self._counter_mode() == "local-memory-fallback":
+            return await self._counter_fallback_storage.record_gcra(request_key, handler_name, rule_index, limit, period_seconds)
+
+        raise StorageUnavailableError("Redis counter storage is unavailable.") from exc
+
+    async def _handle_record_token_bucket_failure(
+        self,
+        exc: Exception,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+        burst: int,
+    ) -> RateLimitResult:
+        if self._counter_mode() == "open":
+            return RateLimitResult(allowed=True, remaining=burst, retry_after=0.0)
+
+        if self._counter_mode() == "local-memory-fallback":
+            return await self._counter_fallback_storage.record_token_bucket(
+                request_key, handler_name, rule_index, limit, period_seconds, burst
+            )
+
+        raise StorageUnavailableError("Redis counter storage is unavailable.") from exc
+
+    def _parse_rate_limit_result(self, result: Any) -> RateLimitResult:
+        if not isinstance(result, (list, tuple)) or len(result) < 3:
+            raise RuntimeError("Redis script returned an unexpected result.")
+        return RateLimitResult(
+            allowed=bool(int(result[0])),
+            remaining=int(result[1]),
+            retry_after=float(self._to_text(result[2])),
+        )
+
     def _parse_hit_result(self, result: Any) -> SlidingWindowResult:
         if not isinstance(result, (list, tuple)) or len(result) < 3:
             raise RuntimeError("Redis script returned an unexpected result.")
@@ -300,9 +747,30 @@ class RedisStorage(Storage):
             current_timestamp=float(current_raw),
         )
 
+    def _parse_multi_hit_result(self, result: Any, hit_total: int) -> list[SlidingWindowResult]:
+        if not isinstance(result, (list, tuple)) or len(result) != hit_total * 2 + 1:
+            raise RuntimeError("Redis script returned an unexpected result.")
+
+        current_timestamp = float(self._to_text(result[-1]))
+        results = []
+        for index in range(0, hit_total * 2, 2):
+            oldest_raw = self._to_text(result[index + 1])
+            results.append(
+                SlidingWindowResult(
+                    hit_count=int(result[index]),
+                    oldest_timestamp=float(oldest_raw) if oldest_raw else None,
+                    current_timestamp=current_timestamp,
+                )
+            )
+        return results
+
     def _to_text(self, value: Any) -> str:
         if isinstance(value, bytes):
             return value.decode("utf-8")
         if value is None:
             return ""
-        return str(value)
\ No newline at end of file
+        return str(value)
+
+
+def _escape_glob(value: str) -> str:
+    return "".join(f"\\{char}" if char in "*?[]\\" else char for char in value)
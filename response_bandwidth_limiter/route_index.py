@@ -0,0 +1,257 @@
+import threading
+from typing import Any, Iterable, Optional, Sequence
+
+from starlette.routing import Match
+from starlette.types import Scope
+
+from .util import _HANDLER_NAME_ATTRIBUTE, _get_configured_handler_name
+
+try:
+    from starlette._utils import get_route_path as _get_route_path
+except ImportError:  # pragma: no cover - Starlette < 0.33 matched on scope["path"] directly
+    def _get_route_path(scope: Scope) -> str:
+        return scope["path"]
+
+
+class _IndexedRoute:
+    __slots__ = ("route", "handler_name", "dynamic", "children")
+
+    def __init__(
+        self,
+        route: Any,
+        handler_name: Optional[str],
+        dynamic: bool,
+        children: Optional["_RouteTable"],
+    ) -> None:
+        self.route = route
+        self.handler_name = handler_name
+        self.dynamic = dynamic
+        self.children = children
+
+
+class _SegmentNode:
+    __slots__ = ("entries", "children")
+
+    def __init__(self) -> None:
+        self.entries: list[tuple[int, _IndexedRoute]] = []
+        self.children: dict[str, "_SegmentNode"] = {}
+
+
+class _RouteTable:
+    """
+    Indexed routes of one router level, grouped by their literal path prefix.
+
+    A route is filed under the leading path segments that contain no
+    parameter, so a request only has to try the routes filed along its own
+    path segments. Routes without a path template, or whose first segment is
+    parameterised, are filed at the root and tried for every request. The
+    original declaration order is kept so the first match still wins.
+    """
+
+    __slots__ = ("entries", "_root")
+
+    def __init__(self, entries: tuple[_IndexedRoute, ...]) -> None:
+        self.entries = entries
+        self._root = _SegmentNode()
+        for order, entry in enumerate(entries):
+            node = self._root
+            if not entry.dynamic:
+                for segment in entry.route.path.split("/")[1:]:
+                    if "{" in segment:
+                        break
+                    node = node.children.setdefault(segment, _SegmentNode())
+            node.entries.append((order, entry))
+
+    def candidates(self, scope: Scope) -> list[_IndexedRoute]:
+        node = self._root
+        groups = [node.entries] if node.entries else []
+        for segment in _get_route_path(scope).split("/")[1:]:
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.entries:
+                groups.append(node.entries)
+
+        if len(groups) == 1:
+            return [entry for _, entry in groups[0]]
+        return [entry for _, entry in sorted(item for group in groups for item in group)]
+
+
+class RouteIndex:
+    """
+    Precompiled view of an application's route table for limiter lookups.
+
+    Only routes that resolve to a configured name, or that contain such routes
+    through nested routers, are kept, and those are grouped by literal path
+    prefix. Request-time matching therefore only tries the limited routes that
+    share the request's leading path segments instead of walking the route
+    table. Requests that resolve to no configured name are remembered in a bounded
+    negative cache.
+    """
+
+    def __init__(
+        self,
+        routes: Sequence[Any],
+        configured_names: Iterable[str],
+        *,
+        version: int = 0,
+        max_negative_entries: int = 4096,
+    ):
+        if not isinstance(max_negative_entries, int):
+            raise TypeError("max_negative_entries must be an integer.")
+        if max_negative_entries <= 0:
+            raise ValueError("max_negative_entries must be greater than 0.")
+        self._routes = routes
+        self._version = version
+        self._configured_names = frozenset(configured_names)
+        self._route_lists: list[tuple[Sequence[Any], int]] = []
+        self._host_sensitive = False
+        self._names_by_route: dict[int, str] = {}
+        self._names_by_endpoint: dict[int, str] = {}
+        self._named_routes: list[tuple[Any, str]] = []
+        self._table = _RouteTable(self._compile(routes) if self._configured_names else ())
+        self._max_negative_entries = max_negative_entries
+        self._negative_cache: dict[tuple[Any, ...], None] = {}
+        self._cache_lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def indexed_route_count(self) -> int:
+        return self._count_entries(self._table)
+
+    @property
+    def named_routes(self) -> tuple[tuple[Any, str], ...]:
+        """Routes with a statically resolved configured name, including nested ones."""
+        return tuple(self._named_routes)
+
+    @property
+    def negative_cache_size(self) -> int:
+        return len(self._negative_cache)
+
+    def is_current(self, routes: Sequence[Any], version: int) -> bool:
+        if version != self._version:
+            return False
+        if routes is not self._routes and (routes or self._routes):
+            return False
+        for route_list, size in self._route_lists:
+            if len(route_list) != size:
+                return False
+        return True
+
+    def resolve(self, scope: Scope, path: str) -> Optional[str]:
+        if not self._table.entries:
+            return None
+
+        cache_key = self._build_cache_key(scope, path)
+        if cache_key in self._negative_cache:
+            return None
+
+        handler_name = self._match(self._table, scope, path)
+        if handler_name is None:
+            self._remember_negative(cache_key)
+        return handler_name
+
+    def resolve_routed(self, scope: Scope) -> Optional[str]:
+        """Resolve the configured name from the router's own match stored in the scope."""
+        if not self._configured_names:
+            return None
+
+        route = scope.get("route")
+        if route is not None:
+            handler_name = self._names_by_route.get(id(route))
+            if handler_name is not None:
+                return handler_name
+
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return None
+
+        handler_name = self._names_by_endpoint.get(id(endpoint))
+        if handler_name is not None:
+            return handler_name
+
+        marker = getattr(endpoint, _HANDLER_NAME_ATTRIBUTE, None)
+        if marker in self._configured_names:
+            return marker
+        return None
+
+    def _compile(self, routes: Sequence[Any]) -> tuple[_IndexedRoute, ...]:
+        self._route_lists.append((routes, len(routes)))
+        entries: list[_IndexedRoute] = []
+
+        for route in routes:
+            if not hasattr(route, "matches"):
+                continue
+
+            nested_routes = getattr(route, "routes", None)
+            children = _RouteTable(self._compile(nested_routes)) if nested_routes else None
+
+            # Routes without a path template (for example Host) fall back to
+            # the request path, so their identifier can only be resolved per request.
+            dynamic = not hasattr(route, "path")
+            handler_name = None
+            if not dynamic:
+                endpoint = getattr(route, "endpoint", getattr(route, "app", None))
+                handler_name = _get_configured_handler_name(route, endpoint, "", self._configured_names)
+
+            if handler_name is None and not dynamic and not (children and children.entries):
+                continue
+
+            if hasattr(route, "host"):
+                self._host_sensitive = True
+            if handler_name is not None:
+                self._named_routes.append((route, handler_name))
+                self._names_by_route.setdefault(id(route), handler_name)
+                route_endpoint = getattr(route, "endpoint", None)
+                if route_endpoint is not None:
+                    self._names_by_endpoint.setdefault(id(route_endpoint), handler_name)
+            entries.append(_IndexedRoute(route, handler_name, dynamic, children))
+
+        return tuple(entries)
+
+    def _match(self, table: _RouteTable, scope: Scope, path: str) -> Optional[str]:
+        for entry in table.candidates(scope):
+            match, child_scope = entry.route.matches(scope)
+            if match != Match.FULL:
+                continue
+
+            handler_name = entry.handler_name
+            if entry.dynamic:
+                endpoint = child_scope.get("endpoint", getattr(entry.route, "endpoint", None))
+                handler_name = _get_configured_handler_name(entry.route, endpoint, path, self._configured_names)
+            if handler_name is not None:
+                return handler_name
+
+            if entry.children:
+                nested_scope = scope.copy()
+                nested_scope.update(child_scope)
+                handler_name = self._match(entry.children, nested_scope, path)
+                if handler_name is not None:
+                    return handler_name
+
+        return None
+
+    def _build_cache_key(self, scope: Scope, path: str) -> tuple[Any, ...]:
+        host = None
+        if self._host_sensitive:
+            for name, value in scope.get("headers", ()):
+                if name == b"host":
+                    host = value
+                    break
+        return (scope.get("type"), scope.get("method"), scope.get("root_path", ""), path, host)
+
+    def _remember_negative(self, cache_key: tuple[Any, ...]) -> None:
+        with self._cache_lock:
+            if cache_key in self._negative_cache:
+                return
+            if len(self._negative_cache) >= self._max_negative_entries:
+                self._negative_cache.pop(next(iter(self._negative_cache)))
+            self._negative_cache[cache_key] = None
+
+    def _count_entries(self, table: Optional[_RouteTable]) -> int:
+        if table is None:
+            return 0
+        return sum(1 + self._count_entries(entry.children) for entry in table.entries)
@@ -0,0 +1,91 @@
+from typing import Any, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .middleware import (
+    IP_ALLOWED_SCOPE_KEY,
+    ROUTED_CONTEXT_SCOPE_KEY,
+    ROUTED_DECISION_SCOPE_KEY,
+    ResponseBandwidthLimiterMiddleware,
+)
+from .policy import PolicyEvaluator
+from .shutdown import ShutdownCoordinator
+
+
+class RouteLimiterApp(ResponseBandwidthLimiterMiddleware):
+    """
+    設定済みのルートの ASGI アプリだけを包む帯域制限ラッパー
+
+    init_app(app, route_resolution="route") で各ルートに取り付けられる。
+    ハンドラー名はルートごとに固定されているため、リクエスト時のルート照合は行わない。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        handler_name: str,
+        limiter: Any,
+        policy_evaluator: Optional[PolicyEvaluator] = None,
+        shutdown_coordinator: Optional[ShutdownCoordinator] = None,
+    ):
+        super().__init__(
+            app,
+            policy_evaluator=policy_evaluator,
+            shutdown_coordinator=shutdown_coordinator,
+            install_signal_handlers=False,
+        )
+        self.handler_name = handler_name
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # 実行時に設定が削除されたルートは何もせずに通過させる
+        snapshot = self.limiter.snapshot
+        handler_name = self.handler_name
+        if handler_name not in snapshot.configured_names:
+            await self.app(scope, receive, send)
+            return
+
+        bypass = self._resolve_bypass(scope, self.limiter)
+        if bypass is not None and bypass.lift_bandwidth:
+            await self.app(scope, receive, send)
+            return
+
+        ip_allowed = bypass is not None or bool(scope.get(IP_ALLOWED_SCOPE_KEY, False))
+        await self._call_limited(scope, receive, send, self.limiter, handler_name, ip_allowed)
+
+
+class RoutedDecisionHook:
+    """
+    route_resolution="router" で各ルートの ASGI アプリの前に置くフック
+
+    ルーターがルートを確定した後、エンドポイントを実行する前にポリシー判定を行う。
+    Reject の場合はエンドポイントを実行せずに終了するため、副作用は発生しない。
+    制限のないルートでは、判定用のオブジェクトを作らずにそのまま通過させる。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        routed = scope.pop(ROUTED_CONTEXT_SCOPE_KEY, None)
+        if routed is not None:
+            middleware, limiter, ip_allowed = routed
+            handler_name = middleware._resolve_routed_handler_name(scope, limiter)
+            if handler_name is None:
+                await self.app(scope, receive, send)
+                return
+            await middleware._call_limited(scope, receive, send, limiter, handler_name, ip_allowed, app=self.app)
+            return
+
+        decide = scope.get(ROUTED_DECISION_SCOPE_KEY)
+        if decide is not None and not await decide():
+            return
+        await self.app(scope, receive, send)
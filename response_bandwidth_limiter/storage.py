@@ -1,17 +1,20 @@
 import logging
+import math
 import threading
 import time
 from abc import ABC, abstractmethod
-from collections import deque
+from collections import OrderedDict, deque
 from dataclasses import dataclass
 from multiprocessing.managers import SyncManager
-from typing import Any, Callable, Deque, Dict, Mapping, MutableMapping, Sequence, Tuple
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterable, Mapping, MutableMapping, Sequence, Tuple
 
 
 logger = logging.getLogger(__name__)
 
 _APPROX_COUNTER_PREFIX = "__rbl_counter__"
 _EXPIRY_PREFIX = "__rbl_exp__:"
+# Keys written by IPManager. Backends keep them apart from per-client counters.
+_CONTROL_KEY_PREFIX = "ip:"
 
 
 @dataclass(frozen=True)
@@ -19,12 +22,57 @@ class SlidingWindowResult:
     hit_count: int
     oldest_timestamp: float | None
     current_timestamp: float
+    # (current bucket count, previous bucket count, current bucket start) of a weighted two-bucket estimate.
+    weighted_buckets: tuple[int, int, float] | None = None
+
+    def retry_after(self, limit: int, window_seconds: int) -> int:
+        """
+        Return the whole seconds after which one more hit fits within limit.
+
+        Exact windows wait for the oldest hit to leave the window. Weighted
+        estimates wait until the decaying previous bucket, or the current
+        bucket once it has become the previous one, leaves room for a hit.
+        """
+        if self.weighted_buckets is not None:
+            current, previous, bucket_start = self.weighted_buckets
+            now = self.current_timestamp
+            room = limit - current
+            if room > 0:
+                # floor(previous * (1 - elapsed / window)) must drop below room in this bucket.
+                ready_at = bucket_start + window_seconds * (1.0 - room / previous) if previous else now
+            else:
+                # Only after the bucket ends, once the current count decays below limit in the next one.
+                ready_at = bucket_start + window_seconds * (2.0 - limit / current)
+            retry_after = max(1, math.ceil(ready_at - now))
+            # Step past ready_at itself and any rounding, using the estimate the storage will make.
+            while _weighted_estimate(self.weighted_buckets, window_seconds, now + retry_after) >= limit:
+                retry_after += 1
+            return retry_after
+        if self.oldest_timestamp is None:
+            return 1
+        return max(1, math.ceil(window_seconds - (self.current_timestamp - self.oldest_timestamp)))
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    remaining: int
+    retry_after: float
 
 
 class StorageUnavailableError(RuntimeError):
     pass
 
 
+class StorageCapacityError(StorageUnavailableError):
+    """Raised when a write needs room that could only be made by evicting control data."""
+
+
+InvalidationListener = Callable[[str | None], None]
+# (request_key, handler_name, rule_index, window_seconds), the arguments of one record_hit() call.
+HitRequest = Tuple[str, str, int, int]
+
+
 def _validate_limit(name: str, value: int) -> None:
     if not isinstance(value, int):
         raise TypeError(f"{name} must be an integer.")
@@ -38,6 +86,133 @@ def _validate_expire(expire: int | None) -> None:
     _validate_limit("expire", expire)
 
 
+def _set_bitmap_bits(value: Any, offsets: Iterable[int]) -> bytearray:
+    # Bits are numbered like Redis bitmaps: the most significant bit of each byte comes first.
+    bitmap = bytearray(value) if isinstance(value, (bytes, bytearray)) else bytearray()
+    for offset in offsets:
+        index = offset >> 3
+        if index >= len(bitmap):
+            bitmap.extend(bytes(index + 1 - len(bitmap)))
+        bitmap[index] |= 0x80 >> (offset & 7)
+    return bitmap
+
+
+def _weighted_previous_share(previous: int, bucket_start: float, window_seconds: int, now: float) -> float:
+    return previous * (1.0 - (now - bucket_start) / window_seconds)
+
+
+def _weighted_estimate(weighted_buckets: tuple[int, int, float], window_seconds: int, at: float) -> int:
+    """Return the count a weighted window would report at a later time, before that hit is added."""
+    current, previous, bucket_start = weighted_buckets
+    if at < bucket_start + window_seconds:
+        return current + math.floor(_weighted_previous_share(previous, bucket_start, window_seconds, at))
+    if at < bucket_start + 2 * window_seconds:
+        return math.floor(_weighted_previous_share(current, bucket_start + window_seconds, window_seconds, at))
+    return 0
+
+
+def _weighted_window_result(
+    now: float,
+    window_seconds: int,
+    bucket: int,
+    current_count: int,
+    previous_count: Any,
+) -> SlidingWindowResult:
+    """
+    Estimate a sliding-window count from the current and previous fixed buckets.
+
+    The previous bucket is weighted by the share of it that still overlaps the
+    window ending now, assuming its hits were evenly spread. The oldest
+    timestamp is that of the earliest of those hits still counted; the bucket
+    counts are kept so retry_after() can tell when the estimate is back under
+    the limit.
+    """
+    bucket_start = float(bucket * window_seconds)
+    previous = int(previous_count or 0)
+    previous_share = _weighted_previous_share(previous, bucket_start, window_seconds, now)
+    counted_previous = math.floor(previous_share)
+    oldest_timestamp = bucket_start
+    if counted_previous > 0:
+        oldest_timestamp = now - window_seconds + (previous_share - counted_previous) * window_seconds / previous
+    return SlidingWindowResult(
+        hit_count=current_count + counted_previous,
+        oldest_timestamp=oldest_timestamp,
+        current_timestamp=now,
+        weighted_buckets=(current_count, previous, bucket_start),
+    )
+
+
+def _gcra_update(
+    tat: float | None,
+    now: float,
+    limit: int,
+    period_seconds: int,
+) -> tuple[RateLimitResult, float | None]:
+    """
+    Apply the generic cell rate algorithm to a stored theoretical arrival time.
+
+    Returns the result and the new arrival time to store, or None when the
+    request is rejected and the stored value must stay unchanged.
+    """
+    interval = period_seconds / limit
+    if tat is None or tat < now:
+        tat = now
+    new_tat = tat + interval
+    allow_at = new_tat - period_seconds
+    if now < allow_at:
+        return RateLimitResult(allowed=False, remaining=0, retry_after=allow_at - now), None
+    remaining = math.floor((period_seconds - (new_tat - now)) / interval + 1e-9)
+    return RateLimitResult(allowed=True, remaining=remaining, retry_after=0.0), new_tat
+
+
+def _token_bucket_update(
+    state: tuple[float, float] | None,
+    now: float,
+    limit: int,
+    period_seconds: int,
+    burst: int,
+) -> tuple[RateLimitResult, tuple[float, float] | None]:
+    """
+    Refill a token bucket to now and take one token from it.
+
+    The state is (tokens, last refill time); a missing state is a full bucket.
+    Returns the result and the state to store, or None when the request is
+    rejected and the stored state must stay unchanged.
+    """
+    rate = limit / period_seconds
+    if state is None:
+        tokens = float(burst)
+    else:
+        tokens, refilled_at = state
+        tokens = min(float(burst), tokens + max(0.0, now - refilled_at) * rate)
+    if tokens < 1:
+        return RateLimitResult(allowed=False, remaining=0, retry_after=(1 - tokens) / rate), None
+    tokens -= 1
+    return RateLimitResult(allowed=True, remaining=math.floor(tokens + 1e-9), retry_after=0.0), (tokens, now)
+
+
+def _token_bucket_expire(state: tuple[float, float], limit: int, period_seconds: int, burst: int) -> int:
+    # Once the bucket has refilled, a missing key means the same thing as the stored state.
+    tokens, refilled_at = state
+    return _rate_state_expire(refilled_at + (burst - tokens) * period_seconds / limit, refilled_at)
+
+
+def _decode_token_state(value: Any) -> tuple[float, float] | None:
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    if isinstance(value, str):
+        tokens, _, refilled_at = value.partition(" ")
+        return float(tokens), float(refilled_at)
+    tokens, refilled_at = value
+    return float(tokens), float(refilled_at)
+
+
+def _rate_state_expire(state_until: float, now: float) -> int:
+    return max(1, math.ceil(state_until - now))
+
+
 def _detect_multi_worker() -> bool:
     import os
 
@@ -95,6 +270,98 @@ class Storage(ABC):
     async def delete(self, key: str) -> None:
         raise NotImplementedError
 
+    async def get_many(self, keys: Sequence[str]) -> list[Any | None]:
+        """
+        Return the values of several keys in order, with None for missing keys.
+
+        The default implementation issues one get() per key. Backends override
+        it to read all keys in a single round trip.
+        """
+        return [await self.get(key) for key in keys]
+
+    async def set_many(self, items: Mapping[str, Any], expire: int | None = None) -> None:
+        """
+        Store several keys with the same expiry.
+
+        The default implementation issues one set() per key. Backends override
+        it to write the whole batch in a single round trip.
+        """
+        for key, value in items.items():
+            await self.set(key, value, expire=expire)
+
+    async def get_bits(self, key: str) -> bytes | None:
+        """Return a bitmap written by set_bits() as raw bytes."""
+        value = await self.get(key)
+        return bytes(value) if isinstance(value, (bytes, bytearray)) else None
+
+    async def set_bits(self, key: str, offsets: Iterable[int]) -> None:
+        """
+        Set bits of a bitmap, growing it as needed.
+
+        The default implementation reads and rewrites the whole bitmap, so
+        concurrent writers can lose bits. Backends override it to update the
+        bitmap atomically.
+        """
+        await self.set(key, bytes(_set_bitmap_bits(await self.get(key), offsets)))
+
+    async def get_fields(self, key: str) -> dict[str, Any]:
+        """Return the fields of a map written by set_fields(), or an empty dict."""
+        value = await self.get(key)
+        return dict(value) if isinstance(value, Mapping) else {}
+
+    async def set_fields(self, key: str, items: Mapping[str, Any]) -> None:
+        """
+        Set fields of a map, keeping its other fields.
+
+        The default implementation reads and rewrites the whole map, so
+        concurrent writers can lose fields. Backends override it to update
+        each field atomically.
+        """
+        if not items:
+            return
+        fields = await self.get_fields(key)
+        fields.update(items)
+        await self.set(key, fields)
+
+    async def delete_fields(self, key: str, fields: Iterable[str]) -> None:
+        """Remove fields of a map. Like set_fields(), the default implementation is not atomic."""
+        current = await self.get_fields(key)
+        for field in fields:
+            current.pop(field, None)
+        await self.set(key, current)
+
+    def scan_keys(self, prefix: str) -> AsyncIterator[str]:
+        """
+        Iterate over the stored keys that start with prefix, in no particular order.
+
+        Used to find entries written before the metadata that indexes them, so it
+        may be slow on large stores. The default implementation cannot enumerate
+        keys and raises NotImplementedError.
+        """
+        raise NotImplementedError("This storage cannot enumerate its keys.")
+
+    async def subscribe_invalidations(self, listener: InvalidationListener) -> bool:
+        """
+        Register a listener that is called with each key passed to publish_invalidation().
+
+        Returns True only when changes made by every writer of this storage will
+        reach the listener. The listener receives None when delivery stops and
+        everything it cached must be discarded. The default implementation does
+        not deliver invalidations and returns False.
+        """
+        return False
+
+    async def publish_invalidation(self, key: str) -> None:
+        return None
+
+    async def warm_up(self) -> None:
+        """
+        Prepare connections and server-side state before the first request.
+
+        Called once during lifespan startup. The default implementation does nothing.
+        """
+        return None
+
     async def close(self) -> None:
         return None
 
@@ -105,16 +372,100 @@ class Storage(ABC):
         rule_index: int,
         window_seconds: int,
     ) -> SlidingWindowResult:
+        """
+        Record a hit with a weighted two-bucket sliding-window counter.
+
+        The hit is added to the fixed bucket containing now, and the previous
+        bucket is weighted by how much of it still falls inside the window. This
+        needs one incr() and one get() per rule and two keys per client, unlike
+        a plain fixed window that admits twice the limit across a bucket
+        boundary. Backends override it with exact sliding windows.
+        """
+        return (await self._record_weighted_hits([(request_key, handler_name, rule_index, window_seconds)]))[0]
+
+    async def record_hits(self, hits: Sequence[HitRequest]) -> list[SlidingWindowResult]:
+        """
+        Record one hit per request and return the window results in order.
+
+        The default implementation increments the current bucket of each rule
+        and reads every previous bucket with one get_many() call, or issues one
+        record_hit() per request when a subclass overrides record_hit().
+        Backends override it to update every window in a single round trip.
+        """
+        if type(self).record_hit is not Storage.record_hit:
+            return [await self.record_hit(*hit) for hit in hits]
+        return await self._record_weighted_hits(hits)
+
+    async def _record_weighted_hits(self, hits: Sequence[HitRequest]) -> list[SlidingWindowResult]:
         now = time.time()
-        bucket = int(now // window_seconds)
-        bucket_start = float(bucket * window_seconds)
-        counter_key = self._build_approx_counter_key(request_key, handler_name, rule_index, bucket)
-        hit_count = await self.incr(counter_key, expire=max(1, window_seconds * 2))
-        return SlidingWindowResult(
-            hit_count=hit_count,
-            oldest_timestamp=bucket_start,
-            current_timestamp=now,
-        )
+        buckets: list[int] = []
+        current_counts: list[int] = []
+        previous_keys: list[str] = []
+        for request_key, handler_name, rule_index, window_seconds in hits:
+            bucket = int(now // window_seconds)
+            counter_key = self._build_approx_counter_key(request_key, handler_name, rule_index, bucket)
+            buckets.append(bucket)
+            current_counts.append(await self.incr(counter_key, expire=max(1, window_seconds * 2)))
+            previous_keys.append(self._build_approx_counter_key(request_key, handler_name, rule_index, bucket - 1))
+        if not previous_keys:
+            return []
+
+        previous_counts = await self.get_many(previous_keys) if len(previous_keys) > 1 else [await self.get(previous_keys[0])]
+        return [
+            _weighted_window_result(now, hit[3], bucket, current_count, previous_count)
+            for hit, bucket, current_count, previous_count in zip(hits, buckets, current_counts, previous_counts)
+        ]
+
+    async def record_gcra(
+        self,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+    ) -> RateLimitResult:
+        """
+        Admit up to limit requests per period with the generic cell rate algorithm.
+
+        Only one theoretical arrival time is stored per key, and rejected
+        requests do not change it. The default implementation uses get() and
+        set(), so concurrent requests from several workers can both be admitted.
+        Backends override it to update the value atomically.
+        """
+        now = time.time()
+        state_key = self._build_rate_state_key(request_key, handler_name, rule_index, "gcra")
+        stored = await self.get(state_key)
+        result, tat = _gcra_update(float(stored) if stored is not None else None, now, limit, period_seconds)
+        if tat is not None:
+            await self.set(state_key, tat, expire=_rate_state_expire(tat, now))
+        return result
+
+    async def record_token_bucket(
+        self,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+        burst: int,
+    ) -> RateLimitResult:
+        """
+        Take one token from a bucket of burst tokens refilled at limit per period.
+
+        Only the token count and the last refill time are stored per key, and
+        rejected requests do not change them. The default implementation uses
+        get() and set() and is not atomic; backends override it.
+        """
+        now = time.time()
+        state_key = self._build_rate_state_key(request_key, handler_name, rule_index, "token-bucket")
+        result, state = _token_bucket_update(_decode_token_state(await self.get(state_key)), now, limit, period_seconds, burst)
+        if state is not None:
+            await self.set(
+                state_key,
+                f"{state[0]!r} {state[1]!r}",
+                expire=_token_bucket_expire(state, limit, period_seconds, burst),
+            )
+        return result
 
     def cleanup_handler_counters(self, handler_name: str) -> None:
         return None
@@ -122,9 +473,16 @@ class Storage(ABC):
     def cleanup_orphaned_counters(self, active_rules: Mapping[str, Sequence[Any]]) -> None:
         return None
 
+    def _is_control_key(self, key: str) -> bool:
+        return key.startswith(_CONTROL_KEY_PREFIX)
+
     def _build_approx_counter_key(self, request_key: str, handler_name: str, rule_index: int, bucket: int) -> str:
         return f"{_APPROX_COUNTER_PREFIX}:{handler_name}:{rule_index}:{request_key}:{bucket}"
 
+    def _build_rate_state_key(self, request_key: str, handler_name: str, rule_index: int, algorithm: str) -> str:
+        # Shares the approximate counter namespace so handler cleanup also removes rate states.
+        return f"{_APPROX_COUNTER_PREFIX}:{handler_name}:{rule_index}:{request_key}:{algorithm}"
+
     def _build_approx_handler_prefix(self, handler_name: str) -> str:
         return f"{_APPROX_COUNTER_PREFIX}:{handler_name}:"
 
@@ -152,8 +510,12 @@ class InMemoryStorage(Storage):
         self._expires: Dict[str, float] = {}
         self._last_access: Dict[str, float] = {}
         self._request_counters: Dict[Tuple[str, str, int], Deque[float]] = {}
+        # GCRA and token-bucket states keyed like request counters plus the algorithm, with their expiry.
+        # Bounded by max_counters and kept apart from _values so clients never evict control data.
+        self._rate_states: OrderedDict[Tuple[str, str, int, str], Tuple[Any, float]] = OrderedDict()
         self._max_keys = max_keys
         self._max_counters = max_counters
+        self._invalidation_listeners: list[InvalidationListener] = []
         self._closed = False
 
     @property
@@ -171,21 +533,84 @@ class InMemoryStorage(Storage):
                 self._touch_key(key, now)
             return value
 
+    async def get_many(self, keys: Sequence[str]) -> list[Any | None]:
+        with self._lock:
+            now = self._time_provider()
+            values: list[Any | None] = []
+            for key in keys:
+                if self._delete_if_expired(key, now) or key not in self._values:
+                    values.append(None)
+                    continue
+                self._touch_key(key, now)
+                values.append(self._values[key])
+            return values
+
     async def set(self, key: str, value: Any, expire: int | None = None) -> None:
         _validate_expire(expire)
         with self._lock:
             now = self._time_provider()
-            self._evict_keys_if_needed(key, now)
+            self._evict_keys_if_needed((key,), now)
             self._values[key] = value
             self._touch_key(key, now)
             self._set_expiry(key, now, expire)
 
+    async def set_many(self, items: Mapping[str, Any], expire: int | None = None) -> None:
+        _validate_expire(expire)
+        with self._lock:
+            now = self._time_provider()
+            self._evict_keys_if_needed(items, now)
+            for key, value in items.items():
+                self._values[key] = value
+                self._touch_key(key, now)
+                self._set_expiry(key, now, expire)
+
+    async def set_bits(self, key: str, offsets: Iterable[int]) -> None:
+        with self._lock:
+            now = self._time_provider()
+            self._delete_if_expired(key, now)
+            self._evict_keys_if_needed((key,), now)
+            self._values[key] = bytes(_set_bitmap_bits(self._values.get(key), offsets))
+            self._touch_key(key, now)
+
+    async def get_fields(self, key: str) -> dict[str, Any]:
+        with self._lock:
+            now = self._time_provider()
+            if self._delete_if_expired(key, now) or key not in self._values:
+                return {}
+            self._touch_key(key, now)
+            value = self._values[key]
+            return dict(value) if isinstance(value, Mapping) else {}
+
+    async def set_fields(self, key: str, items: Mapping[str, Any]) -> None:
+        if not items:
+            return
+        with self._lock:
+            now = self._time_provider()
+            self._delete_if_expired(key, now)
+            self._evict_keys_if_needed((key,), now)
+            current = self._values.get(key)
+            fields = dict(current) if isinstance(current, Mapping) else {}
+            fields.update(items)
+            self._values[key] = fields
+            self._touch_key(key, now)
+
+    async def delete_fields(self, key: str, fields: Iterable[str]) -> None:
+        with self._lock:
+            now = self._time_provider()
+            if self._delete_if_expired(key, now) or not isinstance(self._values.get(key), Mapping):
+                return
+            current = dict(self._values[key])
+            for field in fields:
+                current.pop(field, None)
+            self._values[key] = current
+            self._touch_key(key, now)
+
     async def incr(self, key: str, expire: int | None = None) -> int:
         _validate_expire(expire)
         with self._lock:
             now = self._time_provider()
             self._delete_if_expired(key, now)
-            self._evict_keys_if_needed(key, now)
+            self._evict_keys_if_needed((key,), now)
             current = int(self._values.get(key, 0)) + 1
             self._values[key] = current
             self._touch_key(key, now)
@@ -197,6 +622,26 @@ class InMemoryStorage(Storage):
         with self._lock:
             self._delete_key(key)
 
+    async def scan_keys(self, prefix: str) -> AsyncIterator[str]:
+        with self._lock:
+            now = self._time_provider()
+            keys = [key for key in list(self._values) if key.startswith(prefix) and not self._delete_if_expired(key, now)]
+        for key in keys:
+            yield key
+
+    async def subscribe_invalidations(self, listener: InvalidationListener) -> bool:
+        # Every writer lives in this process, so delivering in-process is complete.
+        with self._lock:
+            if listener not in self._invalidation_listeners:
+                self._invalidation_listeners.append(listener)
+        return True
+
+    async def publish_invalidation(self, key: str) -> None:
+        with self._lock:
+            listeners = list(self._invalidation_listeners)
+        for listener in listeners:
+            listener(key)
+
     async def close(self) -> None:
         with self._lock:
             self._closed = True
@@ -225,12 +670,51 @@ class InMemoryStorage(Storage):
                 current_timestamp=now,
             )
 
+    async def record_gcra(
+        self,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+    ) -> RateLimitResult:
+        with self._lock:
+            now = self._time_provider()
+            state_key = (request_key, handler_name, rule_index, "gcra")
+            result, tat = _gcra_update(self._get_rate_state(state_key, now), now, limit, period_seconds)
+            if tat is not None:
+                self._store_rate_state(state_key, tat, now, _rate_state_expire(tat, now))
+            return result
+
+    async def record_token_bucket(
+        self,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+        burst: int,
+    ) -> RateLimitResult:
+        with self._lock:
+            now = self._time_provider()
+            state_key = (request_key, handler_name, rule_index, "token-bucket")
+            result, state = _token_bucket_update(
+                self._get_rate_state(state_key, now), now, limit, period_seconds, burst
+            )
+            if state is not None:
+                self._store_rate_state(state_key, state, now, _token_bucket_expire(state, limit, period_seconds, burst))
+            return result
+
     def cleanup_handler_counters(self, handler_name: str) -> None:
         with self._lock:
             stale_keys = [key for key in self._request_counters if key[1] == handler_name]
             for counter_key in stale_keys:
                 self._request_counters.pop(counter_key, None)
 
+            stale_states = [key for key in self._rate_states if key[1] == handler_name]
+            for state_key in stale_states:
+                self._rate_states.pop(state_key, None)
+
             approx_prefix = self._build_approx_handler_prefix(handler_name)
             approx_keys = [key for key in self._values if key.startswith(approx_prefix)]
             for approx_key in approx_keys:
@@ -260,6 +744,16 @@ class InMemoryStorage(Storage):
             for counter_key in stale_keys:
                 self._request_counters.pop(counter_key, None)
 
+            stale_states = [
+                state_key
+                for state_key, (_, expires_at) in self._rate_states.items()
+                if expires_at <= now
+                or state_key[1] not in active_rules
+                or state_key[2] >= len(active_rules[state_key[1]])
+            ]
+            for state_key in stale_states:
+                self._rate_states.pop(state_key, None)
+
     def _cleanup_counter(self, history: Deque[float], now: float, window_seconds: int) -> None:
         threshold = now - window_seconds
         while history and history[0] <= threshold:
@@ -286,19 +780,67 @@ class InMemoryStorage(Storage):
         for key in oldest_keys[:overflow]:
             self._request_counters.pop(key, None)
 
-    def _evict_keys_if_needed(self, key: str, now: float) -> None:
-        if key in self._values or len(self._values) < self._max_keys:
+    def _get_rate_state(self, state_key: Tuple[str, str, int, str], now: float) -> Any | None:
+        entry = self._rate_states.get(state_key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            del self._rate_states[state_key]
+            return None
+        return entry[0]
+
+    def _store_rate_state(self, state_key: Tuple[str, str, int, str], state: Any, now: float, expire: int) -> None:
+        if state_key not in self._rate_states:
+            self._evict_rate_states_if_needed(now)
+        self._rate_states[state_key] = (state, now + expire)
+        self._rate_states.move_to_end(state_key)
+
+    def _evict_rate_states_if_needed(self, now: float) -> None:
+        if len(self._rate_states) < self._max_counters:
             return
 
-        expired_keys = [candidate for candidate in list(self._values) if self._delete_if_expired(candidate, now)]
-        if expired_keys:
+        expired_keys = [key for key, (_, expires_at) in self._rate_states.items() if expires_at <= now]
+        for key in expired_keys:
+            self._rate_states.pop(key, None)
+
+        if len(self._rate_states) < self._max_counters:
+            return
+
+        # Least recently updated states come first.
+        trim_by = max(1, self._max_counters // 10)
+        while len(self._rate_states) > max(0, self._max_counters - trim_by):
+            self._rate_states.popitem(last=False)
+
+    def _evict_keys_if_needed(self, keys: Iterable[str], now: float) -> None:
+        """
+        Make room for keys, dropping expired keys first and then the least
+        recently used non-control keys.
+
+        Control keys are never evicted, so a write that only fits by dropping
+        them raises StorageCapacityError before anything is written.
+        """
+        new_keys = {key for key in keys if key not in self._values}
+        if len(self._values) + len(new_keys) <= self._max_keys:
+            return
+
+        expired_keys = [candidate for candidate in list(self._expires) if self._delete_if_expired(candidate, now)]
+        if expired_keys and len(self._values) + len(new_keys) <= self._max_keys:
             return
 
         trim_by = max(1, self._max_keys // 10)
         target_size = max(0, self._max_keys - trim_by)
-        overflow = len(self._values) - target_size
-        oldest_keys = sorted(self._last_access, key=self._last_access.get)
-        for candidate in oldest_keys[:overflow]:
+        required = len(self._values) + len(new_keys) - self._max_keys
+        overflow = max(required, len(self._values) + len(new_keys) - target_size)
+        evictable_keys = sorted(
+            (candidate for candidate in self._last_access if not self._is_control_key(candidate)),
+            key=self._last_access.get,
+        )
+        if len(evictable_keys) < required:
+            raise StorageCapacityError(
+                f"InMemoryStorage cannot hold {len(new_keys)} more keys without evicting control data; "
+                "raise max_keys."
+            )
+        for candidate in evictable_keys[:overflow]:
             self._delete_key(candidate)
 
     def _set_expiry(self, key: str, now: float, expire: int | None) -> None:
@@ -329,8 +871,8 @@ class ManagerStorage(Storage):
 
     This implementation is slower than dedicated external storage, is not
     suitable for high-load environments, and does not guarantee consistency.
-    Exact sliding-window semantics are not supported; the default approximate
-    record_hit implementation is used instead.
+    Exact sliding-window semantics are not supported; the default weighted
+    two-bucket record_hit implementation is used instead.
     """
 
     _experimental = True
@@ -365,6 +907,11 @@ class ManagerStorage(Storage):
                 return None
             return self._shared_dict.get(key)
 
+    async def get_many(self, keys: Sequence[str]) -> list[Any | None]:
+        with self._shared_lock:
+            now = self._time_provider()
+            return [None if self._delete_if_expired(key, now) else self._shared_dict.get(key) for key in keys]
+
     async def set(self, key: str, value: Any, expire: int | None = None) -> None:
         _validate_expire(expire)
         with self._shared_lock:
@@ -372,6 +919,54 @@ class ManagerStorage(Storage):
             self._shared_dict[key] = value
             self._set_expiry(key, now, expire)
 
+    async def set_many(self, items: Mapping[str, Any], expire: int | None = None) -> None:
+        _validate_expire(expire)
+        with self._shared_lock:
+            now = self._time_provider()
+            # Each proxy call is a round trip to the manager process, so batch them with update().
+            self._shared_dict.update(items)
+            if expire is None:
+                for key in items:
+                    self._shared_dict.pop(self._expiry_key(key), None)
+            else:
+                self._shared_dict.update({self._expiry_key(key): now + expire for key in items})
+
+    async def set_bits(self, key: str, offsets: Iterable[int]) -> None:
+        with self._shared_lock:
+            now = self._time_provider()
+            self._delete_if_expired(key, now)
+            self._shared_dict[key] = bytes(_set_bitmap_bits(self._shared_dict.get(key), offsets))
+
+    async def get_fields(self, key: str) -> dict[str, Any]:
+        with self._shared_lock:
+            now = self._time_provider()
+            if self._delete_if_expired(key, now):
+                return {}
+            value = self._shared_dict.get(key)
+            return dict(value) if isinstance(value, Mapping) else {}
+
+    async def set_fields(self, key: str, items: Mapping[str, Any]) -> None:
+        if not items:
+            return
+        with self._shared_lock:
+            now = self._time_provider()
+            self._delete_if_expired(key, now)
+            current = self._shared_dict.get(key)
+            fields = dict(current) if isinstance(current, Mapping) else {}
+            fields.update(items)
+            self._shared_dict[key] = fields
+
+    async def delete_fields(self, key: str, fields: Iterable[str]) -> None:
+        with self._shared_lock:
+            now = self._time_provider()
+            current = self._shared_dict.get(key)
+            if self._delete_if_expired(key, now) or not isinstance(current, Mapping):
+                return
+            remaining = dict(current)
+            for field in fields:
+                remaining.pop(field, None)
+            self._shared_dict[key] = remaining
+
     async def incr(self, key: str, expire: int | None = None) -> int:
         _validate_expire(expire)
         with self._shared_lock:
@@ -387,6 +982,43 @@ class ManagerStorage(Storage):
         with self._shared_lock:
             self._delete_key(key)
 
+    async def record_gcra(
+        self,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+    ) -> RateLimitResult:
+        with self._shared_lock:
+            now = self._time_provider()
+            state_key = self._build_rate_state_key(request_key, handler_name, rule_index, "gcra")
+            self._delete_if_expired(state_key, now)
+            result, tat = _gcra_update(self._shared_dict.get(state_key), now, limit, period_seconds)
+            if tat is not None:
+                self._shared_dict[state_key] = tat
+                self._set_expiry(state_key, now, _rate_state_expire(tat, now))
+            return result
+
+    async def record_token_bucket(
+        self,
+        request_key: str,
+        handler_name: str,
+        rule_index: int,
+        limit: int,
+        period_seconds: int,
+        burst: int,
+    ) -> RateLimitResult:
+        with self._shared_lock:
+            now = self._time_provider()
+            state_key = self._build_rate_state_key(request_key, handler_name, rule_index, "token-bucket")
+            self._delete_if_expired(state_key, now)
+            result, state = _token_bucket_update(self._shared_dict.get(state_key), now, limit, period_seconds, burst)
+            if state is not None:
+                self._shared_dict[state_key] = state
+                self._set_expiry(state_key, now, _token_bucket_expire(state, limit, period_seconds, burst))
+            return result
+
     async def close(self) -> None:
         if self._closed:
             return
@@ -394,6 +1026,17 @@ class ManagerStorage(Storage):
         if self._owned_manager is not None:
             self._owned_manager.shutdown()
 
+    async def scan_keys(self, prefix: str) -> AsyncIterator[str]:
+        with self._shared_lock:
+            now = self._time_provider()
+            keys = [
+                str(key)
+                for key in list(self._shared_dict.keys())
+                if str(key).startswith(prefix) and not self._delete_if_expired(str(key), now)
+            ]
+        for key in keys:
+            yield key
+
     def cleanup_handler_counters(self, handler_name: str) -> None:
         prefix = self._build_approx_handler_prefix(handler_name)
         with self._shared_lock:
@@ -5,6 +5,27 @@ from starlette.routing import Match
 from starlette.types import Scope
 
 
+_HANDLER_NAME_ATTRIBUTE = "__response_bandwidth_limiter_name__"
+
+
+def _mark_handler(func: Any, handler_name: str) -> None:
+    try:
+        setattr(func, _HANDLER_NAME_ATTRIBUTE, handler_name)
+    except (AttributeError, TypeError):
+        pass
+
+
+def _get_request_host(scope: Scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"host":
+            host = value.decode("latin-1").strip().lower()
+            if host.startswith("["):
+                # IPv6 リテラル ("[::1]:8000") はブラケットごと扱う
+                return host.split("]", 1)[0] + "]"
+            return host.split(":", 1)[0]
+    return None
+
+
 def _get_configured_handler_name(
     route: Any,
     endpoint: Any,
@@ -1,7 +1,36 @@
 import pytest
 
 import response_bandwidth_limiter.middleware as middleware_module
-from response_bandwidth_limiter import ResponseBandwidthLimiterMiddleware
+from response_bandwidth_limiter import InMemoryStorage, ResponseBandwidthLimiterMiddleware
+
+
+class CountingStorage(InMemoryStorage):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.get_keys = []
+        self.get_many_calls = []
+        self.record_hit_calls = []
+
+    @property
+    def calls(self):
+        return len(self.get_keys) + len(self.get_many_calls) + len(self.record_hit_calls)
+
+    def reset(self):
+        self.get_keys.clear()
+        self.get_many_calls.clear()
+        self.record_hit_calls.clear()
+
+    async def get(self, key: str):
+        self.get_keys.append(key)
+        return await super().get(key)
+
+    async def get_many(self, keys):
+        self.get_many_calls.append(list(keys))
+        return await super().get_many(keys)
+
+    async def record_hit(self, request_key, handler_name, rule_index, window_seconds):
+        self.record_hit_calls.append((request_key, handler_name, rule_index, window_seconds))
+        return await super().record_hit(request_key, handler_name, rule_index, window_seconds)
 
 
 @pytest.fixture
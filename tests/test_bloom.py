@@ -0,0 +1,45 @@
+import pytest
+
+from response_bandwidth_limiter.bloom import BloomFilter
+
+
+def test_bloom_filter_sizes_bits_and_hashes_from_capacity_and_rate():
+    bloom = BloomFilter(capacity=1000, false_positive_rate=0.01)
+
+    assert bloom.size_bits == 9586
+    assert bloom.hash_count == 7
+    assert bloom.size_bytes == 1199
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(capacity=5000, false_positive_rate=0.01)
+    members = [f"203.0.{index // 256}.{index % 256}" for index in range(5000)]
+    for member in members:
+        bloom.add(member)
+
+    assert all(member in bloom for member in members)
+    false_positives = sum(f"10.1.{index // 256}.{index % 256}" in bloom for index in range(10000))
+    assert false_positives < 200
+
+    stats = bloom.stats()
+    assert stats.bits_set == bloom.bits_set()
+    assert 0.005 < stats.estimated_false_positive_rate < 0.02
+
+
+def test_bloom_filter_round_trips_through_bytes():
+    bloom = BloomFilter(capacity=100)
+    bloom.add("203.0.113.10")
+    copy = BloomFilter(capacity=100)
+
+    copy.load(bloom.to_bytes()[:3])
+    copy.load(bloom.to_bytes())
+    assert "203.0.113.10" in copy
+    copy.load(None)
+    assert "203.0.113.10" not in copy
+
+
+def test_bloom_filter_rejects_invalid_settings():
+    with pytest.raises(ValueError):
+        BloomFilter(capacity=0)
+    with pytest.raises(ValueError):
+        BloomFilter(false_positive_rate=1.0)
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from response_bandwidth_limiter import (
+    BypassGrant,
+    BypassTokens,
+    InMemoryStorage,
+    IPControlMiddleware,
+    Reject,
+    ResponseBandwidthLimiter,
+    Rule,
+)
+from response_bandwidth_limiter.middleware import ResponseBandwidthLimiterMiddleware
+from tests.conftest import CountingStorage
+
+
+def test_issued_tokens_verify_until_they_expire():
+    now = [1000.0]
+    tokens = BypassTokens({"k1": "secret"}, time_provider=lambda: now[0])
+    token = tokens.issue(ttl=60, lift_bandwidth=True)
+
+    assert tokens.verify(token) == BypassGrant(key_id="k1", expires_at=1060, lift_bandwidth=True)
+
+    now[0] = 1060.0
+    assert tokens.verify(token) is None
+
+
+def test_tampered_and_malformed_tokens_are_rejected():
+    tokens = BypassTokens({"k1": "secret"})
+    token = tokens.issue(ttl=60)
+    key_id, expires_at, flag, signature = token.split(".")
+
+    assert tokens.verify(f"{key_id}.{int(expires_at) + 1000}.{flag}.{signature}") is None
+    assert tokens.verify(f"{key_id}.{expires_at}.u.{signature}") is None
+    assert tokens.verify(f"{key_id}.{expires_at}.{flag}.{signature[:-1]}é") is None
+    assert tokens.verify("") is None
+    assert tokens.verify("k1.²³.l.sig") is None
+    assert BypassTokens({"k1": "other"}).verify(token) is None
+
+
+def test_key_rotation_accepts_every_listed_key():
+    old = BypassTokens({"2024": "old-secret"})
+    rotated = BypassTokens({"2025": "new-secret", "2024": "old-secret"})
+    retired = BypassTokens({"2025": "new-secret"})
+    token = old.issue(ttl=60)
+
+    assert rotated.verify(token) is not None
+    assert rotated.issue(ttl=60).startswith("2025.")
+    assert retired.verify(token) is None
+
+
+def test_max_ttl_limits_issued_and_accepted_tokens():
+    long_lived = BypassTokens({"k1": "secret"}, max_ttl=None).issue(ttl=7200)
+    tokens = BypassTokens({"k1": "secret"}, max_ttl=3600)
+
+    with pytest.raises(ValueError):
+        tokens.issue(ttl=7200)
+    assert tokens.verify(long_lived) is None
+
+
+def test_bypass_tokens_validate_their_keys():
+    with pytest.raises(ValueError):
+        BypassTokens({})
+    with pytest.raises(ValueError):
+        BypassTokens({"a.b": "secret"})
+    with pytest.raises(ValueError):
+        BypassTokens({"k1": ""})
+    with pytest.raises(ValueError):
+        BypassTokens({"k1": "secret"}, signing_key_id="k2")
+
+
+def build_app(tokens, storage, route_resolution="middleware"):
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter(trusted_proxy_headers=True, storage=storage, bypass_tokens=tokens)
+
+    @app.get("/limited")
+    @limiter.limit(1024)
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject())])
+    async def limited(request: Request):
+        return PlainTextResponse("ok")
+
+    limiter.init_app(app, install_signal_handlers=False, route_resolution=route_resolution)
+    if route_resolution == "route":
+        app.add_middleware(IPControlMiddleware)
+    return app, limiter
+
+
+@pytest.mark.parametrize("route_resolution", ["middleware", "router", "route"])
+def test_valid_tokens_skip_ip_control_and_policies_without_storage_access(route_resolution):
+    tokens = BypassTokens({"k1": "secret"})
+    storage = CountingStorage()
+    app, limiter = build_app(tokens, storage, route_resolution)
+    asyncio.run(limiter.block_ip("203.0.113.10"))
+    client = TestClient(app)
+    headers = {"X-Forwarded-For": "203.0.113.10", "X-RateLimit-Bypass": tokens.issue(ttl=60)}
+    storage.reset()
+
+    for _ in range(3):
+        assert client.get("/limited", headers=headers).status_code == 200
+    assert storage.calls == 0
+
+    assert client.get("/limited", headers={**headers, "X-RateLimit-Bypass": "k1.1.l.bad"}).status_code == 403
+
+
+def test_bandwidth_limits_apply_unless_the_token_lifts_them(monkeypatch):
+    tokens = BypassTokens({"k1": "secret"})
+    app, _ = build_app(tokens, InMemoryStorage())
+    limited_rates = []
+    original = ResponseBandwidthLimiterMiddleware._build_limited_send
+
+    def record(self, send, max_rate):
+        limited_rates.append(max_rate)
+        return original(self, send, max_rate)
+
+    monkeypatch.setattr(ResponseBandwidthLimiterMiddleware, "_build_limited_send", record)
+    client = TestClient(app)
+
+    assert client.get("/limited", headers={"X-RateLimit-Bypass": tokens.issue(ttl=60)}).status_code == 200
+    assert limited_rates == [1024]
+    assert client.get("/limited", headers={"X-RateLimit-Bypass": tokens.issue(ttl=60, lift_bandwidth=True)}).status_code == 200
+    assert limited_rates == [1024]
@@ -1,12 +1,13 @@
 import asyncio
 from datetime import timedelta
+from ipaddress import ip_address
 
 import pytest
 from fastapi import FastAPI, Request
 from fastapi.testclient import TestClient
 from starlette.responses import PlainTextResponse, StreamingResponse
 
-from response_bandwidth_limiter import Delay, Reject, ResponseBandwidthLimiter, ResponseBandwidthLimiterMiddleware, Rule, SlidingWindowResult, Storage, StorageUnavailableError, Throttle
+from response_bandwidth_limiter import ClientIdentity, Delay, Reject, ResponseBandwidthLimiter, ResponseBandwidthLimiterMiddleware, Rule, SlidingWindowResult, Storage, StorageUnavailableError, Throttle
 
 
 def test_fastapi_middleware(recorded_limit_calls):
@@ -385,6 +386,203 @@ def test_get_client_ip_uses_real_ip_sources():
     assert middleware._get_client_ip(request, trust_proxy_headers=True) == "198.51.100.10"
 
 
+def test_client_identity_is_resolved_once_per_scope():
+    middleware = ResponseBandwidthLimiterMiddleware(FastAPI())
+    scope = {
+        "type": "http",
+        "path": "/",
+        "method": "GET",
+        "headers": [(b"x-forwarded-for", b"not-an-ip"), (b"x-real-ip", b"192.0.2.10")],
+        "client": ("203.0.113.10", 12345),
+    }
+
+    assert middleware._resolve_client(scope, trust_proxy_headers=True) == ("192.0.2.10", "192.0.2.10")
+    scope["headers"] = []
+    assert middleware._get_client_ip(Request(scope), trust_proxy_headers=True) == "192.0.2.10"
+    assert middleware._get_client_identifier(Request(scope)) == "203.0.113.10"
+
+
+def _trusted_proxies(*networks):
+    return ResponseBandwidthLimiter(trusted_proxies=networks).trusted_proxies
+
+
+def test_trusted_proxies_walk_forwarded_for_from_the_right():
+    middleware = ResponseBandwidthLimiterMiddleware(FastAPI())
+    trusted = _trusted_proxies("10.0.0.0/8")
+    scope = {
+        "type": "http",
+        "headers": [(b"x-forwarded-for", b"198.51.100.1, 203.0.113.9, 10.0.0.2")],
+        "client": ("10.0.0.1", 12345),
+    }
+
+    # The spoofable leftmost entry is ignored: the first untrusted hop is the client.
+    assert middleware._resolve_client(scope, True, trusted) == ("203.0.113.9", "203.0.113.9")
+
+
+def test_trusted_proxies_ignore_headers_from_untrusted_peers():
+    middleware = ResponseBandwidthLimiterMiddleware(FastAPI())
+    trusted = _trusted_proxies("10.0.0.0/8")
+    scope = {
+        "type": "http",
+        "headers": [(b"x-forwarded-for", b"203.0.113.9"), (b"x-real-ip", b"203.0.113.9")],
+        "client": ("198.51.100.7", 12345),
+    }
+
+    assert middleware._resolve_client(scope, True, trusted) == ("198.51.100.7", "198.51.100.7")
+
+
+def test_trusted_proxies_stop_at_unparseable_hops():
+    middleware = ResponseBandwidthLimiterMiddleware(FastAPI())
+    trusted = _trusted_proxies("10.0.0.0/8")
+    scope = {
+        "type": "http",
+        "headers": [(b"x-forwarded-for", b"203.0.113.9, garbage, 10.0.0.3")],
+        "client": ("10.0.0.1", 12345),
+    }
+
+    assert middleware._resolve_client(scope, True, trusted)[0] == "10.0.0.3"
+
+
+def test_trusted_proxies_read_the_forwarded_header_when_configured():
+    middleware = ResponseBandwidthLimiterMiddleware(FastAPI())
+    trusted = _trusted_proxies("10.0.0.0/8", "2001:db8:ffff::/48")
+    scope = {
+        "type": "http",
+        "headers": [
+            (b"x-forwarded-for", b"192.0.2.200"),
+            (b"forwarded", b'for=192.0.2.43:4711;proto=https, for="[2001:DB8::17]:443"'),
+            (b"forwarded", b'for="[2001:db8:ffff::1]";by=10.0.0.1'),
+        ],
+        "client": ("10.0.0.1", 12345),
+    }
+
+    identity = middleware._resolve_client_identity(scope, True, trusted, "forwarded")
+
+    assert identity.ip == "2001:db8::17"
+    assert identity.address == ip_address("2001:db8::17")
+    scope.pop("response_bandwidth_limiter.client")
+    assert middleware._resolve_client(scope, True, trusted) == ("192.0.2.200", "192.0.2.200")
+
+
+def test_trusted_proxies_never_fall_back_to_another_header():
+    middleware = ResponseBandwidthLimiterMiddleware(FastAPI())
+    trusted = _trusted_proxies("10.0.0.0/8")
+
+    # The proxy appends X-Forwarded-For; a client-supplied Forwarded or X-Real-IP must not win.
+    spoofed = {
+        "type": "http",
+        "headers": [(b"forwarded", b"for=192.0.2.1"), (b"x-forwarded-for", b"203.0.113.9")],
+        "client": ("10.0.0.1", 12345),
+    }
+    assert middleware._resolve_client(spoofed, True, trusted)[0] == "203.0.113.9"
+
+    missing = {"type": "http", "headers": [(b"x-real-ip", b"192.0.2.1")], "client": ("10.0.0.1", 12345)}
+    assert middleware._resolve_client(missing, True, trusted)[0] == "10.0.0.1"
+
+    real_ip = {"type": "http", "headers": [(b"x-real-ip", b"192.0.2.1")], "client": ("10.0.0.1", 12345)}
+    assert middleware._resolve_client(real_ip, True, trusted, "x-real-ip")[0] == "192.0.2.1"
+
+
+def test_limiter_validates_the_proxy_header():
+    assert ResponseBandwidthLimiter(trusted_proxies=["10.0.0.0/8"], proxy_header="forwarded").proxy_header == "forwarded"
+    with pytest.raises(ValueError):
+        ResponseBandwidthLimiter(proxy_header="x-client-ip")
+
+
+def test_trusted_proxies_treat_obfuscated_forwarded_nodes_as_the_end_of_the_chain():
+    middleware = ResponseBandwidthLimiterMiddleware(FastAPI())
+    trusted = _trusted_proxies("10.0.0.0/8")
+    scope = {
+        "type": "http",
+        "headers": [(b"forwarded", b"for=203.0.113.9, for=unknown, for=10.0.0.2")],
+        "client": ("10.0.0.1", 12345),
+    }
+
+    assert middleware._resolve_client(scope, True, trusted, "forwarded")[0] == "10.0.0.2"
+
+
+def test_client_identity_is_published_on_request_state():
+    middleware = ResponseBandwidthLimiterMiddleware(FastAPI())
+    scope = {
+        "type": "http",
+        "headers": [],
+        "client": ("2001:DB8::1", 12345),
+    }
+
+    identity = middleware._resolve_client_identity(scope)
+
+    assert identity == ClientIdentity(ip="2001:db8::1", identifier="2001:db8::1", address=ip_address("2001:db8::1"))
+    assert Request(scope).state.client_identity is identity
+
+
+def test_trusted_proxies_reject_invalid_networks():
+    with pytest.raises(ValueError):
+        ResponseBandwidthLimiter(trusted_proxies=["not-a-network"])
+
+
+def test_trusted_proxies_limit_by_the_resolved_client():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter(trusted_proxies=["10.0.0.0/8"])
+
+    @app.get("/limited")
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject())])
+    async def limited(request: Request):
+        return PlainTextResponse(str(request.state.client_identity.ip))
+
+    limiter.init_app(app)
+    client = TestClient(app, client=("10.0.0.1", 50000))
+
+    first = client.get("/limited", headers={"X-Forwarded-For": "203.0.113.9"})
+    assert first.status_code == 200
+    assert first.text == "203.0.113.9"
+    assert client.get("/limited", headers={"X-Forwarded-For": "203.0.113.9"}).status_code == 429
+    assert client.get("/limited", headers={"X-Forwarded-For": "203.0.113.10"}).status_code == 200
+
+
+@pytest.mark.parametrize("route_resolution", ["middleware", "router"])
+def test_client_identity_is_resolved_only_when_ip_control_or_a_policy_runs(route_resolution):
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter(trusted_proxies=["10.0.0.0/8"])
+
+    @app.get("/open")
+    async def open_route(request: Request):
+        identity = getattr(request.state, "client_identity", None)
+        return PlainTextResponse(str(identity.ip if identity is not None else None))
+
+    limiter.init_app(app, route_resolution=route_resolution)
+    client = TestClient(app, client=("10.0.0.1", 50000))
+    headers = {"X-Forwarded-For": "203.0.113.9"}
+
+    # Pass-through requests skip header parsing entirely.
+    assert client.get("/open", headers=headers).text == "None"
+
+    asyncio.run(limiter.block_ip("198.51.100.1"))
+    assert client.get("/open", headers=headers).text == "203.0.113.9"
+
+
+def test_builtin_scopes_do_not_build_request_objects(monkeypatch):
+    import response_bandwidth_limiter.middleware as middleware_module
+
+    def fail_request(*args, **kwargs):
+        raise AssertionError("Request should not be constructed")
+
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("limited", 10_000)
+    limiter.update_policy("limited", [Rule(count=1, per="minute", scope="ip", action=Reject())])
+    limiter.init_app(app)
+
+    @app.get("/limited")
+    async def limited():
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+    monkeypatch.setattr(middleware_module, "Request", fail_request)
+
+    assert client.get("/limited").status_code == 200
+    assert client.get("/limited").status_code == 429
+
+
 def test_middleware_accepts_injected_dependencies():
     app = FastAPI()
     evaluator = object()
@@ -855,3 +1053,174 @@ def test_starlette_mixed_ip_and_custom_scopes():
     r = client.get("/mixed", headers={"X-Forwarded-For": "10.0.0.1", "X-Tenant": "b"})
     assert r.status_code == 429
     assert r.json()["detail"] == "ip limited"
+
+
+def test_router_resolution_rejects_after_threshold():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="router")
+    calls = []
+
+    @app.get("/limited")
+    @limiter.limit_rules([Rule(count=1, per="second", action=Reject(detail="too many requests"))])
+    async def limited(request: Request):
+        calls.append("limited")
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+
+    assert client.get("/limited").status_code == 200
+    rejected = client.get("/limited")
+
+    assert rejected.status_code == 429
+    assert rejected.json()["detail"] == "too many requests"
+    assert rejected.headers["Retry-After"] == "1"
+    # The route-level hook decides before the endpoint runs, so rejected requests cause no side effects.
+    assert calls == ["limited"]
+
+
+def test_router_resolution_decides_before_endpoints_of_routes_added_later():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="router")
+    limiter.update_policy("late", [Rule(count=1, per="minute", action=Reject())])
+    calls = []
+
+    @app.post("/late", name="late")
+    def late():
+        calls.append("late")
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+
+    assert client.post("/late").status_code == 200
+    assert client.post("/late").status_code == 429
+    assert calls == ["late"]
+
+
+def test_router_resolution_applies_bandwidth_limit(recorded_limit_calls):
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="router")
+
+    @app.get("/download")
+    @limiter.limit(100)
+    async def download():
+        return PlainTextResponse("a" * 300)
+
+    @app.get("/health")
+    async def health():
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+
+    assert len(client.get("/download").content) == 300
+    assert client.get("/health").text == "ok"
+    assert [call["rate"] for call in recorded_limit_calls] == [100]
+
+
+def test_router_resolution_rejects_while_endpoint_reads_body():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="router")
+
+    @app.post("/upload")
+    @limiter.limit_rules([Rule(count=1, per="second", action=Reject(detail="upload limited"))])
+    async def upload(request: Request):
+        body = await request.body()
+        return PlainTextResponse(str(len(body)))
+
+    client = TestClient(app)
+
+    assert client.post("/upload", content=b"abc").text == "3"
+    rejected = client.post("/upload", content=b"abc")
+
+    assert rejected.status_code == 429
+    assert rejected.json()["detail"] == "upload limited"
+
+
+def test_router_resolution_uses_route_name_from_router_match(recorded_limit_calls):
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("custom_name", 50)
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="router")
+
+    @app.get("/named", name="custom_name")
+    async def named():
+        return PlainTextResponse("b" * 100)
+
+    response = TestClient(app).get("/named")
+
+    assert response.status_code == 200
+    assert [call["rate"] for call in recorded_limit_calls] == [50]
+
+
+def test_router_resolution_defers_decisions_only_for_paths_reaching_unhooked_apps(monkeypatch):
+    from starlette.routing import Mount
+
+    deferred = []
+    original = ResponseBandwidthLimiterMiddleware._call_after_routing
+
+    async def recording_call_after_routing(self, scope, *args):
+        deferred.append(scope["path"])
+        await original(self, scope, *args)
+
+    monkeypatch.setattr(ResponseBandwidthLimiterMiddleware, "_call_after_routing", recording_call_after_routing)
+
+    async def static_app(scope, receive, send):
+        await PlainTextResponse("static")(scope, receive, send)
+
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="router")
+
+    @app.get("/limited")
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject())])
+    async def limited():
+        return PlainTextResponse("ok")
+
+    @app.get("/health")
+    async def health():
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+
+    assert client.get("/health").status_code == 200
+    assert client.get("/limited").status_code == 200
+    assert client.get("/limited").status_code == 429
+    assert deferred == []
+
+    app.router.routes.append(Mount("/static", app=static_app))
+    assert client.get("/health").status_code == 200
+    assert client.get("/static/app.js").text == "static"
+    assert deferred == ["/static/app.js"]
+
+
+def test_router_resolution_hooks_routes_added_later_inside_a_mount():
+    from starlette.applications import Starlette
+    from starlette.routing import Mount, Route
+
+    calls = []
+
+    async def endpoint(request):
+        calls.append(request.url.path)
+        return PlainTextResponse("ok")
+
+    api = Mount("/api", routes=[Route("/first", endpoint=endpoint)])
+    app = Starlette(routes=[api])
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_policy("late", [Rule(count=1, per="minute", action=Reject())])
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="router")
+    client = TestClient(app)
+
+    assert client.get("/api/first").status_code == 200
+    api.routes.append(Route("/late", endpoint=endpoint, name="late"))
+
+    assert client.get("/api/late").status_code == 200
+    assert client.get("/api/late").status_code == 429
+    assert calls == ["/api/first", "/api/late"]
+
+
+def test_middleware_rejects_invalid_route_resolution():
+    with pytest.raises(ValueError):
+        ResponseBandwidthLimiterMiddleware(FastAPI(), route_resolution="invalid")
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+from response_bandwidth_limiter import IPIntervalFile, compile_ip_list
+
+
+def test_compile_ip_list_merges_ranges_and_counts_invalid_entries(tmp_path):
+    path = tmp_path / "blocklist.bin"
+
+    result = compile_ip_list(
+        [
+            "# reputation feed",
+            "203.0.113.10,scanner",
+            "203.0.113.11",
+            "203.0.113.0/28",
+            "2001:db8::/126",
+            "not-an-ip",
+            "",
+        ],
+        path,
+    )
+
+    assert (result.entries, result.intervals, result.invalid) == (5, 2, 1)
+    assert os.path.getsize(path) == 16 + 2 * 32
+    assert [name for name in os.listdir(tmp_path)] == ["blocklist.bin"]
+
+
+def test_interval_file_binary_searches_ipv4_and_ipv6_ranges(tmp_path):
+    path = tmp_path / "blocklist.bin"
+    compile_ip_list(["198.51.100.0/24", "203.0.113.7", "2001:db8::/64", "10.0.0.1"], path)
+
+    intervals = IPIntervalFile(path)
+
+    assert len(intervals) == 4
+    assert "198.51.100.0" in intervals
+    assert "198.51.100.255" in intervals
+    assert "198.51.101.0" not in intervals
+    assert "203.0.113.7" in intervals
+    assert "203.0.113.8" not in intervals
+    assert "10.0.0.1" in intervals
+    assert "10.0.0.0" not in intervals
+    assert "2001:db8::ffff" in intervals
+    assert "2001:db8:0:1::" not in intervals
+    assert "0.0.0.0" not in intervals
+    intervals.close()
+    assert "203.0.113.7" not in intervals
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Windows cannot replace a file that is memory-mapped")
+def test_interval_file_refresh_picks_up_a_replaced_file(tmp_path):
+    path = tmp_path / "blocklist.bin"
+    compile_ip_list(["203.0.113.7"], path)
+    intervals = IPIntervalFile(path)
+
+    assert intervals.refresh() is False
+    compile_ip_list(["203.0.113.8", "203.0.113.9"], path)
+
+    assert intervals.refresh() is True
+    assert "203.0.113.7" not in intervals
+    assert "203.0.113.9" in intervals
+    assert len(intervals) == 1
+
+
+def test_interval_file_rejects_other_files(tmp_path):
+    path = tmp_path / "blocklist.txt"
+    path.write_text("203.0.113.7\n" * 4, encoding="utf-8")
+
+    with pytest.raises(ValueError):
+        IPIntervalFile(path)
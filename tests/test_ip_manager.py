@@ -1,12 +1,22 @@
 import asyncio
+import sys
 
 import pytest
 from fastapi import FastAPI, Request
 from fastapi.testclient import TestClient
 from starlette.responses import PlainTextResponse
 
-from response_bandwidth_limiter import InMemoryStorage, Reject, ResponseBandwidthLimiter, Rule
-from response_bandwidth_limiter.ip_manager import IPManager
+import response_bandwidth_limiter.ip_manager as ip_manager_module
+from response_bandwidth_limiter import (
+    InMemoryStorage,
+    Reject,
+    ResponseBandwidthLimiter,
+    Rule,
+    StorageCapacityError,
+    compile_ip_list,
+)
+from response_bandwidth_limiter.ip_manager import BanEscalation, IPManager, IPStatus
+from tests.conftest import CountingStorage
 
 
 @pytest.mark.asyncio
@@ -70,3 +80,592 @@ def test_allowed_ip_skips_request_count_policy():
 
     assert client.get("/allowed", headers={"X-Forwarded-For": "203.0.113.20"}).status_code == 200
     assert client.get("/allowed", headers={"X-Forwarded-For": "203.0.113.20"}).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_ip_manager_caches_empty_control_state_between_refreshes():
+    now = [0.0]
+    storage = CountingStorage()
+    manager = IPManager(storage, control_refresh_interval=1.0, status_cache_size=0, time_provider=lambda: now[0])
+
+    assert await manager.has_control_entries() is False
+    assert await manager.has_control_entries() is False
+    assert storage.get_keys == ["ip:control:active"]
+
+    now[0] = 1.5
+    assert await manager.has_control_entries() is False
+    assert len(storage.get_keys) == 2
+
+
+@pytest.mark.asyncio
+async def test_ip_manager_control_state_is_shared_through_storage():
+    now = [0.0]
+    storage = InMemoryStorage()
+    worker_one = IPManager(storage, status_cache_size=0, time_provider=lambda: now[0])
+    worker_two = IPManager(storage, status_cache_size=0, time_provider=lambda: now[0])
+
+    assert await worker_two.has_control_entries() is False
+
+    await worker_one.block_ip("203.0.113.10")
+    assert await worker_one.has_control_entries() is True
+    assert await worker_two.has_control_entries() is False
+
+    now[0] = 1.0
+    assert await worker_two.has_control_entries() is True
+
+
+@pytest.mark.asyncio
+async def test_ip_manager_backfills_the_control_flag_for_existing_entries():
+    storage = InMemoryStorage()
+    # Written by an earlier release or another client, without the control flag.
+    await storage.set("ip:block:203.0.113.10", "1")
+    manager = IPManager(storage, status_cache_size=0)
+
+    assert await manager.has_control_entries() is True
+    assert await storage.get("ip:control:active") is not None
+    assert (await manager.get_status("203.0.113.10")).blocked
+
+
+@pytest.mark.asyncio
+async def test_ip_manager_keeps_checking_when_storage_cannot_enumerate_keys():
+    class NoScanStorage(InMemoryStorage):
+        def scan_keys(self, prefix):
+            raise NotImplementedError
+
+    manager = IPManager(NoScanStorage(), status_cache_size=0)
+
+    assert await manager.has_control_entries() is True
+
+
+def test_unmanaged_route_skips_ip_storage_lookups_without_control_entries():
+    app = FastAPI()
+    storage = CountingStorage()
+    limiter = ResponseBandwidthLimiter(storage=storage)
+    limiter.init_app(app, install_signal_handlers=False)
+
+    @app.get("/health")
+    async def health():
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+    for _ in range(3):
+        assert client.get("/health").status_code == 200
+
+    assert storage.get_keys == ["ip:control:active"]
+
+
+def test_unmanaged_route_still_checks_blocked_ips_after_block():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter(trusted_proxy_headers=True)
+    limiter.init_app(app, install_signal_handlers=False)
+
+    @app.get("/health")
+    async def health():
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+    assert client.get("/health", headers={"X-Forwarded-For": "203.0.113.10"}).status_code == 200
+
+    asyncio.run(limiter.block_ip("203.0.113.10"))
+
+    assert client.get("/health", headers={"X-Forwarded-For": "203.0.113.10"}).status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_get_status_reads_block_allow_and_network_version_at_once():
+    now = [0.0]
+    storage = CountingStorage()
+    manager = IPManager(storage, time_provider=lambda: now[0])
+    await manager.block_ip("203.0.113.10")
+    await manager.allow_network("192.0.2.0/24")
+    storage.get_keys.clear()
+
+    assert await manager.get_status("203.0.113.10") == IPStatus(blocked=True, allowed=False)
+    assert await manager.get_status("192.0.2.9") == IPStatus(blocked=False, allowed=True)
+    assert storage.get_many_calls == [
+        ["ip:block:203.0.113.10", "ip:allow:203.0.113.10", "ip:networks:version"],
+        ["ip:block:192.0.2.9", "ip:allow:192.0.2.9"],
+    ]
+    assert storage.get_keys == []
+
+
+def test_middleware_checks_ip_status_with_one_storage_read():
+    app = FastAPI()
+    storage = CountingStorage()
+    limiter = ResponseBandwidthLimiter(storage=storage, trusted_proxy_headers=True)
+    limiter.init_app(app)
+
+    @app.get("/items")
+    async def items():
+        return PlainTextResponse("ok")
+
+    asyncio.run(limiter.allow_ip("198.51.100.1"))
+    storage.get_keys.clear()
+    storage.get_many_calls.clear()
+
+    assert TestClient(app).get("/items", headers={"X-Forwarded-For": "198.51.100.1"}).status_code == 200
+    assert storage.get_keys == []
+    assert len(storage.get_many_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_status_serves_repeated_lookups_from_the_local_cache():
+    now = [0.0]
+    storage = CountingStorage()
+    manager = IPManager(storage, status_cache_ttl=5.0, time_provider=lambda: now[0])
+    await manager.block_ip("203.0.113.10")
+
+    for _ in range(3):
+        assert await manager.get_status("203.0.113.10") == IPStatus(blocked=True)
+    assert len(storage.get_many_calls) == 1
+
+    now[0] = 5.0
+    assert await manager.get_status("203.0.113.10") == IPStatus(blocked=True)
+    assert len(storage.get_many_calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_cached_status_does_not_outlive_a_timed_block(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(ip_manager_module.time, "time", lambda: 1000.0 + now[0])
+    storage = CountingStorage(time_provider=lambda: now[0])
+    manager = IPManager(storage, status_cache_ttl=30.0, time_provider=lambda: now[0])
+    await manager.block_ip("203.0.113.10", duration=5)
+    await manager.block_ips(["203.0.113.11"], duration=5)
+
+    for address in ("203.0.113.10", "203.0.113.11"):
+        assert await manager.get_status(address) == IPStatus(blocked=True)
+        assert await manager.get_status(address) == IPStatus(blocked=True)
+    assert len(storage.get_many_calls) == 2
+
+    now[0] = 5.0
+    assert await manager.get_status("203.0.113.10") == IPStatus()
+    assert await manager.get_status("203.0.113.11") == IPStatus()
+
+
+@pytest.mark.asyncio
+async def test_control_changes_invalidate_cached_status_on_other_managers():
+    now = [0.0]
+    storage = CountingStorage()
+    writer = IPManager(storage, time_provider=lambda: now[0])
+    reader = IPManager(storage, time_provider=lambda: now[0])
+
+    assert await reader.has_control_entries() is False
+    assert await reader.get_status("203.0.113.10") == IPStatus()
+
+    await writer.block_ip("203.0.113.10")
+    assert await reader.has_control_entries() is True
+    assert await reader.get_status("203.0.113.10") == IPStatus(blocked=True)
+
+    await writer.unblock_ip("203.0.113.10")
+    await writer.allow_ip("203.0.113.10")
+    assert await reader.get_status("203.0.113.10") == IPStatus(allowed=True)
+
+    await writer.block_network("198.51.100.0/24")
+    assert (await reader.get_status("198.51.100.7")).blocked is True
+
+
+@pytest.mark.asyncio
+async def test_status_cache_is_bounded_and_dropped_when_invalidations_stop():
+    storage = CountingStorage()
+    manager = IPManager(storage, status_cache_size=2, time_provider=lambda: 0.0)
+
+    for ip in ("203.0.113.1", "203.0.113.2", "203.0.113.3"):
+        await manager.get_status(ip)
+    await manager.get_status("203.0.113.1")
+    assert len(storage.get_many_calls) == 4
+
+    manager._on_invalidation(None)
+    await manager.get_status("203.0.113.3")
+    assert len(storage.get_many_calls) == 5
+
+
+@pytest.mark.asyncio
+async def test_status_cache_requires_invalidation_support():
+    class PollingStorage(CountingStorage):
+        async def subscribe_invalidations(self, listener):
+            return False
+
+    storage = PollingStorage()
+    manager = IPManager(storage, time_provider=lambda: 0.0)
+
+    await manager.get_status("203.0.113.10")
+    await manager.get_status("203.0.113.10")
+    assert len(storage.get_many_calls) == 2
+
+
+def test_ip_manager_rejects_invalid_status_cache_settings():
+    with pytest.raises(ValueError):
+        IPManager(InMemoryStorage(), status_cache_size=-1)
+    with pytest.raises(TypeError):
+        IPManager(InMemoryStorage(), status_cache_ttl="5")
+
+
+@pytest.mark.asyncio
+async def test_block_ips_writes_in_batches_and_reports_progress():
+    storage = CountingStorage()
+    manager = IPManager(storage)
+    writes = []
+    original_set_many = storage.set_many
+
+    async def recording_set_many(items, expire=None):
+        writes.append((len(items), expire))
+        await original_set_many(items, expire=expire)
+
+    storage.set_many = recording_set_many
+    updates = []
+    addresses = (f"203.0.113.{index}" for index in range(1, 6))
+
+    result = await manager.block_ips(["not-an-ip", *addresses], duration=60, batch_size=2, progress=updates.append)
+
+    assert writes == [(2, 60), (2, 60), (1, 60)]
+    assert (result.processed, result.blocked, result.invalid) == (6, 5, 1)
+    assert [update.blocked for update in updates] == [2, 4, 5]
+    assert updates[-1] == result
+    assert await manager.is_blocked("203.0.113.5") is True
+    assert await manager.has_control_entries() is True
+
+
+@pytest.mark.asyncio
+async def test_block_ips_invalidates_cached_status():
+    storage = InMemoryStorage()
+    writer = IPManager(storage)
+    reader = IPManager(storage)
+
+    assert await reader.get_status("203.0.113.10") == IPStatus()
+    await writer.block_ips(["203.0.113.10"])
+
+    assert await reader.get_status("203.0.113.10") == IPStatus(blocked=True)
+
+
+@pytest.mark.asyncio
+async def test_import_blocklist_reads_text_and_csv_feeds(tmp_path):
+    blocklist = tmp_path / "feed.csv"
+    blocklist.write_text(
+        "# threat feed\n"
+        "ip,source\n"
+        "203.0.113.10,scanner\n"
+        "\"2001:db8::1\",botnet\n"
+        "198.51.100.0/24 ; whole range\n"
+        "\n"
+        "203.0.113.11\n",
+        encoding="utf-8",
+    )
+    manager = IPManager(InMemoryStorage())
+
+    result = await manager.import_blocklist(blocklist)
+
+    assert (result.processed, result.blocked, result.networks, result.invalid) == (5, 3, 1, 1)
+    assert await manager.is_blocked("2001:db8::1") is True
+    assert await manager.is_blocked("203.0.113.11") is True
+    assert await manager.is_blocked("198.51.100.77") is True
+    assert await manager.blocked_networks() == ["198.51.100.0/24"]
+
+
+@pytest.mark.asyncio
+async def test_block_ips_rejects_invalid_batch_settings():
+    manager = IPManager(InMemoryStorage())
+
+    with pytest.raises(ValueError):
+        await manager.block_ips(["203.0.113.10"], batch_size=0)
+    with pytest.raises(ValueError):
+        await manager.block_ips(["203.0.113.10"], duration=0)
+
+
+@pytest.mark.asyncio
+async def test_blocklist_filter_skips_storage_for_addresses_never_listed():
+    storage = CountingStorage()
+    manager = IPManager(storage, blocklist_filter=True, filter_capacity=1000, time_provider=lambda: 0.0)
+    await manager.block_ip("203.0.113.10")
+    await manager.allow_ip("203.0.113.20")
+    storage.get_keys.clear()
+    storage.get_many_calls.clear()
+
+    for index in range(50):
+        assert await manager.get_status(f"198.51.100.{index}") == IPStatus()
+    assert await manager.is_blocked("198.51.100.1") is False
+
+    read_keys = storage.get_keys + [key for keys in storage.get_many_calls for key in keys]
+    assert not [key for key in read_keys if key.startswith(("ip:block:", "ip:allow:"))]
+    assert len(storage.get_many_calls) == 1
+
+    assert await manager.get_status("203.0.113.10") == IPStatus(blocked=True)
+    assert await manager.get_status("203.0.113.20") == IPStatus(allowed=True)
+
+
+@pytest.mark.asyncio
+async def test_blocklist_filter_is_shared_through_storage():
+    now = [0.0]
+    storage = InMemoryStorage()
+    reader = IPManager(storage, blocklist_filter=True, status_cache_size=0, time_provider=lambda: now[0])
+    writer = IPManager(storage, blocklist_filter=True, status_cache_size=0, time_provider=lambda: now[0])
+
+    assert await reader.get_status("203.0.113.10") == IPStatus()
+    await writer.block_ips(["203.0.113.10", "203.0.113.11"])
+    assert await reader.is_blocked("203.0.113.11") is False
+
+    now[0] = 1.0
+    assert await reader.get_status("203.0.113.10") == IPStatus(blocked=True)
+    assert await reader.is_blocked("203.0.113.11") is True
+    assert reader.filter_stats()["block"].bits_set == writer.filter_stats()["block"].bits_set
+
+
+@pytest.mark.asyncio
+async def test_blocklist_filter_follows_invalidations_immediately():
+    storage = InMemoryStorage()
+    reader = IPManager(storage, blocklist_filter=True, time_provider=lambda: 0.0)
+    writer = IPManager(storage, blocklist_filter=True, time_provider=lambda: 0.0)
+
+    assert await reader.get_status("203.0.113.10") == IPStatus()
+    await writer.block_ip("203.0.113.10")
+
+    assert await reader.get_status("203.0.113.10") == IPStatus(blocked=True)
+
+
+@pytest.mark.asyncio
+async def test_blocklist_filter_is_rebuilt_from_entries_written_without_it():
+    storage = InMemoryStorage()
+    writer = IPManager(storage)
+    await writer.block_ip("203.0.113.10")
+    await writer.allow_ip("2001:db8::20")
+    manager = IPManager(storage, blocklist_filter=True, time_provider=lambda: 0.0)
+
+    await manager.warm_up()
+
+    assert manager.filter_stats()["block"].bits_set > 0
+    assert await manager.get_status("203.0.113.10") == IPStatus(blocked=True)
+    assert await manager.get_status("2001:db8::20") == IPStatus(allowed=True)
+    assert await IPManager(storage, blocklist_filter=True).is_blocked("203.0.113.10") is True
+
+
+@pytest.mark.asyncio
+async def test_blocklist_filter_is_not_trusted_when_storage_cannot_enumerate_keys():
+    class NoScanStorage(CountingStorage):
+        def scan_keys(self, prefix):
+            raise NotImplementedError
+
+    storage = NoScanStorage()
+    await storage.set("ip:block:203.0.113.10", "1")
+    await storage.set("ip:control:active", "1")
+    manager = IPManager(storage, blocklist_filter=True, status_cache_size=0, time_provider=lambda: 0.0)
+
+    assert await manager.get_status("203.0.113.10") == IPStatus(blocked=True)
+    assert await manager.get_status("198.51.100.1") == IPStatus()
+    assert ["ip:block:198.51.100.1", "ip:allow:198.51.100.1"] in storage.get_many_calls
+
+
+def test_filter_stats_are_empty_when_the_filter_is_disabled():
+    assert IPManager(InMemoryStorage()).filter_stats() == {}
+    stats = IPManager(InMemoryStorage(), blocklist_filter=True, filter_capacity=1000).filter_stats()
+    assert stats["block"].size_bytes == 1199
+    assert stats["allow"].bits_set == 0
+
+
+def test_limiter_accepts_a_configured_ip_manager():
+    storage = InMemoryStorage()
+    manager = IPManager(storage, blocklist_filter=True)
+
+    limiter = ResponseBandwidthLimiter(ip_manager=manager)
+
+    assert limiter.ip_manager is manager
+    assert limiter.storage is storage
+    with pytest.raises(ValueError):
+        ResponseBandwidthLimiter(storage=InMemoryStorage(), ip_manager=manager)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Windows cannot replace a file that is memory-mapped")
+@pytest.mark.asyncio
+async def test_list_files_are_checked_alongside_storage_entries(tmp_path):
+    now = [0.0]
+    block_path = tmp_path / "block.bin"
+    allow_path = tmp_path / "allow.bin"
+    compile_ip_list(["198.51.100.0/24"], block_path)
+    compile_ip_list(["2001:db8::1"], allow_path)
+    storage = InMemoryStorage()
+    manager = IPManager(storage, block_list_file=block_path, allow_list_file=allow_path, time_provider=lambda: now[0])
+
+    assert await manager.has_control_entries() is True
+    assert await manager.get_status("198.51.100.20") == IPStatus(blocked=True)
+    assert await manager.is_allowed("2001:db8::1") is True
+    assert await manager.is_blocked("203.0.113.10") is False
+
+    compile_ip_list(["203.0.113.0/24"], block_path)
+    now[0] = 1.0
+    assert await manager.is_blocked("203.0.113.10") is True
+    assert await manager.get_status("198.51.100.20") == IPStatus()
+    manager.close()
+
+
+def test_middleware_blocks_addresses_from_a_list_file(tmp_path):
+    block_path = tmp_path / "block.bin"
+    compile_ip_list(["203.0.113.0/24"], block_path)
+    limiter = ResponseBandwidthLimiter(
+        trusted_proxy_headers=True,
+        ip_manager=IPManager(InMemoryStorage(), block_list_file=block_path),
+    )
+    app = FastAPI()
+    limiter.init_app(app)
+
+    @app.get("/items")
+    async def items():
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+    assert client.get("/items", headers={"X-Forwarded-For": "203.0.113.9"}).status_code == 403
+    assert client.get("/items", headers={"X-Forwarded-For": "198.51.100.9"}).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_prefix_aggregation_blocks_the_whole_client_prefix():
+    manager = IPManager(InMemoryStorage(), ipv4_prefix=24, ipv6_prefix=64, blocklist_filter=True)
+
+    await manager.block_ip("2001:db8:1:2::5")
+    await manager.block_ip("198.51.100.7")
+
+    assert manager.address_key("2001:db8:1:2:aaaa::1") == "2001:db8:1:2::/64"
+    assert await manager.is_blocked("2001:db8:1:2:ffff:ffff:ffff:ffff") is True
+    assert (await manager.get_status("2001:db8:1:2::9")).blocked is True
+    assert await manager.is_blocked("2001:db8:1:3::5") is False
+    assert await manager.is_blocked("198.51.100.200") is True
+    assert await manager.is_blocked("198.51.101.7") is False
+
+    await manager.unblock_ip("2001:db8:1:2::1234")
+    assert await manager.is_blocked("2001:db8:1:2::5") is False
+
+
+def test_prefix_aggregation_defaults_to_full_addresses():
+    manager = IPManager(InMemoryStorage())
+
+    assert manager.address_key("2001:DB8::1") == "2001:db8::1"
+    assert manager.address_key("198.51.100.7") == "198.51.100.7"
+
+
+def test_prefix_lengths_are_validated():
+    with pytest.raises(ValueError):
+        IPManager(InMemoryStorage(), ipv6_prefix=0)
+    with pytest.raises(ValueError):
+        IPManager(InMemoryStorage(), ipv4_prefix=33)
+    with pytest.raises(TypeError):
+        IPManager(InMemoryStorage(), ipv6_prefix="64")
+
+
+def test_prefix_aggregation_shares_request_counters_across_a_prefix():
+    storage = InMemoryStorage()
+    limiter = ResponseBandwidthLimiter(trusted_proxy_headers=True, ip_manager=IPManager(storage, ipv6_prefix=64))
+    app = FastAPI()
+
+    @app.get("/limited")
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject(), scope="ip")])
+    async def limited(request: Request):
+        return PlainTextResponse("ok")
+
+    limiter.init_app(app)
+    client = TestClient(app)
+
+    assert client.get("/limited", headers={"X-Forwarded-For": "2001:db8:1:2::1"}).status_code == 200
+    assert client.get("/limited", headers={"X-Forwarded-For": "2001:db8:1:2::2"}).status_code == 429
+    assert client.get("/limited", headers={"X-Forwarded-For": "2001:db8:1:3::1"}).status_code == 200
+
+
+def test_ban_escalation_durations_grow_exponentially_up_to_the_limit():
+    escalation = BanEscalation(base_duration=60, multiplier=2.0, max_duration=300)
+
+    assert [escalation.ban_duration(level) for level in (1, 2, 3, 4, 50)] == [60, 120, 240, 300, 300]
+
+
+def test_ban_escalation_validates_its_settings():
+    with pytest.raises(ValueError):
+        BanEscalation(rejections=0)
+    with pytest.raises(ValueError):
+        BanEscalation(multiplier=0.5)
+    with pytest.raises(ValueError):
+        BanEscalation(base_duration=600, max_duration=60)
+    with pytest.raises(TypeError):
+        IPManager(InMemoryStorage(), ban_escalation={"rejections": 3})
+
+
+@pytest.mark.asyncio
+async def test_record_rejection_escalates_repeated_bans():
+    now = [0.0]
+    storage = InMemoryStorage(time_provider=lambda: now[0])
+    manager = IPManager(
+        storage,
+        ban_escalation=BanEscalation(rejections=3, window=60, base_duration=10, multiplier=3.0),
+        time_provider=lambda: now[0],
+    )
+
+    assert await manager.record_rejection("203.0.113.10") is None
+    assert await manager.record_rejection("203.0.113.10") is None
+    assert await manager.record_rejection("203.0.113.10") == 10
+    assert await manager.is_blocked("203.0.113.10") is True
+
+    now[0] = 11.0
+    assert await manager.is_blocked("203.0.113.10") is False
+    for _ in range(2):
+        assert await manager.record_rejection("203.0.113.10") is None
+    assert await manager.record_rejection("203.0.113.10") == 30
+
+    assert await manager.record_rejection("203.0.113.11") is None
+
+
+@pytest.mark.asyncio
+async def test_record_rejection_is_a_no_op_without_escalation():
+    storage = InMemoryStorage()
+    manager = IPManager(storage)
+
+    assert await manager.record_rejection("203.0.113.10") is None
+    assert await storage.get("escalation:rejections:203.0.113.10") is None
+
+
+@pytest.mark.asyncio
+async def test_rejection_counters_do_not_exhaust_in_memory_capacity():
+    storage = InMemoryStorage(max_keys=100)
+    manager = IPManager(storage, ban_escalation=BanEscalation(rejections=3, base_duration=60))
+
+    for index in range(150):
+        assert await manager.record_rejection(f"10.0.{index // 256}.{index % 256}") is None
+
+    await manager.block_ip("198.51.100.1")
+    for _ in range(2):
+        await manager.record_rejection("203.0.113.10")
+    assert await manager.record_rejection("203.0.113.10") == 60
+    assert await manager.is_blocked("198.51.100.1") is True
+    assert await manager.is_blocked("203.0.113.10") is True
+
+
+def test_repeatedly_rejected_clients_are_blocked_before_policy_evaluation():
+    storage = InMemoryStorage()
+    ip_manager = IPManager(storage, ban_escalation=BanEscalation(rejections=2, base_duration=60))
+    limiter = ResponseBandwidthLimiter(trusted_proxy_headers=True, ip_manager=ip_manager)
+    app = FastAPI()
+
+    @app.get("/limited")
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject())])
+    async def limited(request: Request):
+        return PlainTextResponse("ok")
+
+    limiter.init_app(app)
+    client = TestClient(app)
+    headers = {"X-Forwarded-For": "203.0.113.10"}
+
+    assert client.get("/limited", headers=headers).status_code == 200
+    assert client.get("/limited", headers=headers).status_code == 429
+    assert client.get("/limited", headers=headers).status_code == 429
+    assert client.get("/limited", headers=headers).status_code == 403
+    assert client.get("/limited", headers={"X-Forwarded-For": "203.0.113.11"}).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_imports_beyond_in_memory_capacity_keep_existing_control_data():
+    storage = InMemoryStorage(max_keys=10)
+    manager = IPManager(storage)
+    await manager.block_ip("198.51.100.1")
+    await manager.block_network("192.0.2.0/24")
+
+    with pytest.raises(StorageCapacityError):
+        await manager.block_ips((f"203.0.113.{index}" for index in range(1, 21)), batch_size=20)
+
+    reader = IPManager(storage)
+    assert await reader.has_control_entries() is True
+    assert await reader.get_status("198.51.100.1") == IPStatus(blocked=True)
+    assert await reader.get_status("192.0.2.7") == IPStatus(blocked=True)
@@ -512,3 +512,132 @@ async def test_limiter_remove_policy_cleans_in_memory_request_counters():
     limiter.remove_policy("download")
 
     assert len(limiter._policy_evaluator.request_counters) == 0
+
+
+def test_limiter_snapshot_is_replaced_on_configuration_changes():
+    limiter = ResponseBandwidthLimiter()
+    initial = limiter.snapshot
+
+    limiter.update_route("download", 128)
+    limiter.update_policy("upload", [Rule(count=1, per="second", action=Reject())])
+    limiter.register_scope_resolver("user", lambda request: "user")
+    updated = limiter.snapshot
+
+    assert initial.version == 0
+    assert dict(initial.route_limits) == {}
+    assert updated.version == 3
+    assert updated.route_limits["download"] == 128
+    assert updated.route_policies["upload"][0].count == 1
+    assert set(updated.scope_resolvers) == {"user"}
+    assert updated.configured_names == frozenset({"download", "upload"})
+
+
+def test_limiter_snapshot_mappings_are_read_only():
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("download", 128)
+    snapshot = limiter.snapshot
+
+    with pytest.raises(TypeError):
+        snapshot.route_limits["download"] = 1
+
+    limiter.remove_route("download")
+
+    assert snapshot.route_limits["download"] == 128
+    assert "download" not in limiter.snapshot.route_limits
+
+
+def test_limiter_snapshot_survives_concurrent_updates():
+    import threading
+
+    limiter = ResponseBandwidthLimiter()
+
+    def update(worker: int) -> None:
+        for index in range(50):
+            limiter.update_route(f"route-{worker}-{index}", index + 1)
+
+    threads = [threading.Thread(target=update, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(limiter.snapshot.route_limits) == 200
+    assert limiter.snapshot.version == 200
+
+
+def test_rule_plan_precomputes_windows_scopes_and_priority_ranks():
+    from response_bandwidth_limiter.policy import RulePlan
+
+    rules = [
+        Rule(count=1, per="minute", action=Throttle(bytes_per_sec=100)),
+        Rule(count=1, per="second", action=Reject(), scope="default"),
+        Rule(count=1, per="hour", action=Delay(seconds=0.5)),
+    ]
+    plan = RulePlan(rules)
+
+    assert plan.window_seconds == (60, 1, 3600)
+    assert plan.scopes == ("ip", "default")
+    assert plan.ranks == (2, 0, 1)
+    assert plan.decide(1, 5) is plan.decide(1, 5)
+    assert plan.decide(1, 5) == Reject().decide(5)
+
+
+@pytest.mark.asyncio
+async def test_policy_evaluator_accepts_compiled_plan_and_returns_decision():
+    evaluator = PolicyEvaluator(time_provider=lambda: 0.0)
+    plan = evaluator.compile([
+        Rule(count=1, per="second", action=Delay(seconds=0.5)),
+        Rule(count=1, per="second", action=Throttle(bytes_per_sec=10)),
+    ])
+
+    assert await evaluator.evaluate({"ip": "client"}, "endpoint", plan) is None
+    result = await evaluator.evaluate({"ip": "client"}, "endpoint", plan)
+
+    assert result is not None
+    assert isinstance(result.rule.action, Delay)
+    assert result.decision == PolicyDecision(retry_after=1, pre_delay=0.5)
+
+
+def test_update_policy_stores_compiled_plan_in_snapshot():
+    limiter = ResponseBandwidthLimiter()
+    rules = [Rule(count=1, per="second", action=Reject())]
+
+    limiter.update_policy("download", rules)
+    assert limiter.snapshot.route_plans["download"].rules == tuple(rules)
+
+    limiter.remove_policy("download")
+    assert "download" not in limiter.snapshot.route_plans
+
+
+@pytest.mark.asyncio
+async def test_policy_evaluator_mixes_gcra_and_sliding_window_rules():
+    now = [0.0]
+    evaluator = PolicyEvaluator(time_provider=lambda: now[0])
+    rules = [
+        Rule(count=2, per="minute", action=Reject(), algorithm="gcra"),
+        Rule(count=10, per="minute", action=Throttle(bytes_per_sec=100)),
+    ]
+
+    assert await evaluator.evaluate({"ip": "client"}, "endpoint", rules) is None
+    assert await evaluator.evaluate({"ip": "client"}, "endpoint", rules) is None
+    result = await evaluator.evaluate({"ip": "client"}, "endpoint", rules)
+
+    assert result is not None
+    assert result.rule is rules[0]
+    assert result.retry_after == 30
+
+
+@pytest.mark.asyncio
+async def test_policy_evaluator_token_bucket_rules_allow_bursts():
+    now = [0.0]
+    evaluator = PolicyEvaluator(time_provider=lambda: now[0])
+    rules = [Rule(count=1, per="second", action=Reject(), algorithm="token-bucket", burst=20)]
+
+    for _ in range(20):
+        assert await evaluator.evaluate({"ip": "client"}, "page", rules) is None
+    result = await evaluator.evaluate({"ip": "client"}, "page", rules)
+
+    assert result is not None
+    assert result.retry_after == 1
+    now[0] = 1.0
+    assert await evaluator.evaluate({"ip": "client"}, "page", rules) is None
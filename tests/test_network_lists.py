@@ -0,0 +1,163 @@
+import asyncio
+import json
+from ipaddress import ip_network
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+import response_bandwidth_limiter.ip_manager as ip_manager_module
+from response_bandwidth_limiter import InMemoryStorage, Reject, ResponseBandwidthLimiter, Rule
+from response_bandwidth_limiter.ip_manager import IPManager
+from response_bandwidth_limiter.network_trie import NetworkTrie
+
+
+def test_network_trie_returns_most_specific_match():
+    trie = NetworkTrie([
+        (ip_network("10.0.0.0/8"), "wide"),
+        (ip_network("10.1.0.0/16"), "narrow"),
+        (ip_network("2001:db8::/32"), "v6"),
+        (ip_network("0.0.0.0/0"), "default"),
+    ])
+
+    assert trie.match("10.1.2.3") == "narrow"
+    assert trie.match("10.2.0.1") == "wide"
+    assert trie.match("192.0.2.1") == "default"
+    assert trie.match("2001:db8::1") == "v6"
+    assert trie.match("2001:db9::1") is None
+    assert len(trie) == 4
+
+
+def test_network_trie_matches_host_routes():
+    trie = NetworkTrie([(ip_network("192.0.2.7/32"), True)])
+
+    assert trie.match("192.0.2.7") is True
+    assert trie.match("192.0.2.8") is None
+
+
+@pytest.mark.asyncio
+async def test_ip_manager_blocks_and_allows_networks():
+    manager = IPManager(InMemoryStorage())
+
+    await manager.block_network("203.0.113.0/24")
+    await manager.allow_network("2001:db8:1::/48")
+
+    assert await manager.is_blocked("203.0.113.77") is True
+    assert await manager.is_blocked("203.0.114.1") is False
+    assert await manager.is_allowed("2001:db8:1::42") is True
+    assert await manager.has_control_entries() is True
+    assert await manager.blocked_networks() == ["203.0.113.0/24"]
+
+    await manager.unblock_network("203.0.113.0/24")
+    await manager.remove_allow_network("2001:db8:1::/48")
+
+    assert await manager.is_blocked("203.0.113.77") is False
+    assert await manager.is_allowed("2001:db8:1::42") is False
+
+
+@pytest.mark.asyncio
+async def test_network_entries_are_shared_through_storage():
+    now = [0.0]
+    storage = InMemoryStorage()
+    worker_one = IPManager(storage, time_provider=lambda: now[0])
+    worker_two = IPManager(storage, time_provider=lambda: now[0])
+
+    assert await worker_two.is_blocked("198.51.100.9") is False
+
+    await worker_one.block_network("198.51.100.0/24")
+    assert await worker_two.is_blocked("198.51.100.9") is False
+
+    now[0] = 1.0
+    assert await worker_two.is_blocked("198.51.100.9") is True
+
+    await worker_two.unblock_network("198.51.100.0/24")
+    now[0] = 2.0
+    assert await worker_one.is_blocked("198.51.100.9") is False
+
+
+@pytest.mark.asyncio
+async def test_concurrent_network_updates_from_several_workers_are_all_kept():
+    class YieldingStorage(InMemoryStorage):
+        async def get(self, key):
+            await asyncio.sleep(0)
+            return await super().get(key)
+
+        async def set_fields(self, key, items):
+            await asyncio.sleep(0)
+            await super().set_fields(key, items)
+
+    storage = YieldingStorage()
+    workers = [IPManager(storage, control_refresh_interval=0) for _ in range(4)]
+
+    await asyncio.gather(*(
+        worker.block_network(f"198.51.{index}.0/24") for index, worker in enumerate(workers)
+    ))
+
+    assert await IPManager(storage).blocked_networks() == [f"198.51.{index}.0/24" for index in range(4)]
+
+
+@pytest.mark.asyncio
+async def test_network_lists_saved_as_one_json_value_are_migrated():
+    storage = InMemoryStorage()
+    await storage.set("ip:networks:block", json.dumps({"198.51.100.0/24": None}))
+    await storage.set("ip:networks:version", 3)
+    await storage.set("ip:control:active", "1")
+    manager = IPManager(storage)
+
+    assert (await manager.get_status("198.51.100.7")).blocked is True
+    await manager.block_network("203.0.113.0/24")
+
+    assert await storage.get("ip:networks:block") is None
+    assert await IPManager(storage).blocked_networks() == ["198.51.100.0/24", "203.0.113.0/24"]
+
+
+@pytest.mark.asyncio
+async def test_expired_network_block_falls_back_to_wider_network(monkeypatch):
+    wall_clock = [1000.0]
+    monkeypatch.setattr(ip_manager_module.time, "time", lambda: wall_clock[0])
+    manager = IPManager(InMemoryStorage())
+
+    await manager.block_network("10.0.0.0/8", duration=100)
+    await manager.block_network("10.1.0.0/16", duration=10)
+    assert await manager.is_blocked("10.1.0.1") is True
+
+    wall_clock[0] = 1050.0
+    assert await manager.is_blocked("10.1.0.1") is True
+    assert await manager.blocked_networks() == ["10.0.0.0/8"]
+
+    wall_clock[0] = 1200.0
+    assert await manager.is_blocked("10.1.0.1") is False
+
+
+@pytest.mark.asyncio
+async def test_network_arguments_are_validated():
+    manager = IPManager(InMemoryStorage())
+
+    with pytest.raises(ValueError):
+        await manager.block_network("not-a-network")
+    with pytest.raises(ValueError):
+        await manager.block_network("10.0.0.0/8", duration=0)
+
+
+def test_blocked_network_returns_403_and_allowed_network_skips_policy():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter(trusted_proxy_headers=True)
+
+    @app.get("/items")
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject())])
+    async def items():
+        return PlainTextResponse("ok")
+
+    limiter.init_app(app)
+    client = TestClient(app)
+
+    async def prepare() -> None:
+        await limiter.block_network("203.0.113.0/24")
+        await limiter.allow_network("192.0.2.0/28")
+
+    asyncio.run(prepare())
+
+    assert client.get("/items", headers={"X-Forwarded-For": "203.0.113.200"}).status_code == 403
+    assert client.get("/items", headers={"X-Forwarded-For": "192.0.2.3"}).status_code == 200
+    assert client.get("/items", headers={"X-Forwarded-For": "192.0.2.3"}).status_code == 200
@@ -0,0 +1,115 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
+
+from response_bandwidth_limiter import Reject, ResponseBandwidthLimiter, Rule
+from response_bandwidth_limiter.path_patterns import PathPatternTrie
+
+
+def test_path_pattern_trie_uses_longest_prefix():
+    trie = PathPatternTrie(["/static/", "/static/images/", "/api"])
+
+    assert trie.match("/static/app.js") == "/static/"
+    assert trie.match("/static/images/logo.png") == "/static/images/"
+    assert trie.match("/api/items") == "/api"
+    assert trie.match("/stat") is None
+    assert trie.match("/") is None
+
+
+def test_path_pattern_trie_matches_globs_against_whole_path():
+    trie = PathPatternTrie(["/files/", "/files/*.pdf", "/reports/?/summary"])
+
+    assert trie.match("/files/a.pdf") == "/files/*.pdf"
+    assert trie.match("/files/a.txt") == "/files/"
+    assert trie.match("/reports/1/summary") == "/reports/?/summary"
+    assert trie.match("/reports/12/summary") is None
+
+
+def test_path_pattern_trie_splits_shared_edges():
+    trie = PathPatternTrie(["/abc", "/abd", "/ab"])
+
+    assert trie.match("/abcx") == "/abc"
+    assert trie.match("/abdx") == "/abd"
+    assert trie.match("/abe") == "/ab"
+    assert not PathPatternTrie()
+
+
+def test_update_route_prefix_limits_mounted_sub_application(recorded_limit_calls):
+    async def asset(request):
+        return PlainTextResponse("a" * 100)
+
+    static_app = Starlette(routes=[Route("/{name}", endpoint=asset)])
+    app = Starlette(routes=[Mount("/static", app=static_app)])
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route_prefix("/static/", 64)
+    limiter.init_app(app, install_signal_handlers=False)
+
+    response = TestClient(app).get("/static/app.js")
+
+    assert response.status_code == 200
+    assert [call["rate"] for call in recorded_limit_calls] == [64]
+
+
+def test_exact_limits_take_precedence_over_path_patterns(recorded_limit_calls):
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route_prefix("/downloads/", 100)
+    limiter.update_route("special_download", 10)
+    limiter.init_app(app, install_signal_handlers=False)
+
+    @app.get("/downloads/special")
+    async def special_download():
+        return PlainTextResponse("a" * 20)
+
+    @app.get("/downloads/{name}")
+    async def download(name: str):
+        return PlainTextResponse("b" * 20)
+
+    client = TestClient(app)
+    client.get("/downloads/special")
+    client.get("/downloads/other")
+
+    assert [call["rate"] for call in recorded_limit_calls] == [10, 100]
+
+
+def test_update_policy_prefix_applies_request_count_rules():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_policy_prefix("/api/*/export", [Rule(count=1, per="second", action=Reject(detail="export limited"))])
+    limiter.init_app(app, install_signal_handlers=False)
+
+    @app.get("/api/{version}/export")
+    async def export(version: str):
+        return PlainTextResponse("ok")
+
+    client = TestClient(app)
+
+    assert client.get("/api/v1/export").status_code == 200
+    rejected = client.get("/api/v1/export")
+    assert rejected.status_code == 429
+    assert rejected.json()["detail"] == "export limited"
+
+    limiter.remove_policy_prefix("/api/*/export")
+    assert client.get("/api/v1/export").status_code == 200
+
+
+def test_path_pattern_configuration_is_kept_out_of_route_index_names():
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("download", 10)
+    limiter.update_route_prefix("/static/", 100)
+
+    assert limiter.snapshot.configured_names == frozenset({"download"})
+    assert limiter.snapshot.path_patterns.patterns == frozenset({"/static/"})
+
+    limiter.remove_route_prefix("/static/")
+    assert not limiter.snapshot.path_patterns
+
+
+def test_update_route_prefix_rejects_relative_patterns():
+    limiter = ResponseBandwidthLimiter()
+
+    with pytest.raises(ValueError):
+        limiter.update_route_prefix("static/", 100)
@@ -0,0 +1,151 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Host, Route
+
+from response_bandwidth_limiter import Reject, ResponseBandwidthLimiter, Rule
+
+
+def test_method_qualified_limit_takes_precedence_over_plain_limit(recorded_limit_calls):
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+
+    @app.api_route("/download", methods=["GET", "POST"])
+    @limiter.limit(100)
+    @limiter.limit(10, methods="get")
+    async def download():
+        return PlainTextResponse("a" * 20)
+
+    limiter.init_app(app, install_signal_handlers=False)
+    client = TestClient(app)
+    client.get("/download")
+    client.post("/download")
+
+    assert [call["rate"] for call in recorded_limit_calls] == [10, 100]
+    assert limiter.get_limit("download", method="GET") == 10
+    assert limiter.get_limit("download", method="POST") == 100
+    assert limiter.get_limit("download") == 100
+
+
+def test_method_qualified_limit_without_plain_limit_skips_other_methods(recorded_limit_calls):
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("download", 10, methods=["GET"])
+    limiter.init_app(app, install_signal_handlers=False)
+
+    @app.api_route("/download", methods=["GET", "HEAD"])
+    async def download():
+        return PlainTextResponse("a" * 20)
+
+    client = TestClient(app)
+    client.head("/download")
+    client.get("/download")
+
+    assert [call["rate"] for call in recorded_limit_calls] == [10]
+    assert limiter.snapshot.configured_names == frozenset({"download"})
+
+
+def test_host_qualified_limits_apply_per_virtual_host(recorded_limit_calls):
+    async def download(request):
+        return PlainTextResponse("a" * 20)
+
+    app = Starlette(
+        routes=[
+            Host("api.example.com", app=Starlette(routes=[Route("/download", endpoint=download)])),
+            Host("www.example.com", app=Starlette(routes=[Route("/download", endpoint=download)])),
+        ]
+    )
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("download", 10, host="API.example.com")
+    limiter.update_route("download", 50, methods="GET", host="www.example.com")
+    limiter.update_route("download", 100)
+    limiter.init_app(app, install_signal_handlers=False)
+
+    client = TestClient(app)
+    client.get("/download", headers={"host": "api.example.com:8000"})
+    client.get("/download", headers={"host": "www.example.com"})
+    client.head("/download", headers={"host": "www.example.com"})
+
+    assert [call["rate"] for call in recorded_limit_calls] == [10, 50, 100]
+
+
+def test_method_and_host_qualifier_is_more_specific_than_method_only():
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("download", 100, methods="GET")
+    limiter.update_route("download", 50, host="cdn.example.com")
+    limiter.update_route("download", 10, methods="GET", host="cdn.example.com")
+
+    assert limiter.get_limit("download", method="GET", host="cdn.example.com") == 10
+    assert limiter.get_limit("download", method="GET", host="www.example.com") == 100
+    assert limiter.get_limit("download", method="POST", host="cdn.example.com") == 50
+    assert limiter.get_limit("download", method="POST") is None
+
+
+def test_method_qualified_policies_use_separate_counters():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+
+    @app.api_route("/items", methods=["GET", "POST"])
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject(detail="writes limited"))], methods="POST")
+    async def items():
+        return PlainTextResponse("ok")
+
+    limiter.init_app(app, install_signal_handlers=False)
+    client = TestClient(app)
+
+    assert client.post("/items").status_code == 200
+    rejected = client.post("/items")
+    assert rejected.status_code == 429
+    assert rejected.json()["detail"] == "writes limited"
+    assert client.get("/items").status_code == 200
+    assert client.get("/items").status_code == 200
+
+    limiter.remove_policy("items", methods="POST")
+    assert client.post("/items").status_code == 200
+    assert limiter.policies == {}
+
+
+def test_remove_route_only_removes_matching_qualifier():
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("download", 100)
+    limiter.update_route("download", 10, methods=["GET", "HEAD"])
+
+    limiter.remove_route("download", methods="HEAD")
+
+    assert limiter.routes == {"download": 100, "download[GET]": 10}
+    assert limiter.get_limit("download", method="HEAD") == 100
+    assert limiter.snapshot.qualified_variants == {"download": (("GET", None, "download[GET]"),)}
+
+
+def test_qualified_path_pattern_limits(recorded_limit_calls):
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route_prefix("/files/", 10, methods="GET")
+    limiter.init_app(app, install_signal_handlers=False)
+
+    @app.api_route("/files/{name}", methods=["GET", "PUT"])
+    async def files(name: str):
+        return PlainTextResponse("a" * 20)
+
+    client = TestClient(app)
+    client.put("/files/a.txt")
+    client.get("/files/a.txt")
+
+    assert [call["rate"] for call in recorded_limit_calls] == [10]
+    assert limiter.snapshot.path_patterns.patterns == frozenset({"/files/"})
+
+    limiter.remove_route_prefix("/files/", methods="GET")
+    assert not limiter.snapshot.path_patterns
+
+
+@pytest.mark.parametrize(
+    ("methods", "host"),
+    [([], None), ([""], None), (None, ""), ([1], None)],
+)
+def test_invalid_qualifiers_are_rejected(methods, host):
+    limiter = ResponseBandwidthLimiter()
+
+    with pytest.raises(ValueError):
+        limiter.limit(10, methods=methods, host=host)
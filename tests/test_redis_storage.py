@@ -1,13 +1,25 @@
+import asyncio
+import hashlib
 import os
 import uuid
 
 import pytest
 
-from response_bandwidth_limiter import InMemoryStorage, RedisStorage, Reject, Rule, SlidingWindowResult, StorageUnavailableError
+from response_bandwidth_limiter import (
+    InMemoryStorage,
+    RateLimitResult,
+    RedisStorage,
+    Reject,
+    Rule,
+    SlidingWindowResult,
+    StorageUnavailableError,
+)
+from response_bandwidth_limiter.ip_manager import IPManager, IPStatus
 from response_bandwidth_limiter.policy import PolicyEvaluator
 
 try:
     from redis.asyncio import Redis
+    from redis.exceptions import NoScriptError
 except ImportError:
     Redis = None
 
@@ -30,11 +42,29 @@ class FakePipeline:
         self._operations.append(("incr", key))
         return self
 
+    def set(self, key, value, ex=None):
+        self._operations.append(("set", key, value, ex))
+        return self
+
+    def setbit(self, key, offset, value):
+        self._operations.append(("setbit", key, offset, value))
+        return self
+
+    def bitop(self, operation, destination, *sources):
+        self._operations.append(("bitop", operation, destination, sources))
+        return self
+
+    def delete(self, key):
+        self._operations.append(("delete", key))
+        return self
+
     def expire(self, key, expire):
         self._operations.append(("expire", key, expire))
         return self
 
     async def execute(self):
+        if self._client.error is not None:
+            raise self._client.error
         results = []
         for operation in self._operations:
             if operation[0] == "incr":
@@ -42,9 +72,44 @@ class FakePipeline:
             elif operation[0] == "expire":
                 self._client.expirations[operation[1]] = operation[2]
                 results.append(True)
+            elif operation[0] == "set":
+                results.append(await self._client.set(operation[1], operation[2], ex=operation[3]))
+            elif operation[0] == "setbit":
+                results.append(self._client.setbit(operation[1], operation[2], operation[3]))
+            elif operation[0] == "bitop":
+                results.append(self._client.bitop(operation[1], operation[2], *operation[3]))
+            elif operation[0] == "delete":
+                results.append(await self._client.delete(operation[1]))
+        self._client.calls.append({"pipeline": [operation[0] for operation in self._operations]})
         return results
 
 
+class FakePubSub:
+    def __init__(self, client):
+        self._client = client
+        self.channels = set()
+        self.messages = asyncio.Queue()
+        self.closed = False
+
+    async def subscribe(self, channel):
+        if self._client.error is not None:
+            raise self._client.error
+        self.channels.add(channel)
+        self._client.subscribers.append(self)
+
+    async def listen(self):
+        while True:
+            message = await self.messages.get()
+            if isinstance(message, Exception):
+                raise message
+            yield message
+
+    async def aclose(self):
+        self.closed = True
+        if self in self._client.subscribers:
+            self._client.subscribers.remove(self)
+
+
 class FakeRedisClient:
     def __init__(self, result=None, error: Exception | None = None):
         self.result = result or [1, "1.0", "1.0"]
@@ -52,18 +117,62 @@ class FakeRedisClient:
         self.calls = []
         self.data = {}
         self.expirations = {}
+        self.subscribers = []
+        self.scripts = {}
+        self.pings = 0
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    async def publish(self, channel, message):
+        if self.error is not None:
+            raise self.error
+        for subscriber in self.subscribers:
+            if channel in subscriber.channels:
+                subscriber.messages.put_nowait({"type": "message", "channel": channel, "data": message})
+        return len(self.subscribers)
 
-    async def eval(self, script, numkeys, *args):
-        self.calls.append({"script": script, "numkeys": numkeys, "args": args})
+    async def evalsha(self, sha, numkeys, *args):
         if self.error is not None:
             raise self.error
+        if sha not in self.scripts:
+            raise NoScriptError("NOSCRIPT No matching script. Please use EVAL.")
+        self.calls.append({"script": self.scripts[sha], "numkeys": numkeys, "args": args})
         return self.result
 
+    async def script_load(self, script):
+        if self.error is not None:
+            raise self.error
+        sha = hashlib.sha1(script.encode("utf-8")).hexdigest()
+        self.scripts[sha] = script
+        return sha
+
+    async def scan_iter(self, match=None, count=None):
+        if self.error is not None:
+            raise self.error
+        self.calls.append({"scan": match})
+        prefix = match[:-1].replace("\\", "")
+        for key in list(self.data):
+            if key.startswith(prefix):
+                yield key
+
+    async def ping(self):
+        if self.error is not None:
+            raise self.error
+        self.pings += 1
+        return True
+
     async def get(self, key):
         if self.error is not None:
             raise self.error
         return self.data.get(key)
 
+    async def mget(self, keys):
+        if self.error is not None:
+            raise self.error
+        self.calls.append({"mget": list(keys)})
+        return [self.data.get(key) for key in keys]
+
     async def set(self, key, value, ex=None):
         if self.error is not None:
             raise self.error
@@ -86,9 +195,54 @@ class FakeRedisClient:
         self.expirations.pop(key, None)
         return 1
 
+    async def hgetall(self, key):
+        if self.error is not None:
+            raise self.error
+        return dict(self.data.get(key, {}))
+
+    async def hset(self, key, mapping):
+        if self.error is not None:
+            raise self.error
+        self.calls.append({"hset": key, "fields": sorted(mapping)})
+        self.data.setdefault(key, {}).update(mapping)
+        return len(mapping)
+
+    async def hdel(self, key, *fields):
+        if self.error is not None:
+            raise self.error
+        self.calls.append({"hdel": key, "fields": list(fields)})
+        for field in fields:
+            self.data.get(key, {}).pop(field, None)
+        return len(fields)
+
     def pipeline(self, transaction=True):
         return FakePipeline(self)
 
+    def setbit(self, key, offset, value):
+        bitmap = bytearray(self.data.get(key, b""))
+        if offset >> 3 >= len(bitmap):
+            bitmap.extend(bytes((offset >> 3) + 1 - len(bitmap)))
+        bitmap[offset >> 3] |= 0x80 >> (offset & 7)
+        self.data[key] = bytes(bitmap)
+        return 0
+
+    def bitop(self, operation, destination, *sources):
+        assert operation == "OR"
+        values = [bytes(self.data.get(source, b"")) for source in sources]
+        size = max(len(value) for value in values)
+        merged = bytearray(size)
+        for value in values:
+            for index, byte in enumerate(value):
+                merged[index] |= byte
+        self.data[destination] = bytes(merged)
+        return size
+
+    async def execute_command(self, *args, **options):
+        if self.error is not None:
+            raise self.error
+        assert args[0] == "GET" and "NEVER_DECODE" in options
+        return self.data.get(args[1])
+
     async def aclose(self):
         return None
 
@@ -99,14 +253,15 @@ class FakeRedisCounterClient:
         self.hit_counts = {}
         self.current_time = 0.0
 
-    async def eval(self, script, numkeys, *args):
-        self.calls.append({"script": script, "numkeys": numkeys, "args": args})
-        counter_key = args[0]
-        hit_count = self.hit_counts.get(counter_key, 0) + 1
-        self.hit_counts[counter_key] = hit_count
+    async def evalsha(self, sha, numkeys, *args):
+        self.calls.append({"sha": sha, "numkeys": numkeys, "args": args})
         self.current_time += 1.0
-        oldest_timestamp = self.current_time - hit_count + 1.0
-        return [hit_count, str(oldest_timestamp), str(self.current_time)]
+        result = []
+        for counter_key in args[:numkeys]:
+            hit_count = self.hit_counts.get(counter_key, 0) + 1
+            self.hit_counts[counter_key] = hit_count
+            result.extend([hit_count, str(self.current_time - hit_count + 1.0)])
+        return [*result, str(self.current_time)]
 
     async def aclose(self):
         return None
@@ -170,6 +325,27 @@ async def test_redis_storage_supports_generic_get_set_incr_delete():
     assert await storage.get("ip:block:203.0.113.10") is None
 
 
+@pytest.mark.asyncio
+async def test_redis_storage_get_many_uses_single_mget():
+    client = FakeRedisClient()
+    storage = RedisStorage(client=client)
+
+    await storage.set("ip:block:203.0.113.10", "1")
+    await storage.set("counter", {"value": 1})
+
+    assert await storage.get_many(["ip:block:203.0.113.10", "missing", "counter"]) == ["1", None, {"value": 1}]
+    assert client.calls == [{"mget": ["rbl:data:ip:block:203.0.113.10", "rbl:data:missing", "rbl:data:counter"]}]
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_get_many_applies_failure_modes_per_key():
+    storage = RedisStorage(client=FakeRedisClient(error=RuntimeError("down")), control_failure_mode="closed")
+
+    assert await storage.get_many(["counter"]) == [None]
+    with pytest.raises(StorageUnavailableError):
+        await storage.get_many(["counter", "ip:block:203.0.113.10"])
+
+
 @pytest.mark.asyncio
 async def test_redis_storage_counter_fail_open_returns_non_matching_hit_result():
     client = FakeRedisClient(error=RuntimeError("redis down"))
@@ -203,6 +379,105 @@ async def test_redis_storage_counter_local_memory_fallback_uses_in_memory_storag
     assert second.hit_count == 2
 
 
+@pytest.mark.asyncio
+async def test_redis_storage_records_all_rule_hits_in_one_script_call():
+    client = FakeRedisCounterClient()
+    storage = RedisStorage(client)
+    evaluator = PolicyEvaluator(storage=storage)
+    rules = [
+        Rule(count=1, per="second", action=Reject()),
+        Rule(count=5, per="minute", action=Reject()),
+        Rule(count=100, per="hour", action=Reject()),
+    ]
+
+    assert await evaluator.evaluate({"ip": "203.0.113.10"}, "download", rules) is None
+    result = await evaluator.evaluate({"ip": "203.0.113.10"}, "download", rules)
+
+    assert result is not None
+    assert result.rule is rules[0]
+    assert len(client.calls) == 2
+    call = client.calls[0]
+    assert call["numkeys"] == 3
+    assert call["args"][:3] == (
+        "rbl:counter:download:0:203.0.113.10",
+        "rbl:counter:download:1:203.0.113.10",
+        "rbl:counter:download:2:203.0.113.10",
+    )
+    assert call["args"][4:] == ("1", "60", "3600")
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_record_hits_parses_every_window():
+    client = FakeRedisClient(result=[2, "10.5", 1, "", "11.0"])
+    storage = RedisStorage(client)
+
+    results = await storage.record_hits([("client-a", "download", 0, 1), ("client-a", "download", 1, 60)])
+
+    assert results == [
+        SlidingWindowResult(hit_count=2, oldest_timestamp=10.5, current_timestamp=11.0),
+        SlidingWindowResult(hit_count=1, oldest_timestamp=None, current_timestamp=11.0),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_record_hits_applies_counter_failure_modes():
+    hits = [("client-a", "download", 0, 60), ("client-a", "download", 1, 3600)]
+    failing = FakeRedisClient(error=RuntimeError("redis down"))
+
+    opened = await RedisStorage(failing, counter_failure_mode="open").record_hits(hits)
+    assert [result.hit_count for result in opened] == [0, 0]
+
+    with pytest.raises(StorageUnavailableError):
+        await RedisStorage(failing, counter_failure_mode="closed").record_hits(hits)
+
+    fallback = RedisStorage(failing, counter_failure_mode="local-memory-fallback")
+    await fallback.record_hits(hits)
+    assert [result.hit_count for result in await fallback.record_hits(hits)] == [2, 2]
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_calls_scripts_by_sha_and_reloads_on_noscript():
+    client = FakeRedisClient(result=[1, "1.0", "1.0"])
+    storage = RedisStorage(client)
+
+    await storage.record_hit("client-a", "download", 0, 60)
+    await storage.record_hit("client-a", "download", 0, 60)
+    assert len(client.scripts) == 1
+
+    client.scripts.clear()
+    await storage.record_hit("client-a", "download", 0, 60)
+
+    assert len(client.calls) == 3
+    assert len(client.scripts) == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_warm_up_loads_scripts_and_opens_connections():
+    client = FakeRedisClient(result=[1, "1.0", 1, "1.0", "1.0"])
+    storage = RedisStorage(client, warm_up_connections=4)
+
+    await storage.warm_up()
+    await storage.record_hits([("client-a", "download", 0, 1), ("client-a", "download", 1, 60)])
+
+    assert client.pings == 4
+    assert len(client.scripts) == 4
+    assert len(client.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_warm_up_failures_do_not_raise(caplog):
+    storage = RedisStorage(FakeRedisClient(error=RuntimeError("redis down")))
+
+    await storage.warm_up()
+
+    assert "Could not warm up the Redis storage." in caplog.text
+
+
+def test_redis_storage_rejects_negative_warm_up_connections():
+    with pytest.raises(ValueError):
+        RedisStorage(FakeRedisClient(), warm_up_connections=-1)
+
+
 @pytest.mark.asyncio
 async def test_redis_storage_control_failure_mode_is_not_fail_open():
     client = FakeRedisClient(error=RuntimeError("redis down"))
@@ -396,4 +671,216 @@ async def test_redis_storage_shares_counters_across_evaluators():
         keys = await raw_client.keys(f"{prefix}:*")
         if keys:
             await raw_client.delete(*keys)
-        await raw_client.aclose()
\ No newline at end of file
+        await raw_client.aclose()
+
+@pytest.mark.asyncio
+async def test_redis_storage_invalidates_cached_ip_status_across_workers():
+    client = FakeRedisClient()
+    writer = IPManager(RedisStorage(client=client))
+    reader_storage = RedisStorage(client=client)
+    reader = IPManager(reader_storage)
+
+    assert await reader.get_status("203.0.113.10") == IPStatus()
+    await writer.block_ip("203.0.113.10")
+    await asyncio.sleep(0)
+
+    client.calls.clear()
+    assert await reader.get_status("203.0.113.10") == IPStatus(blocked=True)
+    assert await reader.get_status("203.0.113.10") == IPStatus(blocked=True)
+    assert len(client.calls) == 1
+
+    await reader_storage.close()
+    assert client.subscribers == []
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_notifies_listeners_when_subscription_is_lost():
+    client = FakeRedisClient()
+    storage = RedisStorage(client=client)
+    received = []
+
+    assert await storage.subscribe_invalidations(received.append) is True
+    client.subscribers[0].messages.put_nowait(ConnectionError("lost"))
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert received == [None]
+    assert client.subscribers == []
+    assert await storage.subscribe_invalidations(received.append) is True
+    await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_does_not_cache_ip_status_without_a_subscription():
+    storage = RedisStorage(client=FakeRedisClient(error=RuntimeError("down")), control_failure_mode="local-memory-fallback")
+
+    assert await storage.subscribe_invalidations(lambda key: None) is False
+    await storage.publish_invalidation("ip:block:203.0.113.10")
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_set_many_writes_through_one_pipeline():
+    client = FakeRedisClient()
+    storage = RedisStorage(client=client)
+
+    await storage.set_many({"ip:block:203.0.113.1": "1", "ip:block:203.0.113.2": "1"}, expire=60)
+
+    assert await storage.get_many(["ip:block:203.0.113.1", "ip:block:203.0.113.2"]) == ["1", "1"]
+    assert client.expirations == {"rbl:data:ip:block:203.0.113.1": 60, "rbl:data:ip:block:203.0.113.2": 60}
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_set_many_uses_control_failure_mode():
+    fallback = InMemoryStorage()
+    storage = RedisStorage(
+        client=FakeRedisClient(error=RuntimeError("down")),
+        control_failure_mode="local-memory-fallback",
+        control_fallback_storage=fallback,
+    )
+
+    await storage.set_many({"ip:block:203.0.113.1": "1"})
+    assert await fallback.get("ip:block:203.0.113.1") == "1"
+
+    closed = RedisStorage(client=FakeRedisClient(error=RuntimeError("down")))
+    with pytest.raises(StorageUnavailableError):
+        await closed.set_many({"ip:block:203.0.113.1": "1"})
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_sets_bits_with_setbit_or_bitop_merge():
+    client = FakeRedisClient()
+    storage = RedisStorage(client=client)
+
+    await storage.set_bits("ip:filter:block", [0, 9])
+    assert await storage.get_bits("ip:filter:block") == bytes([0x80, 0x40])
+    assert client.calls[-1] == {"pipeline": ["setbit", "setbit"]}
+
+    await storage.set_bits("ip:filter:block", range(16, 16 + 5000))
+    assert client.calls[-1] == {"pipeline": ["set", "bitop", "delete"]}
+    bitmap = await storage.get_bits("ip:filter:block")
+    assert bitmap[:3] == bytes([0x80, 0x40, 0xFF])
+    assert len(bitmap) == (16 + 5000 + 7) // 8
+    assert list(client.data) == ["rbl:data:ip:filter:block"]
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_bitmaps_use_control_failure_mode():
+    fallback = InMemoryStorage()
+    storage = RedisStorage(
+        client=FakeRedisClient(error=RuntimeError("down")),
+        control_failure_mode="local-memory-fallback",
+        control_fallback_storage=fallback,
+    )
+
+    await storage.set_bits("ip:filter:block", [1])
+    assert await storage.get_bits("ip:filter:block") == bytes([0x40])
+
+    closed = RedisStorage(client=FakeRedisClient(error=RuntimeError("down")))
+    with pytest.raises(StorageUnavailableError):
+        await closed.get_bits("ip:filter:block")
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_record_gcra_runs_one_script_on_one_key():
+    client = FakeRedisClient(result=[0, 0, "2.5"])
+    storage = RedisStorage(client)
+
+    result = await storage.record_gcra("client-a", "download", 0, 10000, 3600)
+
+    assert result == RateLimitResult(allowed=False, remaining=0, retry_after=2.5)
+    assert client.calls[-1]["numkeys"] == 1
+    assert client.calls[-1]["args"] == ("rbl:gcra:download:0:client-a", "3600", "10000")
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_record_gcra_applies_counter_failure_modes():
+    failing = FakeRedisClient(error=RuntimeError("redis down"))
+
+    opened = await RedisStorage(failing, counter_failure_mode="open").record_gcra("client-a", "download", 0, 5, 60)
+    assert opened == RateLimitResult(allowed=True, remaining=5, retry_after=0.0)
+
+    with pytest.raises(StorageUnavailableError):
+        await RedisStorage(failing, counter_failure_mode="closed").record_gcra("client-a", "download", 0, 5, 60)
+
+    fallback = RedisStorage(failing, counter_failure_mode="local-memory-fallback")
+    assert (await fallback.record_gcra("client-a", "download", 0, 1, 60)).allowed
+    assert not (await fallback.record_gcra("client-a", "download", 0, 1, 60)).allowed
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_record_token_bucket_runs_one_script_on_one_key():
+    client = FakeRedisClient(result=[1, 19, "0"])
+    storage = RedisStorage(client)
+
+    result = await storage.record_token_bucket("client-a", "search", 0, 1, 1, 20)
+
+    assert result == RateLimitResult(allowed=True, remaining=19, retry_after=0.0)
+    assert client.calls[-1]["numkeys"] == 1
+    assert client.calls[-1]["args"] == ("rbl:tokens:search:0:client-a", "1", "1", "20")
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_record_token_bucket_applies_counter_failure_modes():
+    failing = FakeRedisClient(error=RuntimeError("redis down"))
+
+    opened = await RedisStorage(failing, counter_failure_mode="open").record_token_bucket("client-a", "search", 0, 1, 1, 20)
+    assert opened == RateLimitResult(allowed=True, remaining=20, retry_after=0.0)
+
+    with pytest.raises(StorageUnavailableError):
+        await RedisStorage(failing, counter_failure_mode="closed").record_token_bucket("client-a", "search", 0, 1, 1, 20)
+
+    fallback = RedisStorage(failing, counter_failure_mode="local-memory-fallback")
+    assert (await fallback.record_token_bucket("client-a", "search", 0, 1, 60, 1)).allowed
+    assert not (await fallback.record_token_bucket("client-a", "search", 0, 1, 60, 1)).allowed
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_scan_keys_matches_the_data_prefix():
+    client = FakeRedisClient()
+    storage = RedisStorage(client, prefix="app[1]")
+    await storage.set("ip:block:203.0.113.10", "1")
+    await storage.set("ip:allow:203.0.113.20", "1")
+
+    assert [key async for key in storage.scan_keys("ip:block:")] == ["ip:block:203.0.113.10"]
+    assert client.calls[-1] == {"scan": "app\\[1\\]:data:ip:block:*"}
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_scan_keys_uses_control_failure_mode():
+    failing = FakeRedisClient(error=RuntimeError("redis down"))
+
+    with pytest.raises(StorageUnavailableError):
+        [key async for key in RedisStorage(failing).scan_keys("ip:block:")]
+
+    fallback = InMemoryStorage()
+    await fallback.set("ip:block:203.0.113.10", "1")
+    storage = RedisStorage(failing, control_failure_mode="local-memory-fallback", control_fallback_storage=fallback)
+    assert [key async for key in storage.scan_keys("ip:block:")] == ["ip:block:203.0.113.10"]
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_updates_fields_without_rewriting_the_map():
+    client = FakeRedisClient()
+    storage = RedisStorage(client)
+
+    await storage.set_fields("ip:networks:block:entries", {"198.51.100.0/24": None, "203.0.113.0/24": 1.5})
+    await storage.delete_fields("ip:networks:block:entries", ["203.0.113.0/24"])
+
+    assert await storage.get_fields("ip:networks:block:entries") == {"198.51.100.0/24": None}
+    assert client.calls == [
+        {"hset": "rbl:data:ip:networks:block:entries", "fields": ["198.51.100.0/24", "203.0.113.0/24"]},
+        {"hdel": "rbl:data:ip:networks:block:entries", "fields": ["203.0.113.0/24"]},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_redis_storage_field_operations_use_control_failure_mode():
+    failing = FakeRedisClient(error=RuntimeError("redis down"))
+
+    with pytest.raises(StorageUnavailableError):
+        await RedisStorage(failing).set_fields("ip:networks:block:entries", {"198.51.100.0/24": None})
+
+    fallback = InMemoryStorage()
+    storage = RedisStorage(failing, control_failure_mode="local-memory-fallback", control_fallback_storage=fallback)
+    await storage.set_fields("ip:networks:block:entries", {"198.51.100.0/24": None})
+    assert await storage.get_fields("ip:networks:block:entries") == {"198.51.100.0/24": None}
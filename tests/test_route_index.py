@@ -0,0 +1,133 @@
+from fastapi import FastAPI
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Host, Mount, Route
+
+from response_bandwidth_limiter import Reject, ResponseBandwidthLimiter, Rule
+from response_bandwidth_limiter.route_index import RouteIndex
+
+
+async def endpoint(request):
+    return PlainTextResponse("ok")
+
+
+def _scope(path: str, method: str = "GET", headers=None) -> dict:
+    return {"type": "http", "path": path, "method": method, "headers": headers or []}
+
+
+def test_route_index_keeps_only_configured_routes():
+    routes = [Route(f"/route-{index}", endpoint=endpoint, name=f"route_{index}") for index in range(100)]
+    index = RouteIndex(routes, {"route_42"})
+
+    assert index.indexed_route_count == 1
+    assert index.resolve(_scope("/route-42"), "/route-42") == "route_42"
+    assert index.resolve(_scope("/route-41"), "/route-41") is None
+
+
+def test_route_index_resolves_nested_mounts_and_route_paths():
+    routes = [
+        Mount("/api", routes=[Route("/items/{item_id}", endpoint=endpoint, name="item")]),
+        Route("/files/{name}", endpoint=endpoint),
+    ]
+    index = RouteIndex(routes, {"item", "files/{name}"})
+
+    assert index.resolve(_scope("/api/items/1"), "/api/items/1") == "item"
+    assert index.resolve(_scope("/files/a.txt"), "/files/a.txt") == "files/{name}"
+
+
+def test_route_index_only_tries_routes_sharing_the_literal_prefix(monkeypatch):
+    routes = [Route(f"/route-{index}/{{item_id}}", endpoint=endpoint, name=f"route_{index}") for index in range(1000)]
+    index = RouteIndex(routes, {f"route_{index}" for index in range(1000)})
+    tried = []
+    original_matches = Route.matches
+
+    def counting_matches(self, scope):
+        tried.append(self.name)
+        return original_matches(self, scope)
+
+    monkeypatch.setattr(Route, "matches", counting_matches)
+
+    assert index.resolve(_scope("/route-999/42"), "/route-999/42") == "route_999"
+    assert tried == ["route_999"]
+
+
+def test_route_index_keeps_declaration_order_across_prefix_groups():
+    routes = [
+        Route("/{section}/latest", endpoint=endpoint, name="section_latest"),
+        Route("/news/latest", endpoint=endpoint, name="news_latest"),
+        Mount("/api", routes=[Route("/{item_id}", endpoint=endpoint, name="api_item")]),
+        Route("/api/status", endpoint=endpoint, name="api_status"),
+    ]
+    index = RouteIndex(routes, {"section_latest", "news_latest", "api_item", "api_status"})
+
+    assert index.resolve(_scope("/news/latest"), "/news/latest") == "section_latest"
+    assert index.resolve(_scope("/api/status"), "/api/status") == "api_item"
+    assert index.resolve(_scope("/api/1"), "/api/1") == "api_item"
+
+
+def test_route_index_resolves_host_routes_per_host():
+    api = Starlette(routes=[Route("/data", endpoint=endpoint, name="api_data")])
+    routes = [Host("api.example.com", app=api)]
+    index = RouteIndex(routes, {"api_data"})
+
+    assert index.resolve(_scope("/data", headers=[(b"host", b"www.example.com")]), "/data") is None
+    assert index.resolve(_scope("/data", headers=[(b"host", b"api.example.com")]), "/data") == "api_data"
+
+
+def test_route_index_negative_cache_is_bounded():
+    routes = [Route("/limited", endpoint=endpoint, name="limited")]
+    index = RouteIndex(routes, {"limited"}, max_negative_entries=2)
+
+    for path in ("/a", "/b", "/c"):
+        assert index.resolve(_scope(path), path) is None
+
+    assert index.negative_cache_size == 2
+
+
+def test_route_index_is_invalidated_by_configuration_changes():
+    app = Starlette(routes=[Route("/download", endpoint=endpoint, name="download")])
+    limiter = ResponseBandwidthLimiter()
+    limiter.init_app(app, install_signal_handlers=False)
+    request = Request(scope={**_scope("/download"), "app": app})
+
+    assert limiter.resolve_handler_identifier(request) is None
+
+    limiter.update_route("download", 100)
+    assert limiter.resolve_handler_identifier(request) == "download"
+
+    limiter.remove_route("download")
+    assert limiter.resolve_handler_identifier(request) is None
+
+    limiter.update_policy("download", [Rule(count=1, per="second", action=Reject())])
+    assert limiter.resolve_handler_identifier(request) == "download"
+
+    limiter.remove_policy("download")
+    assert limiter.resolve_handler_identifier(request) is None
+
+
+def test_route_index_is_invalidated_by_route_table_changes():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("late_route", 100)
+    limiter.init_app(app, install_signal_handlers=False)
+    request = Request(scope={**_scope("/late"), "app": app})
+
+    assert limiter.resolve_handler_identifier(request) is None
+    first_index = limiter.get_route_index(app)
+
+    @app.get("/late")
+    async def late_route():
+        return {"ok": True}
+
+    assert limiter.resolve_handler_identifier(request) == "late_route"
+    assert limiter.get_route_index(app) is not first_index
+
+
+def test_route_index_is_reused_while_configuration_is_unchanged():
+    app = Starlette(routes=[Route("/download", endpoint=endpoint, name="download")])
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("download", 100)
+    limiter.init_app(app, install_signal_handlers=False)
+
+    assert limiter.get_route_index(app) is limiter.get_route_index(app)
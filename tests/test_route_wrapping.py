@@ -0,0 +1,150 @@
+import asyncio
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
+
+from response_bandwidth_limiter import (
+    IPControlMiddleware,
+    Reject,
+    ResponseBandwidthLimiter,
+    RouteLimiterApp,
+    Rule,
+    ShutdownMode,
+)
+
+
+def build_app(limiter: ResponseBandwidthLimiter) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/download")
+    @limiter.limit(10)
+    async def download():
+        return PlainTextResponse("a" * 20)
+
+    @app.get("/health")
+    async def health():
+        return PlainTextResponse("ok")
+
+    return app
+
+
+def find_route(app, path: str):
+    return next(route for route in app.routes if getattr(route, "path", None) == path)
+
+
+def test_route_mode_wraps_only_configured_routes(recorded_limit_calls):
+    limiter = ResponseBandwidthLimiter()
+    app = build_app(limiter)
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="route")
+
+    client = TestClient(app)
+    assert client.get("/download").status_code == 200
+    assert client.get("/health").status_code == 200
+
+    assert [call["rate"] for call in recorded_limit_calls] == [10]
+    assert isinstance(find_route(app, "/download").app, RouteLimiterApp)
+    assert not isinstance(find_route(app, "/health").app, RouteLimiterApp)
+    assert app.user_middleware == []
+
+
+def test_route_mode_applies_request_count_policies():
+    limiter = ResponseBandwidthLimiter()
+    app = FastAPI()
+
+    @app.get("/items")
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject(detail="items limited"))])
+    async def items():
+        return PlainTextResponse("ok")
+
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="route")
+    client = TestClient(app)
+
+    assert client.get("/items").status_code == 200
+    rejected = client.get("/items")
+    assert rejected.status_code == 429
+    assert rejected.json()["detail"] == "items limited"
+
+
+def test_route_mode_follows_runtime_updates(recorded_limit_calls):
+    limiter = ResponseBandwidthLimiter()
+    app = build_app(limiter)
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="route")
+    client = TestClient(app)
+
+    limiter.update_route("health", 5)
+    client.get("/health")
+    limiter.remove_route("download")
+    client.get("/download")
+
+    assert [call["rate"] for call in recorded_limit_calls] == [5]
+    assert isinstance(find_route(app, "/health").app, RouteLimiterApp)
+
+
+def test_route_mode_wraps_routes_added_before_startup(recorded_limit_calls):
+    limiter = ResponseBandwidthLimiter()
+    app = FastAPI()
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="route")
+
+    @app.get("/late")
+    @limiter.limit(7)
+    async def late():
+        return PlainTextResponse("a" * 20)
+
+    with TestClient(app) as client:
+        assert client.get("/late").status_code == 200
+
+    assert [call["rate"] for call in recorded_limit_calls] == [7]
+
+
+def test_route_mode_wraps_mounted_routes(recorded_limit_calls):
+    async def asset(request):
+        return PlainTextResponse("a" * 20)
+
+    app = Starlette(routes=[Mount("/static", routes=[Route("/{name}", endpoint=asset, name="asset")])])
+    limiter = ResponseBandwidthLimiter()
+    limiter.update_route("asset", 3)
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="route")
+
+    TestClient(app).get("/static/app.js")
+
+    assert [call["rate"] for call in recorded_limit_calls] == [3]
+
+
+def test_route_mode_rejects_limited_routes_during_shutdown():
+    limiter = ResponseBandwidthLimiter()
+    app = build_app(limiter)
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="route")
+    limiter.begin_shutdown(ShutdownMode.DRAIN)
+    client = TestClient(app)
+
+    assert client.get("/download").status_code == 503
+    assert client.get("/health").status_code == 200
+
+
+def test_ip_control_middleware_blocks_and_allows_ips(recorded_limit_calls):
+    limiter = ResponseBandwidthLimiter(trusted_proxy_headers=True)
+    app = FastAPI()
+
+    @app.get("/items")
+    @limiter.limit(10)
+    @limiter.limit_rules([Rule(count=1, per="minute", action=Reject())])
+    async def items(request: Request):
+        return PlainTextResponse("a" * 20)
+
+    limiter.init_app(app, install_signal_handlers=False, route_resolution="route")
+    app.add_middleware(IPControlMiddleware)
+
+    async def prepare() -> None:
+        await limiter.block_ip("203.0.113.10")
+        await limiter.allow_ip("203.0.113.50")
+
+    asyncio.run(prepare())
+    client = TestClient(app)
+
+    assert client.get("/items", headers={"X-Forwarded-For": "203.0.113.10"}).status_code == 403
+    assert client.get("/items", headers={"X-Forwarded-For": "203.0.113.50"}).status_code == 200
+    assert client.get("/items", headers={"X-Forwarded-For": "203.0.113.50"}).status_code == 200
+    assert [call["rate"] for call in recorded_limit_calls] == [10, 10]
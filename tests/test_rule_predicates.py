@@ -0,0 +1,114 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.responses import PlainTextResponse
+
+from response_bandwidth_limiter import (
+    Reject,
+    ResponseBandwidthLimiter,
+    Rule,
+    has_header,
+    method_in,
+    missing_header,
+    query_flag,
+)
+from response_bandwidth_limiter.policy import PolicyEvaluator
+from tests.conftest import CountingStorage
+
+
+def build_scope(method="GET", headers=(), query_string=b""):
+    return {"type": "http", "method": method, "headers": list(headers), "query_string": query_string}
+
+
+@pytest.mark.asyncio
+async def test_rules_with_false_predicates_skip_storage():
+    storage = CountingStorage(time_provider=lambda: 0.0)
+    evaluator = PolicyEvaluator(storage=storage)
+    plan = evaluator.compile([
+        Rule(count=1, per="minute", action=Reject(), when=method_in("POST")),
+        Rule(count=100, per="minute", action=Reject()),
+    ])
+
+    assert await evaluator.evaluate({"ip": "client"}, "items", plan, build_scope("GET")) is None
+    assert await evaluator.evaluate({"ip": "client"}, "items", plan, build_scope("GET")) is None
+    assert len(storage.record_hit_calls) == 2
+
+    assert await evaluator.evaluate({"ip": "client"}, "items", plan, build_scope("POST")) is None
+    result = await evaluator.evaluate({"ip": "client"}, "items", plan, build_scope("POST"))
+
+    assert result is not None
+    assert result.rule is plan.rules[0]
+    assert len(storage.record_hit_calls) == 6
+
+
+@pytest.mark.asyncio
+async def test_predicate_rules_are_counted_without_a_scope():
+    storage = CountingStorage(time_provider=lambda: 0.0)
+    evaluator = PolicyEvaluator(storage=storage)
+    rule = Rule(count=1, per="minute", action=Reject(), when=method_in("POST"))
+
+    assert await evaluator.evaluate({"ip": "client"}, "items", [rule]) is None
+    result = await evaluator.evaluate({"ip": "client"}, "items", [rule])
+
+    assert result is not None
+    assert result.rule is rule
+    assert len(storage.record_hit_calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_failing_predicates_count_the_request():
+    storage = CountingStorage(time_provider=lambda: 0.0)
+    evaluator = PolicyEvaluator(storage=storage)
+
+    def broken(scope):
+        raise RuntimeError("boom")
+
+    rule = Rule(count=1, per="minute", action=Reject(), when=broken)
+
+    await evaluator.evaluate({"ip": "client"}, "items", [rule], build_scope())
+    assert len(storage.record_hit_calls) == 1
+
+
+def test_predicate_helpers_inspect_the_raw_scope():
+    assert method_in("post", "PUT")(build_scope("PUT"))
+    assert not method_in("POST")(build_scope("GET"))
+    assert has_header("X-Api-Key")(build_scope(headers=[(b"x-api-key", b"alpha")]))
+    assert missing_header("authorization")(build_scope(headers=[(b"x-api-key", b"alpha")]))
+    assert query_flag("download")(build_scope(query_string=b"a=1&download"))
+    assert query_flag("format", "csv")(build_scope(query_string=b"format=csv"))
+    assert not query_flag("format", "csv")(build_scope(query_string=b"format=json"))
+    assert not query_flag("download")(build_scope())
+
+
+def test_rule_rejects_invalid_predicates():
+    async def asynchronous(scope):
+        return True
+
+    with pytest.raises(TypeError):
+        Rule(count=1, per="second", action=Reject(), when="POST")
+    with pytest.raises(TypeError):
+        Rule(count=1, per="second", action=Reject(), when=asynchronous)
+    with pytest.raises(ValueError):
+        method_in()
+
+
+def test_predicate_rules_only_limit_matching_requests():
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter()
+
+    @app.get("/search")
+    @limiter.limit_rules([
+        Rule(count=1, per="minute", action=Reject(detail="sign in for more"), when=missing_header("x-api-key")),
+    ])
+    async def search():
+        return PlainTextResponse("ok")
+
+    limiter.init_app(app)
+    client = TestClient(app)
+
+    assert client.get("/search").status_code == 200
+    rejected = client.get("/search")
+    assert rejected.status_code == 429
+    assert rejected.json()["detail"] == "sign in for more"
+    assert client.get("/search", headers={"X-Api-Key": "alpha"}).status_code == 200
+    assert client.get("/search", headers={"X-Api-Key": "alpha"}).status_code == 200
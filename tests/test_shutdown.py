@@ -1,6 +1,7 @@
 import asyncio
 import signal
 
+import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
 from starlette.responses import PlainTextResponse, StreamingResponse
@@ -302,4 +303,48 @@ def test_lifespan_shutdown_closes_storage_once():
     with TestClient(app) as client:
         assert client.get("/").status_code == 200
 
-    assert storage.close_calls == 1
\ No newline at end of file
+    assert storage.close_calls == 1
+
+@pytest.mark.parametrize("route_resolution", ["middleware", "route"])
+def test_lifespan_startup_warms_up_storage_before_requests(route_resolution):
+    class WarmingStorage(InMemoryStorage):
+        def __init__(self):
+            super().__init__()
+            self.events = []
+
+        async def warm_up(self) -> None:
+            self.events.append("warm_up")
+
+    app = FastAPI()
+    storage = WarmingStorage()
+    limiter = ResponseBandwidthLimiter(storage=storage)
+
+    @app.get("/")
+    @limiter.limit(1024)
+    async def read_root():
+        storage.events.append("request")
+        return PlainTextResponse("ok")
+
+    limiter.init_app(app, install_signal_handlers=False, route_resolution=route_resolution)
+
+    with TestClient(app) as client:
+        assert client.get("/").status_code == 200
+
+    assert storage.events == ["warm_up", "request"]
+
+
+def test_lifespan_startup_survives_warm_up_failures():
+    class FailingStorage(InMemoryStorage):
+        async def warm_up(self) -> None:
+            raise RuntimeError("backend down")
+
+    app = FastAPI()
+    limiter = ResponseBandwidthLimiter(storage=FailingStorage())
+    limiter.init_app(app, install_signal_handlers=False)
+
+    @app.get("/")
+    async def read_root():
+        return PlainTextResponse("ok")
+
+    with TestClient(app) as client:
+        assert client.get("/").status_code == 200
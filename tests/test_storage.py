@@ -4,7 +4,14 @@ import multiprocessing
 import pytest
 
 from response_bandwidth_limiter.models import Reject, Rule
-from response_bandwidth_limiter.storage import InMemoryStorage, ManagerStorage, warn_if_storage_requires_caution
+from response_bandwidth_limiter.policy import PolicyEvaluator
+from response_bandwidth_limiter.storage import (
+    InMemoryStorage,
+    ManagerStorage,
+    Storage,
+    StorageCapacityError,
+    warn_if_storage_requires_caution,
+)
 
 
 @pytest.mark.asyncio
@@ -27,6 +34,45 @@ async def test_in_memory_storage_supports_get_set_incr_delete_and_ttl():
     assert await storage.get("beta") is None
 
 
+@pytest.mark.asyncio
+async def test_in_memory_storage_get_many_returns_values_in_key_order():
+    now = [0.0]
+    storage = InMemoryStorage(time_provider=lambda: now[0])
+
+    await storage.set("alpha", "a", expire=1)
+    await storage.set("beta", "b")
+
+    assert await storage.get_many(["beta", "missing", "alpha"]) == ["b", None, "a"]
+    now[0] = 2.0
+    assert await storage.get_many(["alpha", "beta"]) == [None, "b"]
+    assert await storage.get_many([]) == []
+
+
+@pytest.mark.asyncio
+async def test_in_memory_storage_set_many_applies_one_expiry_to_all_keys():
+    now = [0.0]
+    storage = InMemoryStorage(time_provider=lambda: now[0])
+
+    await storage.set("alpha", "old", expire=1)
+    await storage.set_many({"alpha": "a", "beta": "b"}, expire=5)
+
+    now[0] = 2.0
+    assert await storage.get_many(["alpha", "beta"]) == ["a", "b"]
+    now[0] = 6.0
+    assert await storage.get_many(["alpha", "beta"]) == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_in_memory_storage_sets_bits_in_redis_bitmap_order():
+    storage = InMemoryStorage()
+
+    assert await storage.get_bits("bitmap") is None
+    await storage.set_bits("bitmap", [0, 7])
+    await storage.set_bits("bitmap", [17])
+
+    assert await storage.get_bits("bitmap") == bytes([0x81, 0x00, 0x40])
+
+
 @pytest.mark.asyncio
 async def test_in_memory_storage_record_hit_is_exact_sliding_window():
     now = [0.0]
@@ -54,6 +100,8 @@ async def test_manager_storage_supports_basic_operations():
         assert await storage.incr("count", expire=10) == 1
         await storage.delete("alpha")
         assert await storage.get("alpha") is None
+        await storage.set_many({"beta": "b", "gamma": "c"}, expire=10)
+        assert await storage.get_many(["beta", "gamma"]) == ["b", "c"]
     finally:
         manager.shutdown()
 
@@ -106,6 +154,29 @@ async def test_in_memory_storage_evicts_lru_keys_when_max_keys_reached():
     assert await storage.get("d") == 4
 
 
+@pytest.mark.asyncio
+async def test_in_memory_storage_never_evicts_control_keys():
+    now = [0.0]
+    storage = InMemoryStorage(time_provider=lambda: now[0], max_keys=3)
+
+    await storage.set("ip:block:203.0.113.10", "1")
+    await storage.set("cache", 1)
+    now[0] = 1.0
+    await storage.set("ip:control:active", "1")
+    now[0] = 2.0
+    await storage.set("ip:allow:203.0.113.20", "1")
+
+    assert await storage.get("cache") is None
+    with pytest.raises(StorageCapacityError):
+        await storage.set("other", 2)
+    with pytest.raises(StorageCapacityError):
+        await storage.set_many({"ip:block:203.0.113.11": "1", "ip:block:203.0.113.12": "1"})
+
+    assert await storage.get("ip:block:203.0.113.10") == "1"
+    assert await storage.get("ip:block:203.0.113.11") is None
+    assert await storage.get("ip:control:active") == "1"
+
+
 @pytest.mark.asyncio
 async def test_manager_storage_cleanup_orphaned_counters_removes_stale_keys():
     manager = multiprocessing.Manager()
@@ -194,4 +265,222 @@ async def test_in_memory_storage_evicts_oldest_counters_when_max_reached():
 
     assert len(storage.request_counters) <= 2
     counters = storage.request_counters
-    assert not any(key[1] == "handler-a" for key in counters)
\ No newline at end of file
+    assert not any(key[1] == "handler-a" for key in counters)
+
+@pytest.mark.asyncio
+async def test_in_memory_storage_gcra_admits_bursts_and_reports_exact_retry_after():
+    now = [100.0]
+    storage = InMemoryStorage(time_provider=lambda: now[0])
+
+    results = [await storage.record_gcra("client", "download", 0, 4, 60) for _ in range(5)]
+
+    assert [result.allowed for result in results] == [True, True, True, True, False]
+    assert [result.remaining for result in results[:4]] == [3, 2, 1, 0]
+    assert results[4].retry_after == pytest.approx(15.0)
+
+    now[0] = 114.0
+    assert not (await storage.record_gcra("client", "download", 0, 4, 60)).allowed
+    now[0] = 115.0
+    assert (await storage.record_gcra("client", "download", 0, 4, 60)).allowed
+
+
+@pytest.mark.asyncio
+async def test_in_memory_storage_gcra_keeps_one_value_per_key():
+    now = [0.0]
+    storage = InMemoryStorage(time_provider=lambda: now[0])
+
+    for _ in range(50):
+        await storage.record_gcra("client", "download", 0, 10000, 3600)
+
+    assert list(storage._rate_states) == [("client", "download", 0, "gcra")]
+    assert not storage._values
+    storage.cleanup_handler_counters("download")
+    assert not storage._rate_states
+
+
+@pytest.mark.asyncio
+async def test_in_memory_storage_rate_states_never_evict_control_data():
+    now = [0.0]
+    storage = InMemoryStorage(time_provider=lambda: now[0], max_keys=10, max_counters=100)
+    await storage.set("ip:block:203.0.113.10", "1")
+    await storage.set("ip:control:active", "1")
+
+    for index in range(1200):
+        now[0] += 0.001
+        await storage.record_gcra(f"client-{index}", "download", 0, 10, 60)
+        await storage.record_token_bucket(f"client-{index}", "search", 0, 10, 60, 20)
+
+    assert len(storage._rate_states) <= 100
+    assert ("client-1199", "download", 0, "gcra") in storage._rate_states
+    assert ("client-1199", "search", 0, "token-bucket") in storage._rate_states
+    assert await storage.get_many(["ip:block:203.0.113.10", "ip:control:active"]) == ["1", "1"]
+
+
+@pytest.mark.asyncio
+async def test_manager_storage_records_gcra_and_token_buckets():
+    manager = multiprocessing.Manager()
+    storage = ManagerStorage.from_manager(manager)
+
+    try:
+        assert (await storage.record_gcra("client", "download", 0, 1, 60)).allowed
+        rejected = await storage.record_gcra("client", "download", 0, 1, 60)
+        assert not rejected.allowed
+        assert 0 < rejected.retry_after <= 60
+        assert (await storage.record_token_bucket("client", "search", 0, 1, 60, 2)).remaining == 1
+        assert (await storage.record_token_bucket("client", "search", 0, 1, 60, 2)).remaining == 0
+        assert not (await storage.record_token_bucket("client", "search", 0, 1, 60, 2)).allowed
+    finally:
+        manager.shutdown()
+
+
+def test_rule_rejects_unknown_algorithms():
+    assert Rule(count=1, per="second", action=Reject(), algorithm="gcra").algorithm == "gcra"
+    with pytest.raises(ValueError):
+        Rule(count=1, per="second", action=Reject(), algorithm="leaky-bucket")
+
+
+@pytest.mark.asyncio
+async def test_in_memory_storage_token_bucket_allows_bursts_then_refills_at_rate():
+    now = [0.0]
+    storage = InMemoryStorage(time_provider=lambda: now[0])
+
+    results = [await storage.record_token_bucket("client", "search", 0, 1, 1, 20) for _ in range(21)]
+
+    assert all(result.allowed for result in results[:20])
+    assert results[19].remaining == 0
+    assert not results[20].allowed
+    assert results[20].retry_after == pytest.approx(1.0)
+
+    now[0] = 2.5
+    assert [(await storage.record_token_bucket("client", "search", 0, 1, 1, 20)).allowed for _ in range(3)] == [True, True, False]
+    assert list(storage._rate_states) == [("client", "search", 0, "token-bucket")]
+    assert not storage._values
+
+
+@pytest.mark.asyncio
+async def test_base_storage_token_bucket_round_trips_state_through_get_and_set():
+    class DictStorage(Storage):
+        def __init__(self):
+            self.values = {}
+
+        async def get(self, key):
+            return self.values.get(key)
+
+        async def set(self, key, value, expire=None):
+            self.values[key] = value
+
+        async def incr(self, key, expire=None):
+            raise NotImplementedError
+
+        async def delete(self, key):
+            self.values.pop(key, None)
+
+        async def record_hit(self, request_key, handler_name, rule_index, window_seconds):
+            raise NotImplementedError
+
+    storage = DictStorage()
+
+    assert (await storage.record_token_bucket("client", "search", 0, 1, 3600, 2)).remaining == 1
+    assert (await storage.record_token_bucket("client", "search", 0, 1, 3600, 2)).remaining == 0
+    rejected = await storage.record_token_bucket("client", "search", 0, 1, 3600, 2)
+    assert not rejected.allowed
+    assert 3500 < rejected.retry_after <= 3600
+
+
+def test_rule_validates_token_bucket_burst():
+    rule = Rule(count=1, per="second", action=Reject(), algorithm="token-bucket", burst=20)
+    assert rule.bucket_size == 20
+    assert Rule(count=5, per="second", action=Reject(), algorithm="token-bucket").bucket_size == 5
+    with pytest.raises(ValueError):
+        Rule(count=1, per="second", action=Reject(), burst=20)
+    with pytest.raises(ValueError):
+        Rule(count=1, per="second", action=Reject(), algorithm="token-bucket", burst=0)
+    with pytest.raises(TypeError):
+        Rule(count=1, per="second", action=Reject(), algorithm="token-bucket", burst=2.5)
+
+
+class CountingDictStorage(Storage):
+    def __init__(self):
+        self.values = {}
+        self.operations = []
+
+    async def get(self, key):
+        self.operations.append("get")
+        return self.values.get(key)
+
+    async def get_many(self, keys):
+        self.operations.append("get_many")
+        return [self.values.get(key) for key in keys]
+
+    async def set(self, key, value, expire=None):
+        self.values[key] = value
+
+    async def incr(self, key, expire=None):
+        self.operations.append("incr")
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+
+@pytest.mark.asyncio
+async def test_base_storage_record_hit_weights_the_previous_bucket(monkeypatch):
+    now = [99.0]
+    monkeypatch.setattr("response_bandwidth_limiter.storage.time.time", lambda: now[0])
+    storage = CountingDictStorage()
+
+    assert [(await storage.record_hit("client", "download", 0, 10)).hit_count for _ in range(5)] == [1, 2, 3, 4, 5]
+
+    # A plain fixed window would start from zero again at 100.
+    now[0] = 101.0
+    first = await storage.record_hit("client", "download", 0, 10)
+    second = await storage.record_hit("client", "download", 0, 10)
+    assert (first.hit_count, second.hit_count) == (5, 6)
+    assert second.oldest_timestamp == pytest.approx(92.0)
+
+    now[0] = 110.5
+    assert (await storage.record_hit("client", "download", 0, 10)).hit_count == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("earlier_hits", "rejected_at", "expected_retry_after"),
+    [
+        # Only the current bucket is over the limit: it has to decay in the next bucket.
+        (5, 1.0, 70),
+        # The previous bucket still carries more than the room left in the current one.
+        (9, 61.0, 33),
+    ],
+)
+async def test_weighted_window_retry_after_is_when_a_hit_fits_again(
+    monkeypatch, earlier_hits, rejected_at, expected_retry_after
+):
+    now = [1.0]
+    monkeypatch.setattr("response_bandwidth_limiter.storage.time.time", lambda: now[0])
+    evaluator = PolicyEvaluator(storage=CountingDictStorage())
+    rules = [Rule(count=5, per="minute", action=Reject())]
+
+    for _ in range(earlier_hits):
+        await evaluator.evaluate({"ip": "client"}, "download", rules)
+    now[0] = rejected_at
+    result = await evaluator.evaluate({"ip": "client"}, "download", rules)
+
+    assert result is not None
+    assert result.retry_after == expected_retry_after
+    now[0] = rejected_at + result.retry_after
+    assert await evaluator.evaluate({"ip": "client"}, "download", rules) is None
+
+
+@pytest.mark.asyncio
+async def test_base_storage_record_hits_reads_previous_buckets_in_one_call(monkeypatch):
+    monkeypatch.setattr("response_bandwidth_limiter.storage.time.time", lambda: 100.0)
+    storage = CountingDictStorage()
+
+    results = await storage.record_hits([("client", "download", index, 60) for index in range(3)])
+
+    assert [result.hit_count for result in results] == [1, 1, 1]
+    assert storage.operations == ["incr", "incr", "incr", "get_many"]
+    storage.operations.clear()
+    await storage.record_hit("client", "download", 0, 60)
+    assert storage.operations == ["incr", "get"]